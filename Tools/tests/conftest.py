@@ -3,12 +3,44 @@ import os
 import pytest
 import boto3
 from moto import mock_dynamodb2, mock_ssm
+from tools import config, enrichment
+from tests.local_dynamodb import LocalDynamoDB
 
 LISTS_TABLE = 'lists-unit'
 NOTFOUND_TABLE = 'notfound-unit'
 PRODUCTS_TABLE = 'products-unit'
 
 
+@pytest.fixture(autouse=True)
+def reset_config():
+    # Configuration is read once per container, so each test starts from its own environment variables.
+    config.reset()
+    yield
+    config.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_enrichment():
+    # Names and titles are cached for the life of the container, so each test starts with an empty cache.
+    enrichment.reset()
+    yield
+    enrichment.reset()
+
+
+class LambdaContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture
+def lambda_context():
+    # Builds a lambda context with a fixed amount of time remaining, for handlers that budget their work.
+    return LambdaContext
+
+
 @pytest.fixture
 def ssm_mock():
     with mock_ssm():
@@ -79,8 +111,17 @@ def dynamodb_mock():
         table = dynamodb.create_table(
             TableName=NOTFOUND_TABLE,
             KeySchema=[{'AttributeName': 'productId', 'KeyType': 'HASH'}],
-            AttributeDefinitions=[{'AttributeName': 'productId', 'AttributeType': 'S'}],
-            ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            AttributeDefinitions=[
+                {'AttributeName': 'productId', 'AttributeType': 'S'},
+                {'AttributeName': 'canonicalUrl', 'AttributeType': 'S'}
+            ],
+            ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'canonicalUrl-index',
+                'KeySchema': [{'AttributeName': 'canonicalUrl', 'KeyType': 'HASH'}, {'AttributeName': 'productId', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            }]
         )
 
         items = load_test_data(NOTFOUND_TABLE + 'test.json')
@@ -129,8 +170,17 @@ def notfound_mock():
         table = dynamodb.create_table(
             TableName=NOTFOUND_TABLE,
             KeySchema=[{'AttributeName': 'productId', 'KeyType': 'HASH'}],
-            AttributeDefinitions=[{'AttributeName': 'productId', 'AttributeType': 'S'}],
-            ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            AttributeDefinitions=[
+                {'AttributeName': 'productId', 'AttributeType': 'S'},
+                {'AttributeName': 'canonicalUrl', 'AttributeType': 'S'}
+            ],
+            ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'canonicalUrl-index',
+                'KeySchema': [{'AttributeName': 'canonicalUrl', 'KeyType': 'HASH'}, {'AttributeName': 'productId', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            }]
         )
 
         items = load_test_data(NOTFOUND_TABLE + 'test.json')
@@ -267,6 +317,27 @@ def products_all_envs_with_bad_data():
         yield
 
 
+@pytest.fixture
+def local_dynamodb():
+    dynamodb = LocalDynamoDB()
+
+    dynamodb.create_table(LISTS_TABLE, ['PK', 'SK'], indexes={
+        'email-index': ['email', 'PK'],
+        'userId-index': ['userId', 'PK'],
+        'SK-index': ['SK', 'PK'],
+        'reservationId-index': ['reservationId', 'PK']
+    })
+    dynamodb.load(LISTS_TABLE, load_test_data(LISTS_TABLE + 'test.json'))
+
+    dynamodb.create_table(NOTFOUND_TABLE, ['productId'], indexes={'canonicalUrl-index': ['canonicalUrl', 'productId']})
+    dynamodb.load(NOTFOUND_TABLE, load_test_data(NOTFOUND_TABLE + 'test.json'))
+
+    dynamodb.create_table(PRODUCTS_TABLE, ['productId'])
+    dynamodb.load(PRODUCTS_TABLE, load_test_data(PRODUCTS_TABLE + 'test.json'))
+
+    return dynamodb
+
+
 def load_test_data(name):
     dirname = os.path.dirname(__file__)
     filename = os.path.join(dirname, '../data/' + name)
@@ -388,6 +459,17 @@ def api_update_users_gifts_event():
     return event
 
 
+@pytest.fixture
+def api_update_users_gifts_bulk_event():
+    event = api_event()
+    event['resource'] = "/tools/notfound"
+    event['path'] = "/tools/notfound"
+    event['httpMethod'] = "POST"
+    event['body'] = json.dumps({"products": []})
+
+    return event
+
+
 @pytest.fixture
 def api_update_users_gifts_event_2():
     event = api_event()
@@ -0,0 +1,418 @@
+# In-process stand-in for the dynamodb client, for exercising the data access code without AWS.  It supports the
+# operations and expressions used by the tools functions, and can add latency to each call to mimic the network.
+import json
+import re
+import threading
+import zlib
+import time
+from boto3.dynamodb import types
+from botocore.exceptions import ClientError
+
+CONDITION_COMPARE = re.compile(r'^(#?\w+)\s*(=|<>)\s*(:\w+)$')
+CONDITION_BEGINS_WITH = re.compile(r'^begins_with\((#?\w+),\s*(:\w+)\)$')
+CONDITION_EXISTS = re.compile(r'^attribute_(not_exists|exists)\((#?\w+)\)$')
+
+
+def error(code, operation, message):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+def sort_value(attribute):
+    return json.dumps(attribute, sort_keys=True)
+
+
+class Table:
+    def __init__(self, name, keys, indexes):
+        self.name = name
+        self.keys = keys
+        self.indexes = indexes
+        self.items = {}
+
+    def key(self, item):
+        return tuple(sort_value(item[name]) for name in self.keys)
+
+    def key_attributes(self, item, keys=None):
+        names = list(self.keys)
+        for name in keys or []:
+            if name not in names:
+                names.append(name)
+
+        return {name: item[name] for name in names}
+
+
+class LocalDynamoDB:
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.tables = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+        # The most calls in flight at once, in all and for each operation, so tests can check that calls overlap
+        # without timing them.  Calls only overlap for long enough to be seen when there is latency.
+        self.running = []
+        self.max_running = 0
+        self.max_running_by_operation = {}
+
+        # The number of following batch requests to leave unprocessed, as dynamodb does when throttled.
+        self.unprocessed_batches = 0
+
+        # Stream records of the writes to each table with a stream enabled, as delivered to a lambda function.
+        self.streams = {}
+        self.sequence = 0
+
+    def create_table(self, name, keys, indexes=None):
+        self.tables[name] = Table(name, keys, indexes or {})
+
+    def enable_stream(self, name):
+        self.streams[name] = []
+
+    def stream_event(self, name):
+        with self.lock:
+            records, self.streams[name] = self.streams[name], []
+
+        return {'Records': records}
+
+    def stream_record(self, table, old, new):
+        # Called with the lock held, after a write.
+        if table.name not in self.streams or (old is None and new is None):
+            return
+
+        self.sequence += 1
+        keys = table.key_attributes(new if new is not None else old)
+        record = {
+            'eventID': str(self.sequence),
+            'eventName': 'INSERT' if old is None else 'REMOVE' if new is None else 'MODIFY',
+            'eventSource': 'aws:dynamodb',
+            'eventSourceARN': 'arn:aws:dynamodb:eu-west-1:123456789012:table/{}/stream/local'.format(table.name),
+            'dynamodb': {'Keys': keys, 'SequenceNumber': str(self.sequence), 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+        }
+
+        if old is not None:
+            record['dynamodb']['OldImage'] = old
+        if new is not None:
+            record['dynamodb']['NewImage'] = new
+
+        self.streams[table.name].append(record)
+
+    def load(self, name, items):
+        serializer = types.TypeSerializer()
+
+        for item in items:
+            serialized = {attribute: serializer.serialize(value) for attribute, value in item.items()}
+            self.tables[name].items[self.tables[name].key(serialized)] = serialized
+
+    def table(self, name, operation):
+        if name not in self.tables:
+            raise error('ResourceNotFoundException', operation, 'Requested resource not found')
+
+        return self.tables[name]
+
+    def record(self, operation):
+        with self.lock:
+            self.calls.append(operation)
+            self.running.append(operation)
+            self.max_running = max(self.max_running, len(self.running))
+            self.max_running_by_operation[operation] = max(self.max_running_by_operation.get(operation, 0), self.running.count(operation))
+
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+        finally:
+            with self.lock:
+                self.running.remove(operation)
+
+    def get_item(self, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self.record('GetItem')
+        table = self.table(TableName, 'GetItem')
+
+        with self.lock:
+            item = table.items.get(table.key(Key))
+
+        if item is None:
+            return {}
+
+        return {'Item': project(item, ProjectionExpression, ExpressionAttributeNames)}
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self.record('BatchGetItem')
+        responses = {}
+        unprocessed = {}
+
+        with self.lock:
+            leave_unprocessed = self.unprocessed_batches > 0
+            if leave_unprocessed:
+                self.unprocessed_batches -= 1
+
+        for name, request in RequestItems.items():
+            table = self.table(name, 'BatchGetItem')
+
+            if len(set(table.key(key) for key in request['Keys'])) < len(request['Keys']):
+                raise error('ValidationException', 'BatchGetItem', 'Provided list of item keys contains duplicates')
+
+            if leave_unprocessed:
+                unprocessed[name] = request
+                continue
+
+            with self.lock:
+                items = [table.items.get(table.key(key)) for key in request['Keys']]
+
+            projection, names = request.get('ProjectionExpression'), request.get('ExpressionAttributeNames')
+            responses[name] = [project(item, projection, names) for item in items if item is not None]
+
+        return {'Responses': responses, 'UnprocessedKeys': unprocessed}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self.record('BatchWriteItem')
+        unprocessed = {}
+
+        with self.lock:
+            leave_unprocessed = self.unprocessed_batches > 0
+            if leave_unprocessed:
+                self.unprocessed_batches -= 1
+
+        for name, requests in RequestItems.items():
+            table = self.table(name, 'BatchWriteItem')
+
+            if len(requests) > 25:
+                raise error('ValidationException', 'BatchWriteItem', 'Too many items requested for the BatchWriteItem call')
+
+            keys = [table.key(request['PutRequest']['Item'] if 'PutRequest' in request else request['DeleteRequest']['Key']) for request in requests]
+            if len(set(keys)) < len(keys):
+                raise error('ValidationException', 'BatchWriteItem', 'Provided list of item keys contains duplicates')
+
+            # Only the first request of a batch is written when throttled, as dynamodb may process part of a batch.
+            if leave_unprocessed:
+                unprocessed[name] = requests[1:]
+                requests = requests[:1]
+
+            with self.lock:
+                for request, key in zip(requests, keys):
+                    existing = table.items.get(key)
+                    if 'PutRequest' in request:
+                        table.items[key] = request['PutRequest']['Item']
+                        self.stream_record(table, existing, request['PutRequest']['Item'])
+                    else:
+                        table.items.pop(key, None)
+                        self.stream_record(table, existing, None)
+
+        return {'UnprocessedItems': {name: requests for name, requests in unprocessed.items() if requests}}
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        self.record('PutItem')
+        table = self.table(TableName, 'PutItem')
+
+        with self.lock:
+            existing = table.items.get(table.key(Item))
+            check_condition('PutItem', existing, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+            table.items[table.key(Item)] = Item
+            self.stream_record(table, existing, Item)
+
+        return {}
+
+    def delete_item(self, TableName, Key, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        self.record('DeleteItem')
+        table = self.table(TableName, 'DeleteItem')
+
+        with self.lock:
+            existing = table.items.get(table.key(Key))
+            check_condition('DeleteItem', existing, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+            table.items.pop(table.key(Key), None)
+            self.stream_record(table, existing, None)
+
+        return {}
+
+    def transact_write_items(self, TransactItems, ClientRequestToken=None, **kwargs):
+        self.record('TransactWriteItems')
+
+        if len(TransactItems) > 100:
+            raise error('ValidationException', 'TransactWriteItems', 'Member must have length less than or equal to 100')
+
+        actions = []
+        for transact_item in TransactItems:
+            (action, request), = transact_item.items()
+            table = self.table(request['TableName'], 'TransactWriteItems')
+            key = table.key(request['Item'] if action == 'Put' else request['Key'])
+            actions.append((action, request, table, key))
+
+        if len(set((table.name, key) for action, request, table, key in actions)) < len(actions):
+            raise error('ValidationException', 'TransactWriteItems', 'Transaction request cannot include multiple operations on one item')
+
+        with self.lock:
+            # Every condition is checked before anything is written, so either all of the actions happen or none do.
+            reasons = []
+            for action, request, table, key in actions:
+                try:
+                    check_condition(action, table.items.get(key), request.get('ConditionExpression'),
+                                    request.get('ExpressionAttributeNames'), request.get('ExpressionAttributeValues'))
+                    reasons.append({'Code': 'None'})
+                except ClientError:
+                    reasons.append({'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'})
+
+            if any(reason['Code'] != 'None' for reason in reasons):
+                exception = error('TransactionCanceledException', 'TransactWriteItems', 'Transaction cancelled, please refer cancellation reasons for specific reasons')
+                exception.response['CancellationReasons'] = reasons
+                raise exception
+
+            for action, request, table, key in actions:
+                existing = table.items.get(key)
+
+                if action == 'Put':
+                    table.items[key] = request['Item']
+                    self.stream_record(table, existing, request['Item'])
+                elif action == 'Delete':
+                    table.items.pop(key, None)
+                    self.stream_record(table, existing, None)
+                elif action == 'Update':
+                    item = dict(existing or request['Key'])
+                    apply_update(item, request['UpdateExpression'], request.get('ExpressionAttributeNames'), request.get('ExpressionAttributeValues') or {})
+                    table.items[key] = item
+                    self.stream_record(table, existing, item)
+
+        return {}
+
+    def describe_table(self, TableName, **kwargs):
+        self.record('DescribeTable')
+        table = self.table(TableName, 'DescribeTable')
+
+        return {'Table': {'TableName': TableName, 'ItemCount': len(table.items)}}
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues=None, **kwargs):
+        self.record('UpdateItem')
+        table = self.table(TableName, 'UpdateItem')
+
+        with self.lock:
+            existing = table.items.get(table.key(Key))
+            check_condition('UpdateItem', existing, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+
+            item = dict(existing or Key)
+            apply_update(item, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues or {})
+            table.items[table.key(Key)] = item
+            self.stream_record(table, existing, item)
+
+        if ReturnValues == 'ALL_NEW':
+            return {'Attributes': item}
+
+        return {}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, IndexName=None, ExpressionAttributeNames=None,
+              FilterExpression=None, ProjectionExpression=None, Select=None, Limit=None, ExclusiveStartKey=None, **kwargs):
+        self.record('Query')
+        table = self.table(TableName, 'Query')
+
+        keys = table.indexes[IndexName] if IndexName else table.keys
+        clauses = parse_conditions(KeyConditionExpression, ExpressionAttributeNames)
+
+        def matches(item):
+            return all(clause(item, ExpressionAttributeValues) for clause in clauses)
+
+        return self.read(table, keys, matches, FilterExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                         ProjectionExpression, Select, Limit, ExclusiveStartKey)
+
+    def scan(self, TableName, IndexName=None, FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+             ProjectionExpression=None, Select=None, Limit=None, ExclusiveStartKey=None, Segment=0, TotalSegments=1, **kwargs):
+        self.record('Scan')
+        table = self.table(TableName, 'Scan')
+        keys = table.indexes[IndexName] if IndexName else table.keys
+
+        # Items are spread across segments by a hash of their partition key.
+        def in_segment(item):
+            return zlib.crc32(sort_value(item[keys[0]]).encode()) % TotalSegments == Segment
+
+        return self.read(table, keys, in_segment, FilterExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                         ProjectionExpression, Select, Limit, ExclusiveStartKey)
+
+    def read(self, table, keys, matches, filter_expression, names, values, projection, select, limit, start_key):
+        def order(item):
+            return tuple(sort_value(item.get(name)) for name in keys) + table.key(item)
+
+        with self.lock:
+            items = sorted([item for item in table.items.values() if all(name in item for name in keys) and matches(item)], key=order)
+
+        if start_key:
+            items = [item for item in items if order(item) > order(start_key)]
+
+        # As in dynamodb, the limit applies to the items read, before the filter.
+        response = {}
+        if limit is not None and len(items) > limit:
+            items = items[:limit]
+            response['LastEvaluatedKey'] = table.key_attributes(items[-1], keys)
+
+        scanned = len(items)
+        if filter_expression:
+            clauses = parse_conditions(filter_expression, names)
+            items = [item for item in items if all(clause(item, values) for clause in clauses)]
+
+        response['Count'] = len(items)
+        response['ScannedCount'] = scanned
+        if select != 'COUNT':
+            response['Items'] = [project(item, projection, names) for item in items]
+
+        return response
+
+
+def attribute_name(name, names):
+    if name.startswith('#'):
+        return names[name]
+
+    return name
+
+
+def parse_conditions(expression, names):
+    clauses = []
+
+    for clause in re.split(r'\s+AND\s+', expression.strip(), flags=re.IGNORECASE):
+        compare = CONDITION_COMPARE.match(clause)
+        begins_with = CONDITION_BEGINS_WITH.match(clause)
+        exists = CONDITION_EXISTS.match(clause)
+
+        if compare:
+            name, equal, placeholder = attribute_name(compare.group(1), names), compare.group(2) == '=', compare.group(3)
+            clauses.append(lambda item, values, name=name, equal=equal, placeholder=placeholder: (item.get(name) == values[placeholder]) == equal)
+        elif begins_with:
+            name, placeholder = attribute_name(begins_with.group(1), names), begins_with.group(2)
+            clauses.append(
+                lambda item, values, name=name, placeholder=placeholder:
+                    name in item and list(item[name].values())[0].startswith(list(values[placeholder].values())[0])
+            )
+        elif exists:
+            name, wanted = attribute_name(exists.group(2), names), exists.group(1) == 'exists'
+            clauses.append(lambda item, values, name=name, wanted=wanted: (name in item) == wanted)
+        else:
+            raise Exception("LocalDynamoDB does not support the expression: {}".format(clause))
+
+    return clauses
+
+
+def apply_update(item, expression, names, values):
+    for action, body in re.findall(r'(SET|ADD|REMOVE)\s+(.*?)(?=\s+(?:SET|ADD|REMOVE)\s+|$)', expression.strip(), flags=re.IGNORECASE):
+        for part in [part.strip() for part in body.split(',')]:
+            action = action.upper()
+
+            if action == 'SET':
+                name, placeholder = [side.strip() for side in part.split('=')]
+                item[attribute_name(name, names)] = values[placeholder]
+            elif action == 'ADD':
+                name, placeholder = part.split()
+                name = attribute_name(name, names)
+                current = int(item[name]['N']) if name in item else 0
+                item[name] = {'N': str(current + int(values[placeholder]['N']))}
+            else:
+                item.pop(attribute_name(part, names), None)
+
+
+def check_condition(operation, existing, expression, names, values):
+    if expression is None:
+        return
+
+    clauses = parse_conditions(expression, names)
+    if not all(clause(existing or {}, values or {}) for clause in clauses):
+        raise error('ConditionalCheckFailedException', operation, 'The conditional request failed')
+
+
+def project(item, expression, names):
+    if expression is None:
+        return item
+
+    attributes = [attribute_name(name.strip(), names) for name in expression.split(',')]
+    return {name: item[name] for name in attributes if name in item}
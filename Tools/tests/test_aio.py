@@ -0,0 +1,73 @@
+import pytest
+import time
+from tools import aio, logger
+
+log = logger.setup_test_logger()
+
+
+class TestGather:
+    def test_results_in_argument_order(self):
+        def slow(value, seconds):
+            time.sleep(seconds)
+            return value
+
+        async def work():
+            return await aio.gather(aio.call(slow, 'first', 0.2), aio.call(slow, 'second', 0), aio.value('third'))
+
+        assert aio.run(work) == ['first', 'second', 'third']
+
+    def test_calls_overlap(self):
+        async def work():
+            return await aio.gather(*[aio.call(time.sleep, 0.2) for i in range(4)])
+
+        start = time.monotonic()
+        aio.run(work)
+        assert time.monotonic() - start < 0.6, "Calls did not run concurrently."
+
+    def test_first_error_in_argument_order(self):
+        def fail(message, seconds):
+            time.sleep(seconds)
+            raise Exception(message)
+
+        async def work():
+            return await aio.gather(aio.call(fail, 'first', 0.2), aio.call(fail, 'second', 0))
+
+        with pytest.raises(Exception) as e:
+            aio.run(work)
+        assert str(e.value) == "first"
+
+
+class TestGatherBounded:
+    def test_limit_is_respected(self):
+        running = []
+        most = []
+
+        async def work(key):
+            running.append(key)
+            most.append(len(running))
+            await aio.call(time.sleep, 0.1)
+            running.remove(key)
+            return key * 2
+
+        async def main():
+            return await aio.gather_bounded(2, work, [1, 2, 3, 4, 5])
+
+        start = time.monotonic()
+        assert aio.run(main) == [2, 4, 6, 8, 10]
+        assert max(most) == 2
+        assert time.monotonic() - start < 0.45, "Work did not run concurrently."
+
+
+class TestClient:
+    def test_operations_are_awaitable(self, local_dynamodb):
+        client = aio.Client(local_dynamodb)
+
+        async def work():
+            return await aio.gather(
+                client.get_item(TableName='notfound-unit', Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}}),
+                client.get_item(TableName='notfound-unit', Key={'productId': {'S': '12345678-notf-0011-1234-abcdefghijkl'}})
+            )
+
+        first, second = aio.run(work)
+        assert first['Item']['productId']['S'] == '12345678-notf-0010-1234-abcdefghijkl'
+        assert second['Item']['productId']['S'] == '12345678-notf-0011-1234-abcdefghijkl'
@@ -1,5 +1,7 @@
+import pytest
 import os
 import json
+import time
 import mock
 from tools import backup, logger
 
@@ -71,6 +73,43 @@ class TestHandler:
         assert body['lists-unittest'], "Backup was not created"
         assert body['products-unittest'], "Backup was not created"
 
+    @mock.patch("tools.backup.create_backup_call", mock.MagicMock(return_value=mock_backup_response))
+    @mock.patch("tools.backup.list_backups_call", mock.MagicMock(return_value=mock_list_response))
+    @mock.patch("tools.backup.delete_backup_call")
+    def test_low_budget_skips_deleting_old_backups(self, mock_delete, monkeypatch, scheduled_event, lambda_context):
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'RETENTION_DAYS', "7")
+
+        response = backup.handler(scheduled_event, lambda_context(1000))
+        body = json.loads(response['body'])
+        assert response['statusCode'] == 200
+        assert body['skipped'] == ['delete old backups (lists-unittest)', 'delete old backups (products-unittest)']
+        assert mock_delete.call_count == 0, "Old backups should not have been deleted."
+
+    @mock.patch("tools.backup.create_backup_call")
+    def test_exhausted_budget_raises(self, mock_create, monkeypatch, scheduled_event, lambda_context):
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'RETENTION_DAYS', "7")
+
+        with pytest.raises(Exception) as e:
+            backup.handler(scheduled_event, lambda_context(100))
+        assert str(e.value) == "Backups were not created for tables: lists-unittest, products-unittest."
+        assert mock_create.call_count == 0
+
+    @mock.patch("tools.backup.create_backup_call")
+    def test_running_backup_is_not_created_again(self, mock_create, monkeypatch, scheduled_event, lambda_context):
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'RETENTION_DAYS', "7")
+        mock_create.side_effect = lambda table, name: time.sleep(0.5) or mock_backup_response
+
+        with pytest.raises(Exception) as e:
+            backup.handler(scheduled_event, lambda_context(600))
+        assert str(e.value) == "Step create backup (lists-unittest) did not complete in time, and may still complete."
+        assert mock_create.call_count == 1
+
 
 @mock.patch("tools.backup.create_backup_call", mock.MagicMock(return_value=mock_backup_response))
 def test_create_backup():
@@ -1,6 +1,11 @@
 import pytest
 import os
 import json
+import threading
+import time
+import mock
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
 from tools import common, logger
 
 log = logger.setup_test_logger()
@@ -220,3 +225,269 @@ class TestCrossAccountRoleRequired:
         assert common.cross_account_role_required('products-staging-unit', 'test')
         assert common.cross_account_role_required('products-prod-unit', 'test')
         assert common.cross_account_role_required('products-prod-unit', 'staging')
+
+
+def credentials(minutes):
+    return {
+        'AccessKeyId': 'ASIAEXAMPLE',
+        'SecretAccessKey': 'secret',
+        'SessionToken': 'token',
+        'Expiration': datetime.now(timezone.utc) + timedelta(minutes=minutes)
+    }
+
+
+@pytest.fixture
+def empty_credentials_cache(monkeypatch):
+    monkeypatch.setattr(common, 'credentials_cache', {})
+
+
+class TestGetRoleCredentials:
+    def test_role_arn(self):
+        role_arn = common.get_role_arn('222222222222', 'test')
+        assert role_arn == "arn:aws:iam::222222222222:role/Tools-Service-Cross-Account-Exection-Role-test", "Role arn was not as expected."
+
+    def test_credentials_are_cached(self, empty_credentials_cache):
+        with mock.patch("tools.common.assume_role", mock.MagicMock(return_value=credentials(60))) as assume_role:
+            first = common.get_role_credentials('222222222222', 'arn:aws:iam::222222222222:role/Test-Role')
+            second = common.get_role_credentials('222222222222', 'arn:aws:iam::222222222222:role/Test-Role')
+
+        assert first is second, "Cached credentials were not returned."
+        assert assume_role.call_count == 1, "Role should only be assumed once."
+
+    def test_cache_is_keyed_by_account_and_role(self, empty_credentials_cache):
+        with mock.patch("tools.common.assume_role", mock.MagicMock(return_value=credentials(60))) as assume_role:
+            common.get_role_credentials('222222222222', 'arn:aws:iam::222222222222:role/Test-Role')
+            common.get_role_credentials('333333333333', 'arn:aws:iam::333333333333:role/Test-Role')
+            common.get_role_credentials('222222222222', 'arn:aws:iam::222222222222:role/Other-Role')
+
+        assert assume_role.call_count == 3, "Role should be assumed for each account and role."
+
+    def test_credentials_refreshed_before_expiry(self, empty_credentials_cache):
+        with mock.patch("tools.common.assume_role", mock.MagicMock(return_value=credentials(2))) as assume_role:
+            common.get_role_credentials('222222222222', 'arn:aws:iam::222222222222:role/Test-Role')
+            common.get_role_credentials('222222222222', 'arn:aws:iam::222222222222:role/Test-Role')
+
+        assert assume_role.call_count == 2, "Credentials close to expiry should be refreshed."
+
+    def test_credentials_expiring(self):
+        assert common.credentials_expiring(credentials(-1))
+        assert common.credentials_expiring(credentials(4))
+        assert not common.credentials_expiring(credentials(6))
+
+
+@pytest.fixture
+def empty_clients(monkeypatch):
+    monkeypatch.setattr(common, 'clients', {})
+
+
+class TestGetClient:
+    def test_client_is_shared(self, empty_clients):
+        client = common.get_client('dynamodb')
+        assert common.get_client('dynamodb') is client, "Client for the same service was not reused."
+
+    def test_clients_keyed_by_service_account_and_region(self, empty_clients):
+        client = common.get_client('dynamodb')
+        assert common.get_client('sns') is not client
+        assert common.get_client('dynamodb', account_id='222222222222', credentials=credentials(60)) is not client
+        assert common.get_client('dynamodb', region='us-east-1') is not client
+        assert len(common.clients) == 4, "Number of clients in registry was not as expected."
+
+    def test_client_rebuilt_when_credentials_refreshed(self, empty_clients):
+        first_credentials = credentials(60)
+        client = common.get_client('dynamodb', account_id='222222222222', credentials=first_credentials)
+        assert common.get_client('dynamodb', account_id='222222222222', credentials=first_credentials) is client
+        assert common.get_client('dynamodb', account_id='222222222222', credentials=credentials(60)) is not client
+
+    def test_client_config(self, empty_clients, monkeypatch):
+        monkeypatch.setitem(os.environ, 'CLIENT_MAX_POOL_CONNECTIONS', '25')
+        monkeypatch.setitem(os.environ, 'CLIENT_READ_TIMEOUT', '1.5')
+
+        config = common.get_client('dynamodb').meta.config
+        assert config.max_pool_connections == 25
+        assert config.connect_timeout == 1
+        assert config.read_timeout == 1.5
+        assert config.tcp_keepalive
+        assert config.retries['mode'] == 'standard'
+
+    def test_dynamodb_retries_left_to_limiter(self, empty_clients):
+        assert common.get_client('dynamodb').meta.config.retries['total_max_attempts'] == 1
+        assert common.get_client('sns').meta.config.retries['total_max_attempts'] == 4
+
+
+class TestGetDynamodbClient:
+    def test_same_account_client(self, empty_clients):
+        client = common.get_dynamodb_client('products-test-unit', {}, 'Cross-Account-Assume-Role', 'test')
+        assert client is common.get_client('dynamodb'), "Shared dynamodb client was not returned."
+
+    def test_cross_account_client_reused(self, empty_clients, empty_credentials_cache, accounts):
+        with mock.patch("tools.common.assume_role", mock.MagicMock(return_value=credentials(60))) as assume_role:
+            client = common.get_dynamodb_client('products-staging-unit', accounts, 'Cross-Account-Assume-Role', 'test')
+            assert common.get_dynamodb_client('products-staging-unit', accounts, 'Cross-Account-Assume-Role', 'test') is client
+
+        assert assume_role.call_count == 1, "Role should only be assumed once."
+        assert client.meta.config.max_pool_connections == 10
+
+
+class TestPaginate:
+    def test_follows_pages(self, local_dynamodb):
+        items = list(common.paginate(local_dynamodb, 'scan', page_size=1, TableName='notfound-unit'))
+        assert len(items) == 3
+        assert local_dynamodb.calls == ['Scan', 'Scan', 'Scan']
+
+    def test_max_items(self, local_dynamodb):
+        items = list(common.paginate(local_dynamodb, 'scan', page_size=2, max_items=3, TableName='lists-unit'))
+        assert len(items) == 3
+        assert local_dynamodb.calls == ['Scan', 'Scan'], "Pages should stop once the cap is reached."
+
+    def test_projection(self, local_dynamodb):
+        items = list(common.paginate(local_dynamodb, 'scan', projection=['productId', 'brand'], TableName='notfound-unit'))
+        assert all(set(item.keys()) == {'productId', 'brand'} for item in items)
+
+    def test_query(self, local_dynamodb):
+        items = list(common.paginate(
+            local_dynamodb,
+            'query',
+            page_size=1,
+            TableName='lists-unit',
+            KeyConditionExpression="PK = :PK",
+            ExpressionAttributeValues={":PK": {'S': "LIST#12345678-list-0001-1234-abcdefghijkl"}}
+        ))
+        assert len(items) > 1
+        assert all(item['PK']['S'] == "LIST#12345678-list-0001-1234-abcdefghijkl" for item in items)
+
+    def test_next_page_is_prefetched(self, local_dynamodb):
+        second_page_requested = threading.Event()
+        scan = local_dynamodb.scan
+
+        def recording_scan(**kwargs):
+            if 'ExclusiveStartKey' in kwargs:
+                second_page_requested.set()
+            return scan(**kwargs)
+
+        local_dynamodb.scan = recording_scan
+        pages = common.pages(local_dynamodb, 'scan', page_size=2, TableName='notfound-unit')
+
+        first = next(pages)
+        assert first['Count'] == 2
+        assert second_page_requested.wait(timeout=1), "The next page was not requested before the first was processed."
+        assert next(pages)['Count'] == 1
+
+    def test_errors_raised_to_caller(self, local_dynamodb):
+        with pytest.raises(ClientError):
+            list(common.paginate(local_dynamodb, 'scan', TableName='missing-unit'))
+
+
+class TestCountItems:
+    def test_single_segment_for_small_table(self, local_dynamodb):
+        assert common.count_segments(local_dynamodb, 'notfound-unit') == 1
+        assert common.count_items(local_dynamodb, 'notfound-unit') == 3
+
+    def test_segments_sized_from_item_count(self, local_dynamodb, monkeypatch):
+        monkeypatch.setitem(os.environ, 'SCAN_SEGMENT_ITEMS', '10')
+        local_dynamodb.load('products-unit', [{'productId': 'extra-' + str(i)} for i in range(50)])
+        total = len(local_dynamodb.tables['products-unit'].items)
+
+        segments = common.count_segments(local_dynamodb, 'products-unit')
+        assert segments == min(8, -(-total // 10))
+        assert common.count_items(local_dynamodb, 'products-unit') == total
+        assert local_dynamodb.calls.count('Scan') == segments
+
+    def test_segments_follow_pages(self, local_dynamodb):
+        local_dynamodb.load('products-unit', [{'productId': 'extra-' + str(i)} for i in range(20)])
+        total = len(local_dynamodb.tables['products-unit'].items)
+
+        assert common.count_items(local_dynamodb, 'products-unit', segments=3, Limit=2) == total
+
+    def test_filter(self, local_dynamodb):
+        count = common.count_items(local_dynamodb, 'notfound-unit', segments=2, FilterExpression="brand <> :brand", ExpressionAttributeValues={':brand': {'S': 'JL'}})
+        assert count == 2
+
+    def test_describe_failure_uses_one_segment(self, local_dynamodb):
+        assert common.count_segments(local_dynamodb, 'missing-unit') == 1
+
+    def test_segment_errors_raised_to_caller(self, local_dynamodb):
+        with pytest.raises(ClientError):
+            list(common.scan_segments(local_dynamodb, 'missing-unit', 3))
+
+
+class TestBatchGetItems:
+    def keys(self, ids):
+        return [{'productId': {'S': id}} for id in ids]
+
+    def test_get_items(self, local_dynamodb):
+        items = common.batch_get_items(local_dynamodb, 'notfound-unit', self.keys(['12345678-notf-0010-1234-abcdefghijkl', '12345678-notf-0011-1234-abcdefghijkl', 'missing']))
+        assert sorted(item['productId']['S'] for item in items) == ['12345678-notf-0010-1234-abcdefghijkl', '12345678-notf-0011-1234-abcdefghijkl']
+
+    def test_batches_of_one_hundred(self, local_dynamodb):
+        local_dynamodb.load('products-unit', [{'productId': 'batch-' + str(i)} for i in range(250)])
+        items = common.batch_get_items(local_dynamodb, 'products-unit', self.keys(['batch-' + str(i) for i in range(250)]))
+        assert len(items) == 250
+        assert local_dynamodb.calls == ['BatchGetItem', 'BatchGetItem', 'BatchGetItem']
+
+    def test_duplicate_keys(self, local_dynamodb):
+        items = common.batch_get_items(local_dynamodb, 'notfound-unit', self.keys(['12345678-notf-0010-1234-abcdefghijkl'] * 2))
+        assert len(items) == 1
+
+    def test_retries_unprocessed_keys(self, local_dynamodb, monkeypatch):
+        monkeypatch.setitem(os.environ, 'LIMITER_BACKOFF_BASE', '0.001')
+        local_dynamodb.unprocessed_batches = 2
+
+        items = common.batch_get_items(local_dynamodb, 'notfound-unit', self.keys(['12345678-notf-0010-1234-abcdefghijkl']))
+        assert len(items) == 1
+        assert local_dynamodb.calls == ['BatchGetItem', 'BatchGetItem', 'BatchGetItem']
+
+    def test_gives_up_on_unprocessed_keys(self, local_dynamodb, monkeypatch):
+        monkeypatch.setitem(os.environ, 'LIMITER_BACKOFF_BASE', '0.001')
+        monkeypatch.setitem(os.environ, 'LIMITER_MAX_ATTEMPTS', '2')
+        local_dynamodb.unprocessed_batches = 5
+
+        with pytest.raises(Exception) as e:
+            common.batch_get_items(local_dynamodb, 'notfound-unit', self.keys(['12345678-notf-0010-1234-abcdefghijkl']))
+        assert str(e.value) == "Keys were still unprocessed after 2 attempts."
+
+
+class TestBatchWriteItems:
+    def items(self, count):
+        return [{'productId': {'S': 'batch-' + str(i)}} for i in range(count)]
+
+    def count(self, local_dynamodb):
+        return len(local_dynamodb.tables['products-unit'].items)
+
+    def test_batches_of_twenty_five(self, local_dynamodb):
+        before = self.count(local_dynamodb)
+        unprocessed = common.batch_write_items(local_dynamodb, 'products-unit', puts=self.items(60))
+
+        assert unprocessed == []
+        assert self.count(local_dynamodb) == before + 60
+        assert local_dynamodb.calls == ['BatchWriteItem'] * 3
+
+    def test_batches_in_parallel(self, local_dynamodb):
+        local_dynamodb.latency = 0.1
+
+        start = time.monotonic()
+        common.batch_write_items(local_dynamodb, 'products-unit', puts=self.items(100))
+        assert time.monotonic() - start < 0.3, "Batches were not written in parallel."
+
+    def test_puts_and_deletes(self, local_dynamodb):
+        common.batch_write_items(local_dynamodb, 'products-unit', puts=self.items(3))
+        before = self.count(local_dynamodb)
+
+        common.batch_write_items(local_dynamodb, 'products-unit', puts=[{'productId': {'S': 'batch-new'}}], deletes=self.items(2))
+        assert self.count(local_dynamodb) == before - 1
+
+    def test_retries_unprocessed_items(self, local_dynamodb, monkeypatch):
+        monkeypatch.setitem(os.environ, 'LIMITER_BACKOFF_BASE', '0.001')
+        local_dynamodb.unprocessed_batches = 2
+        before = self.count(local_dynamodb)
+
+        assert common.batch_write_items(local_dynamodb, 'products-unit', puts=self.items(5)) == []
+        assert self.count(local_dynamodb) == before + 5
+        assert local_dynamodb.calls == ['BatchWriteItem'] * 3
+
+    def test_returns_unprocessed_items(self, local_dynamodb, monkeypatch):
+        monkeypatch.setitem(os.environ, 'LIMITER_BACKOFF_BASE', '0.001')
+        monkeypatch.setitem(os.environ, 'LIMITER_MAX_ATTEMPTS', '2')
+        local_dynamodb.unprocessed_batches = 5
+
+        unprocessed = common.batch_write_items(local_dynamodb, 'products-unit', puts=self.items(5))
+        assert [request['PutRequest']['Item']['productId']['S'] for request in unprocessed] == ['batch-2', 'batch-3', 'batch-4']
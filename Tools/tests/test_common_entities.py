@@ -48,6 +48,27 @@ class TestNotfound:
         }, "Product object not correct."
 
 
+    def test_get_view(self):
+        item = {
+            "productId": {"S": "12345678-notf-0010-1234-abcdefghijkl"},
+            "createdBy": {"S": "12345678-user-0001-1234-abcdefghijkl"},
+            "brand": {"S": "JL"},
+            "details": {"S": "Safari Mobile"},
+            "productUrl": {"S": "https://www.johnlewis.com/john-lewis-partners-safari-mobile/p3439165"},
+            "listId": {"NULL": True},
+            "creatorsName": {"S": "Test User1"},
+            "listTitle": {"S": "Unknown"},
+            "viewUpdatedAt": {"S": "1573739584"}
+        }
+
+        product = Notfound(item).get_product()
+
+        assert product['listId'] is None
+        assert product['creatorsName'] == "Test User1"
+        assert product['listTitle'] == "Unknown"
+        assert 'viewUpdatedAt' not in product
+
+
 class TestProduct:
     def test_get_details(self):
         item = {
@@ -0,0 +1,91 @@
+import pytest
+import os
+from tools import config, logger
+
+log = logger.setup_test_logger()
+
+
+@pytest.fixture
+def products_environ():
+    return {
+        'ENVIRONMENT': 'test',
+        'CROSS_ACCOUNT_ROLE': 'Cross-Account-Assume-Role',
+        'PRODUCTS_TEST_TABLE_NAME': 'products-test-unit',
+        'PRODUCTS_STAGING_TABLE_NAME': 'products-staging-unit',
+        'PRODUCTS_PROD_TABLE_NAME': 'products-prod-unit',
+        'ACCOUNT_ID_TEST': '111111111111',
+        'ACCOUNT_ID_STAGING': '222222222222',
+        'ACCOUNT_ID_PROD': '33333333333',
+        'PRIMARY_ENVIRONMENT': 'test',
+        'UPDATE_ENVIRONMENTS': 'staging,prod',
+        'RETENTION_DAYS': '7'
+    }
+
+
+class TestLoad:
+    def test_products_settings(self, products_environ):
+        settings = config.load(products_environ)
+        assert settings.environment == 'test'
+        assert settings.cross_account_role == 'Cross-Account-Assume-Role'
+        assert settings.primary_environment == 'test'
+        assert settings.update_environments == 'staging,prod'
+        assert settings.retention_days == 7
+        assert settings.product_tables == {
+            'test': 'products-test-unit',
+            'staging': 'products-staging-unit',
+            'prod': 'products-prod-unit'
+        }, "Environment to table map was not as expected."
+        assert settings.table_accounts == {
+            'products-test-unit': '111111111111',
+            'products-staging-unit': '222222222222',
+            'products-prod-unit': '33333333333'
+        }, "Table to account map was not as expected."
+
+    def test_defaults(self):
+        settings = config.load({})
+        assert settings.client_max_pool_connections == 10
+        assert settings.client_connect_timeout == 1
+        assert settings.client_read_timeout == 2
+        assert settings.client_retry_mode == 'standard'
+        assert settings.client_max_attempts == 3
+        assert settings.fanout_max_workers == 3
+        assert settings.fanout_timeout == 2.5
+        assert settings.budget_max_workers == 2
+        assert settings.product_tables == {}
+        assert 'NOTFOUND_TABLE_NAME' in settings.missing
+
+    def test_settings_are_immutable(self, products_environ):
+        settings = config.load(products_environ)
+
+        with pytest.raises(AttributeError):
+            settings.environment = 'prod'
+
+        with pytest.raises(TypeError):
+            settings.product_tables['test'] = 'products-other'
+
+    def test_invalid_number(self):
+        with pytest.raises(Exception) as e:
+            config.load({'CLIENT_MAX_POOL_CONNECTIONS': 'ten'})
+        assert str(e.value) == "CLIENT_MAX_POOL_CONNECTIONS environment variable not set correctly.", "Exception not as expected."
+
+    def test_invalid_update_environments(self, products_environ):
+        products_environ['UPDATE_ENVIRONMENTS'] = 'staging,live'
+
+        with pytest.raises(Exception) as e:
+            config.load(products_environ)
+        assert str(e.value) == "UPDATE_ENVIRONMENTS environment variable not set correctly.", "Exception not as expected."
+
+
+class TestGet:
+    def test_loaded_once(self, monkeypatch):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', 'notfound-unit')
+        settings = config.get('NOTFOUND_TABLE_NAME')
+
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', 'notfound-changed')
+        assert config.get('NOTFOUND_TABLE_NAME') is settings, "Configuration was loaded more than once."
+        assert settings.notfound_table == 'notfound-unit'
+
+    def test_required_variable_missing(self):
+        with pytest.raises(Exception) as e:
+            config.get('LISTS_TABLE_NAME')
+        assert str(e.value) == "LISTS_TABLE_NAME environment variable not set correctly.", "Exception not as expected."
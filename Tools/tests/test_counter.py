@@ -0,0 +1,106 @@
+import pytest
+import os
+import json
+from tools import common, counter, enrichment, notfound_count, notfound_list, logger
+
+log = logger.setup_test_logger()
+
+NOTFOUND_TABLE = 'notfound-unit'
+
+
+@pytest.fixture
+def dynamodb():
+    return common.get_client('dynamodb')
+
+
+class TestGetMode:
+    def test_default(self, api_notfound_count_event):
+        assert counter.get_mode(api_notfound_count_event) is None
+
+    def test_exact_from_query_string(self, api_notfound_count_event):
+        api_notfound_count_event['queryStringParameters'] = {'mode': 'exact'}
+        assert counter.get_mode(api_notfound_count_event) == counter.EXACT
+
+    def test_exact_from_environment(self, monkeypatch, api_notfound_count_event):
+        monkeypatch.setitem(os.environ, 'COUNT_MODE', 'exact')
+        assert counter.get_mode(api_notfound_count_event) == counter.EXACT
+
+    def test_exact_from_scheduled_event(self, scheduled_event):
+        scheduled_event['mode'] = 'exact'
+        assert counter.get_mode(scheduled_event) == counter.EXACT
+
+    def test_unknown_mode(self, api_notfound_count_event):
+        api_notfound_count_event['queryStringParameters'] = {'mode': 'approximate'}
+        with pytest.raises(Exception) as e:
+            counter.get_mode(api_notfound_count_event)
+        assert str(e.value) == "Count mode approximate is not supported."
+
+
+class TestCounter:
+    def test_missing_counter(self, dynamodb, notfound_mock):
+        assert counter.get_count(dynamodb, NOTFOUND_TABLE) is None
+
+    def test_recount_creates_counter(self, dynamodb, notfound_mock):
+        assert counter.recount(dynamodb, NOTFOUND_TABLE) == 3
+        assert counter.get_count(dynamodb, NOTFOUND_TABLE) == 3
+
+    def test_count_excludes_counter_item(self, dynamodb, notfound_mock):
+        counter.recount(dynamodb, NOTFOUND_TABLE)
+        assert counter.count_items(dynamodb, NOTFOUND_TABLE) == 3
+
+    def test_adjust(self, dynamodb, notfound_mock):
+        counter.set_count(dynamodb, NOTFOUND_TABLE, 3)
+        assert counter.adjust(dynamodb, NOTFOUND_TABLE, -1)
+        assert counter.adjust(dynamodb, NOTFOUND_TABLE, 2)
+        assert counter.get_count(dynamodb, NOTFOUND_TABLE) == 4
+
+        item = dynamodb.get_item(TableName=NOTFOUND_TABLE, Key=counter.counter_key())['Item']
+        assert item['addedCount'] == {'N': '2'}, "Only added items should be counted as added."
+
+    def test_recount_keeps_alert_state(self, dynamodb, notfound_mock):
+        counter.set_count(dynamodb, NOTFOUND_TABLE, 5)
+        dynamodb.update_item(TableName=NOTFOUND_TABLE, Key=counter.counter_key(), UpdateExpression="SET alertedCount = :count", ExpressionAttributeValues={':count': {'N': '5'}})
+        counter.recount(dynamodb, NOTFOUND_TABLE)
+
+        item = dynamodb.get_item(TableName=NOTFOUND_TABLE, Key=counter.counter_key())['Item']
+        assert item['alertedCount'] == {'N': '5'}, "A recount should keep the alert state."
+
+    def test_adjust_without_counter(self, dynamodb, notfound_mock):
+        assert not counter.adjust(dynamodb, NOTFOUND_TABLE, -1)
+        assert counter.get_count(dynamodb, NOTFOUND_TABLE) is None, "Counter should only be created by a recount."
+
+    def test_counter_item_without_count(self, dynamodb, notfound_mock):
+        enrichment.invalidate(dynamodb, NOTFOUND_TABLE)
+        assert counter.get_count(dynamodb, NOTFOUND_TABLE) is None
+        assert not counter.adjust(dynamodb, NOTFOUND_TABLE, 1), "Counter should only be created by a recount."
+
+    def test_negative_count_is_recounted(self, dynamodb, notfound_mock):
+        counter.set_count(dynamodb, NOTFOUND_TABLE, -2)
+        assert counter.get_count(dynamodb, NOTFOUND_TABLE) is None
+        assert counter.get_or_recount(dynamodb, NOTFOUND_TABLE) == 3
+
+    def test_get_or_recount_uses_counter(self, dynamodb, notfound_mock):
+        counter.set_count(dynamodb, NOTFOUND_TABLE, 7)
+        assert counter.get_or_recount(dynamodb, NOTFOUND_TABLE) == 7
+        assert counter.get_or_recount(dynamodb, NOTFOUND_TABLE, exact=True) == 3
+        assert counter.get_count(dynamodb, NOTFOUND_TABLE) == 3, "Exact count should repair the counter."
+
+
+class TestHandlers:
+    def test_count_from_counter(self, api_notfound_count_event, monkeypatch, dynamodb, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        counter.set_count(dynamodb, NOTFOUND_TABLE, 10)
+
+        response = notfound_count.handler(api_notfound_count_event, None)
+        assert json.loads(response['body'])['count'] == 10
+
+        api_notfound_count_event['queryStringParameters'] = {'mode': 'exact'}
+        response = notfound_count.handler(api_notfound_count_event, None)
+        assert json.loads(response['body'])['count'] == 3
+
+    def test_list_excludes_counter(self, api_notfound_list_event, monkeypatch, dynamodb, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        counter.recount(dynamodb, NOTFOUND_TABLE)
+        items = json.loads(notfound_list.handler(api_notfound_list_event, None)['body'])['items']
+        assert len(items) == 3
+        assert counter.COUNTER_ID not in [item['productId'] for item in items]
@@ -0,0 +1,93 @@
+import pytest
+import threading
+import time
+from tools import deadline, limiter, logger
+
+log = logger.setup_test_logger()
+
+
+class TestBudget:
+    def test_available_time_excludes_reserve(self, lambda_context):
+        budget = deadline.Budget(lambda_context(2300))
+        assert budget.available_ms() == 2000
+        assert budget.timeout() == 2
+        assert budget.timeout(maximum=0.5) == 0.5
+        assert not budget.low()
+
+    def test_low_and_exhausted(self, lambda_context):
+        assert deadline.Budget(lambda_context(800)).low()
+        assert not deadline.Budget(lambda_context(800)).exhausted()
+        assert deadline.Budget(lambda_context(300)).exhausted()
+
+    def test_default_without_context(self):
+        budget = deadline.Budget(None)
+        assert budget.available_ms() > 29000
+
+    def test_call_returns_result(self, lambda_context):
+        budget = deadline.Budget(lambda_context(3000))
+        assert budget.call('add', lambda a, b: a + b, 1, 2) == 3
+
+    def test_call_raises_work_exception(self, lambda_context):
+        def work():
+            raise Exception("Work failed.")
+
+        with pytest.raises(Exception) as e:
+            deadline.Budget(lambda_context(3000)).call('work', work)
+        assert str(e.value) == "Work failed."
+
+    def test_call_times_out(self, lambda_context):
+        with pytest.raises(deadline.BudgetExceeded) as e:
+            deadline.Budget(lambda_context(500)).call('slow step', time.sleep, 0.5, repeatable=True)
+        assert e.value.step == 'slow step'
+
+    def test_running_step_is_not_continued(self, lambda_context):
+        with pytest.raises(Exception) as e:
+            deadline.Budget(lambda_context(500)).call('slow step', time.sleep, 0.5)
+        assert not isinstance(e.value, deadline.BudgetExceeded)
+        assert str(e.value) == "Step slow step did not complete in time, and may still complete."
+
+    def test_timed_out_step_does_not_delay_next_call(self, lambda_context):
+        release = threading.Event()
+
+        for step in ['first', 'second']:
+            with pytest.raises(deadline.BudgetExceeded):
+                deadline.Budget(lambda_context(400)).call(step, release.wait, 2, repeatable=True)
+
+        # Every worker of the first executor is still busy, so the next call needs its own.
+        try:
+            assert deadline.Budget(lambda_context(3000)).call('next', lambda: True), "Step waited for timed out steps."
+        finally:
+            release.set()
+
+    def test_step_calls_get_the_step_deadline(self, lambda_context):
+        budget = deadline.Budget(lambda_context(1300))
+        left = budget.call('step', limiter.remaining)
+        assert 0 < left <= 1
+        assert limiter.remaining() is None, "Deadline was set outside the step."
+
+    def test_call_not_started_when_exhausted(self, lambda_context):
+        started = []
+        with pytest.raises(deadline.BudgetExceeded):
+            deadline.Budget(lambda_context(100)).call('step', started.append, True)
+        assert started == []
+
+    def test_require_raises_when_low(self, lambda_context):
+        with pytest.raises(deadline.BudgetExceeded):
+            deadline.Budget(lambda_context(800)).require('step')
+
+
+class TestContinuation:
+    def test_token_round_trip(self):
+        state = {'id': '12345678-notf-0010-1234-abcdefghijkl', 'listUpdated': True}
+        assert deadline.decode_token(deadline.encode_token(state)) == state
+
+    def test_invalid_token(self):
+        with pytest.raises(Exception) as e:
+            deadline.decode_token('not-a-token')
+        assert str(e.value) == "Continuation token was not valid."
+
+    def test_from_query_string(self):
+        token = deadline.encode_token({'tables': ['lists-unit']})
+        assert deadline.get_continuation({'queryStringParameters': {'continuation': token}}) == {'tables': ['lists-unit']}
+        assert deadline.get_continuation({'continuation': token}) == {'tables': ['lists-unit']}
+        assert deadline.get_continuation({'queryStringParameters': None}) is None
@@ -0,0 +1,118 @@
+import pytest
+import time
+from tools import enrichment, notfound_get, logger
+
+log = logger.setup_test_logger()
+
+LISTS_TABLE = 'lists-unit'
+NOTFOUND_TABLE = 'notfound-unit'
+USER_ID = '12345678-user-0001-1234-abcdefghijkl'
+LIST_ID = '12345678-list-0001-1234-abcdefghijkl'
+
+
+class TestCache:
+    def test_get_and_put(self):
+        cache = enrichment.Cache(10, 60)
+        assert cache.get('USER#1') == (False, None)
+        cache.put('USER#1', 'Test User1')
+        assert cache.get('USER#1') == (True, 'Test User1')
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1}
+
+    def test_missing_values_are_cached(self):
+        cache = enrichment.Cache(10, 60)
+        cache.put('USER#1', None)
+        assert cache.get('USER#1') == (True, None)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = enrichment.Cache(2, 60)
+        cache.put('USER#1', 'One')
+        cache.put('USER#2', 'Two')
+        cache.get('USER#1')
+        cache.put('USER#3', 'Three')
+
+        assert cache.get('USER#2') == (False, None)
+        assert cache.get('USER#1') == (True, 'One')
+        assert cache.stats()['evictions'] == 1
+
+    def test_entries_expire(self):
+        cache = enrichment.Cache(10, 0.01)
+        cache.put('USER#1', 'One')
+        time.sleep(0.02)
+        assert cache.get('USER#1') == (False, None)
+        assert cache.stats()['size'] == 0
+
+
+class TestLookup:
+    def test_lookup(self, local_dynamodb):
+        names, titles = enrichment.lookup(local_dynamodb, LISTS_TABLE, [USER_ID], [(LIST_ID, USER_ID)])
+        assert names == {USER_ID: 'Test User1'}
+        assert titles == {LIST_ID: 'Child User1 1st Birthday'}
+        assert local_dynamodb.calls == ['BatchGetItem']
+
+    def test_repeat_lookup_is_cached(self, local_dynamodb):
+        enrichment.lookup(local_dynamodb, LISTS_TABLE, [USER_ID], [(LIST_ID, USER_ID)])
+        local_dynamodb.calls.clear()
+
+        names, titles = enrichment.lookup(local_dynamodb, LISTS_TABLE, [USER_ID], [(LIST_ID, USER_ID)])
+        assert names == {USER_ID: 'Test User1'}
+        assert titles == {LIST_ID: 'Child User1 1st Birthday'}
+        assert local_dynamodb.calls == [], "A repeat lookup should not call dynamodb."
+        assert enrichment.get_cache().stats()['hits'] == 2
+
+    def test_only_misses_are_read(self, local_dynamodb):
+        enrichment.lookup(local_dynamodb, LISTS_TABLE, [USER_ID])
+        local_dynamodb.calls.clear()
+
+        names, titles = enrichment.lookup(local_dynamodb, LISTS_TABLE, [USER_ID], [(LIST_ID, USER_ID)])
+        assert titles == {LIST_ID: 'Child User1 1st Birthday'}
+        assert local_dynamodb.calls == ['BatchGetItem']
+
+    def test_missing_items(self, local_dynamodb):
+        names, titles = enrichment.lookup(local_dynamodb, LISTS_TABLE, ['user-9999'], [('list-9999', 'user-9999')])
+        assert names == {'user-9999': None}
+        assert titles == {'list-9999': None}
+
+        local_dynamodb.calls.clear()
+        enrichment.lookup(local_dynamodb, LISTS_TABLE, ['user-9999'])
+        assert local_dynamodb.calls == [], "Missing items should also be cached."
+
+    def test_cache_size_from_config(self, monkeypatch):
+        monkeypatch.setenv('ENRICHMENT_CACHE_SIZE', '5')
+        assert enrichment.get_cache().max_size == 5
+
+    def test_shared_with_notfound_get(self, local_dynamodb, monkeypatch):
+        monkeypatch.setattr(notfound_get, 'dynamodb', local_dynamodb)
+        assert notfound_get.get_user_and_list_title(LISTS_TABLE, USER_ID, LIST_ID) == ('Test User1', 'Child User1 1st Birthday')
+        local_dynamodb.calls.clear()
+
+        assert notfound_get.get_user_and_list_title(LISTS_TABLE, USER_ID, LIST_ID) == ('Test User1', 'Child User1 1st Birthday')
+        assert local_dynamodb.calls == []
+
+
+class TestGeneration:
+    def test_invalidate(self, local_dynamodb):
+        assert enrichment.get_generation(local_dynamodb, NOTFOUND_TABLE) == 0
+        assert enrichment.invalidate(local_dynamodb, NOTFOUND_TABLE)
+        assert enrichment.invalidate(local_dynamodb, NOTFOUND_TABLE)
+        assert enrichment.get_generation(local_dynamodb, NOTFOUND_TABLE) == 2
+
+    def test_new_generation_is_read_from_table(self, local_dynamodb):
+        enrichment.lookup(local_dynamodb, LISTS_TABLE, [USER_ID], generation=0)
+        local_dynamodb.calls.clear()
+
+        enrichment.lookup(local_dynamodb, LISTS_TABLE, [USER_ID], generation=0)
+        assert local_dynamodb.calls == [], "The same generation should be cached."
+
+        enrichment.lookup(local_dynamodb, LISTS_TABLE, [USER_ID], generation=1)
+        assert local_dynamodb.calls == ['BatchGetItem'], "A new generation should not use the cache."
+
+    def test_enrich_reads_generation(self, local_dynamodb):
+        products = [{'productId': '12345678-notf-0010-1234-abcdefghijkl', 'createdBy': USER_ID}]
+        enrichment.enrich(local_dynamodb, LISTS_TABLE, products, NOTFOUND_TABLE)
+        enrichment.invalidate(local_dynamodb, NOTFOUND_TABLE)
+        local_dynamodb.calls.clear()
+
+        products = [{'productId': '12345678-notf-0010-1234-abcdefghijkl', 'createdBy': USER_ID}]
+        enrichment.enrich(local_dynamodb, LISTS_TABLE, products, NOTFOUND_TABLE)
+        assert products[0]['creatorsName'] == 'Test User1'
+        assert sorted(local_dynamodb.calls) == ['BatchGetItem', 'GetItem', 'Query'], "Names should be read again after a rename."
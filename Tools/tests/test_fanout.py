@@ -0,0 +1,69 @@
+import time
+import threading
+from tools import fanout, logger
+
+log = logger.setup_test_logger()
+
+
+class TestRun:
+    def test_all_succeed(self):
+        outcomes = fanout.run(lambda key: key.upper(), ['test', 'staging', 'prod'])
+        assert outcomes == {
+            'test': (fanout.SUCCEEDED, 'TEST'),
+            'staging': (fanout.SUCCEEDED, 'STAGING'),
+            'prod': (fanout.SUCCEEDED, 'PROD')
+        }, "Outcomes were not as expected."
+
+    def test_failure_is_isolated(self):
+        def work(key):
+            if key == 'staging':
+                raise Exception("Staging failed.")
+            return True
+
+        outcomes = fanout.run(work, ['test', 'staging', 'prod'])
+        assert outcomes['test'] == (fanout.SUCCEEDED, True)
+        assert outcomes['prod'] == (fanout.SUCCEEDED, True)
+        assert outcomes['staging'][0] == fanout.FAILED
+        assert str(outcomes['staging'][1]) == "Staging failed."
+
+    def test_slow_work_times_out(self):
+        def work(key):
+            if key == 'prod':
+                time.sleep(0.5)
+            return True
+
+        outcomes = fanout.run(work, ['test', 'prod'], timeout=0.1)
+        assert outcomes == {
+            'test': (fanout.SUCCEEDED, True),
+            'prod': (fanout.TIMED_OUT, None)
+        }, "Outcomes were not as expected."
+
+    def test_timed_out_work_does_not_delay_next_run(self):
+        release = threading.Event()
+
+        def hang(key):
+            release.wait(2)
+            return True
+
+        outcomes = fanout.run(hang, ['test', 'staging', 'prod'], timeout=0.1)
+        assert all(state == fanout.TIMED_OUT for state, value in outcomes.values())
+
+        # Every worker of the first executor is still busy, so the next run needs its own.
+        try:
+            outcomes = fanout.run(lambda key: True, ['test', 'staging', 'prod'], timeout=0.5)
+            assert all(state == fanout.SUCCEEDED for state, value in outcomes.values()), "Work waited for timed out work."
+        finally:
+            release.set()
+
+    def test_work_runs_concurrently(self):
+        barrier = threading.Barrier(3, timeout=1)
+
+        def work(key):
+            barrier.wait()
+            return True
+
+        outcomes = fanout.run(work, ['test', 'staging', 'prod'], timeout=2)
+        assert all(state == fanout.SUCCEEDED for state, value in outcomes.values()), "Work did not run concurrently."
+
+    def test_no_keys(self):
+        assert fanout.run(lambda key: True, []) == {}
@@ -0,0 +1,67 @@
+import os
+import sys
+import mock
+from tools import lazy, common, url_metadata, logger
+
+log = logger.setup_test_logger()
+
+
+class TestModule:
+    def test_import_deferred_until_used(self, monkeypatch):
+        monkeypatch.setattr(lazy, 'import_times', {})
+        monkeypatch.delitem(sys.modules, 'wave', raising=False)
+
+        wave = lazy.Module('wave')
+        assert 'wave' not in sys.modules, "Module was imported before it was used."
+
+        assert wave.WAVE_FORMAT_PCM == 1
+        assert 'wave' in sys.modules
+        assert 'wave' in lazy.import_times, "Import time was not recorded."
+
+    def test_url_metadata_parser_is_lazy(self):
+        assert isinstance(url_metadata.metadata_parser, lazy.Module)
+
+
+class TestProxy:
+    def test_factory_called_once(self):
+        factory = mock.MagicMock(return_value={'a': 1})
+        proxy = lazy.Proxy(factory)
+        assert factory.call_count == 0, "Factory was called before the proxy was used."
+
+        assert proxy.get('a') == 1
+        assert proxy.get('a') == 1
+        assert factory.call_count == 1, "Factory should only be called once."
+
+    def test_lazy_client(self):
+        client = common.lazy_client('dynamodb')
+        assert client.meta.service_model.service_name == 'dynamodb'
+
+
+class TestImportReport:
+    def test_within_budget(self, monkeypatch):
+        monkeypatch.setattr(lazy, 'import_times', {'boto3': 120.0, 'botocore.config': 40.5})
+
+        report = lazy.import_report('tools.products_get')
+        assert report == {
+            'handler': 'tools.products_get',
+            'imports': {'boto3': 120.0, 'botocore.config': 40.5},
+            'total_ms': 160.5,
+            'budget_ms': 500,
+            'over_budget': False
+        }, "Report was not as expected."
+
+    def test_over_budget(self, monkeypatch):
+        monkeypatch.setattr(lazy, 'import_times', {'metadata_parser': 180.0})
+        monkeypatch.setitem(os.environ, 'IMPORT_BUDGET_MS', '100')
+
+        report = lazy.import_report('tools.url_metadata')
+        assert report['over_budget'], "Report should be over budget."
+
+    def test_reported_on_first_invocation_only(self):
+        handler = lazy.report_imports(lambda event, context: {'statusCode': 200})
+
+        with mock.patch("tools.lazy.import_report") as import_report:
+            assert handler({}, None) == {'statusCode': 200}
+            assert handler({}, None) == {'statusCode': 200}
+
+        assert import_report.call_count == 1, "Import report should only be created once."
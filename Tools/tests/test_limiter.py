@@ -0,0 +1,139 @@
+import pytest
+import contextvars
+import os
+import time
+import mock
+from botocore.exceptions import ClientError
+from tools import common, limiter, logger
+
+log = logger.setup_test_logger()
+
+
+def throttling_error():
+    return ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'Rate exceeded'}}, 'GetItem')
+
+
+@pytest.fixture
+def empty_limiters(monkeypatch):
+    monkeypatch.setattr(limiter, 'limiters', {})
+    monkeypatch.setitem(os.environ, 'LIMITER_BACKOFF_BASE', '0.001')
+
+
+class TestAdaptiveLimiter:
+    def test_rate_shrinks_on_throttle(self):
+        table_limiter = limiter.AdaptiveLimiter(100, 1, 1000)
+        table_limiter.throttled()
+        assert table_limiter.rate == 50
+        assert table_limiter.throttles == 1
+
+    def test_rate_bounded_by_minimum(self):
+        table_limiter = limiter.AdaptiveLimiter(2, 1, 1000)
+        table_limiter.throttled()
+        table_limiter.throttled()
+        assert table_limiter.rate == 1
+
+    def test_rate_grows_on_success(self):
+        table_limiter = limiter.AdaptiveLimiter(999.5, 1, 1000)
+        table_limiter.succeeded()
+        assert table_limiter.rate == 1000
+        table_limiter.succeeded()
+        assert table_limiter.rate == 1000
+
+    def test_acquire_waits_for_tokens(self):
+        table_limiter = limiter.AdaptiveLimiter(20, 1, 1000)
+        table_limiter.tokens = 0
+
+        # The clock is held still, so no tokens are added while the test runs.
+        with mock.patch("tools.limiter.time.monotonic", return_value=table_limiter.updated), \
+                mock.patch("tools.limiter.time.sleep", side_effect=lambda seconds: setattr(table_limiter, 'tokens', 1)) as sleep:
+            table_limiter.acquire()
+
+        assert sleep.call_count == 1, "Acquire should wait when there are no tokens."
+
+
+class TestCall:
+    def test_retries_throttled_call(self, empty_limiters):
+        operation = mock.MagicMock(side_effect=[throttling_error(), {'Item': {}}])
+
+        response = limiter.call(['products-unit'], operation, TableName='products-unit')
+        assert response == {'Item': {}}
+        assert operation.call_count == 2
+        assert limiter.get_limiter('products-unit').throttles == 1
+
+    def test_gives_up_after_max_attempts(self, empty_limiters, monkeypatch):
+        monkeypatch.setitem(os.environ, 'LIMITER_MAX_ATTEMPTS', '3')
+        operation = mock.MagicMock(side_effect=throttling_error())
+
+        with pytest.raises(ClientError):
+            limiter.call(['products-unit'], operation, TableName='products-unit')
+        assert operation.call_count == 3
+
+    def test_other_errors_not_retried(self, empty_limiters):
+        error = ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': 'Not found'}}, 'GetItem')
+        operation = mock.MagicMock(side_effect=error)
+
+        with pytest.raises(ClientError):
+            limiter.call(['products-unit'], operation, TableName='products-unit')
+        assert operation.call_count == 1
+
+    def test_not_retried_after_deadline(self, empty_limiters, monkeypatch):
+        monkeypatch.setattr(limiter, 'backoff', lambda attempt: 1)
+        operation = mock.MagicMock(side_effect=throttling_error())
+
+        def call_near_deadline():
+            limiter.call_deadline.set(time.monotonic() + 0.05)
+            limiter.call(['products-unit'], operation, TableName='products-unit')
+
+        with pytest.raises(ClientError):
+            contextvars.copy_context().run(call_near_deadline)
+        assert operation.call_count == 1
+
+
+class TestGetTableNames:
+    def test_table_name(self):
+        assert limiter.get_table_names({'TableName': 'lists-unit'}) == ['lists-unit']
+
+    def test_request_items(self):
+        assert limiter.get_table_names({'RequestItems': {'products-unit': {}, 'lists-unit': {}}}) == ['lists-unit', 'products-unit']
+
+    def test_transact_items(self):
+        items = [{'Put': {'TableName': 'lists-unit'}}, {'Delete': {'TableName': 'notfound-unit'}}, {'Delete': {'TableName': 'lists-unit'}}]
+        assert limiter.get_table_names({'TransactItems': items}) == ['lists-unit', 'notfound-unit']
+
+
+class TestLimitedClient:
+    def test_dynamodb_clients_are_limited(self, monkeypatch):
+        monkeypatch.setattr(common, 'clients', {})
+        assert isinstance(common.get_client('dynamodb'), limiter.LimitedClient)
+        assert not isinstance(common.get_client('sns'), limiter.LimitedClient)
+
+    def test_calls_go_through_limiter(self, empty_limiters, notfound_mock):
+        monkeypatch_client = common.get_client('dynamodb')
+        response = monkeypatch_client.get_item(TableName='notfound-unit', Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}})
+        assert 'Item' in response
+        assert 'notfound-unit' in limiter.limiters, "Call did not go through the table limiter."
+
+    def test_read_timeout_ends_at_deadline(self, empty_limiters):
+        client = mock.MagicMock()
+        timeout_client = mock.MagicMock()
+        create_timeout_client = mock.MagicMock(return_value=timeout_client)
+        limited = limiter.LimitedClient(client, create_timeout_client, 2)
+
+        def call_near_deadline():
+            limiter.call_deadline.set(time.monotonic() + 0.6)
+            limited.get_item(TableName='notfound-unit', Key={})
+            limited.get_item(TableName='notfound-unit', Key={})
+
+        contextvars.copy_context().run(call_near_deadline)
+        create_timeout_client.assert_called_once_with(0.75)
+        assert timeout_client.get_item.call_count == 2
+        assert client.get_item.call_count == 0
+
+    def test_default_read_timeout_without_deadline(self, empty_limiters):
+        client = mock.MagicMock()
+        create_timeout_client = mock.MagicMock()
+        limited = limiter.LimitedClient(client, create_timeout_client, 2)
+
+        limited.get_item(TableName='notfound-unit', Key={})
+        assert client.get_item.call_count == 1
+        assert create_timeout_client.call_count == 0
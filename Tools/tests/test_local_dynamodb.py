@@ -0,0 +1,178 @@
+import pytest
+import threading
+from botocore.exceptions import ClientError
+from tools import logger
+
+log = logger.setup_test_logger()
+
+LISTS_TABLE = 'lists-unit'
+NOTFOUND_TABLE = 'notfound-unit'
+
+
+class TestGetItem:
+    def test_get_item(self, local_dynamodb):
+        response = local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}})
+        assert response['Item']['brand'] == {'S': 'JL'}
+
+    def test_missing_item(self, local_dynamodb):
+        assert local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': 'missing'}}) == {}
+
+    def test_missing_table(self, local_dynamodb):
+        with pytest.raises(ClientError) as e:
+            local_dynamodb.get_item(TableName='notfound-unittes', Key={'productId': {'S': 'missing'}})
+        assert e.value.response['Error']['Code'] == 'ResourceNotFoundException'
+
+    def test_projection(self, local_dynamodb):
+        response = local_dynamodb.get_item(
+            TableName=NOTFOUND_TABLE,
+            Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}},
+            ProjectionExpression='productId, #b',
+            ExpressionAttributeNames={'#b': 'brand'}
+        )
+        assert response['Item'] == {'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}, 'brand': {'S': 'JL'}}
+
+
+class TestWrites:
+    def test_put_condition(self, local_dynamodb):
+        item = {'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}}
+        with pytest.raises(ClientError) as e:
+            local_dynamodb.put_item(TableName=NOTFOUND_TABLE, Item=item, ConditionExpression='attribute_not_exists(productId)')
+        assert e.value.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+    def test_delete_condition(self, local_dynamodb):
+        key = {'productId': {'S': 'missing'}}
+        with pytest.raises(ClientError):
+            local_dynamodb.delete_item(TableName=NOTFOUND_TABLE, Key=key, ConditionExpression="productId = :productId", ExpressionAttributeValues={':productId': key['productId']})
+
+    def test_delete_item(self, local_dynamodb):
+        key = {'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}}
+        local_dynamodb.delete_item(TableName=NOTFOUND_TABLE, Key=key, ConditionExpression="productId = :productId", ExpressionAttributeValues={':productId': key['productId']})
+        assert local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key=key) == {}
+
+
+class TestReads:
+    def test_query_index(self, local_dynamodb):
+        response = local_dynamodb.query(
+            TableName=LISTS_TABLE,
+            IndexName='SK-index',
+            KeyConditionExpression="SK = :SK",
+            ExpressionAttributeValues={":SK": {'S': "PRODUCT#12345678-notf-0010-1234-abcdefghijkl"}}
+        )
+        assert response['Count'] == 1
+        assert response['Items'][0]['PK']['S'] == 'LIST#12345678-list-0001-1234-abcdefghijkl'
+
+    def test_query_begins_with(self, local_dynamodb):
+        response = local_dynamodb.query(
+            TableName=LISTS_TABLE,
+            KeyConditionExpression="PK = :PK AND begins_with(SK, :SK)",
+            ExpressionAttributeValues={":PK": {'S': "LIST#12345678-list-0001-1234-abcdefghijkl"}, ":SK": {'S': "RESERVATION#"}}
+        )
+        assert response['Count'] > 0
+        assert all(item['SK']['S'].startswith('RESERVATION#') for item in response['Items'])
+
+    def test_scan_pages(self, local_dynamodb):
+        first = local_dynamodb.scan(TableName=NOTFOUND_TABLE, Limit=2)
+        assert first['Count'] == 2
+        second = local_dynamodb.scan(TableName=NOTFOUND_TABLE, Limit=2, ExclusiveStartKey=first['LastEvaluatedKey'])
+        assert second['Count'] == 1
+        assert 'LastEvaluatedKey' not in second
+
+    def test_select_count(self, local_dynamodb):
+        assert local_dynamodb.scan(TableName=NOTFOUND_TABLE, Select='COUNT') == {'Count': 3, 'ScannedCount': 3}
+
+
+class TestUpdateItem:
+    def test_set_and_add(self, local_dynamodb):
+        key = {'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}}
+        response = local_dynamodb.update_item(
+            TableName=NOTFOUND_TABLE,
+            Key=key,
+            UpdateExpression="SET brand = :brand ADD views :one",
+            ExpressionAttributeValues={':brand': {'S': 'John Lewis'}, ':one': {'N': '1'}},
+            ReturnValues='ALL_NEW'
+        )
+        assert response['Attributes']['brand'] == {'S': 'John Lewis'}
+        assert response['Attributes']['views'] == {'N': '1'}
+
+    def test_filter_expression(self, local_dynamodb):
+        response = local_dynamodb.scan(
+            TableName=NOTFOUND_TABLE,
+            FilterExpression="brand <> :brand",
+            ExpressionAttributeValues={':brand': {'S': 'JL'}}
+        )
+        assert response['Count'] == 2
+        assert response['ScannedCount'] == 3
+
+
+class TestTransactWriteItems:
+    def test_all_or_nothing(self, local_dynamodb):
+        key = {'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}}
+        actions = [
+            {'Delete': {'TableName': NOTFOUND_TABLE, 'Key': key}},
+            {'Put': {'TableName': NOTFOUND_TABLE, 'Item': {'productId': {'S': '12345678-notf-0011-1234-abcdefghijkl'}}, 'ConditionExpression': 'attribute_not_exists(productId)'}}
+        ]
+
+        with pytest.raises(ClientError) as e:
+            local_dynamodb.transact_write_items(TransactItems=actions)
+        assert e.value.response['Error']['Code'] == 'TransactionCanceledException'
+        assert [reason['Code'] for reason in e.value.response['CancellationReasons']] == ['None', 'ConditionalCheckFailed']
+        assert 'Item' in local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key=key), "No action should be applied."
+
+        del actions[1]['Put']['ConditionExpression']
+        local_dynamodb.transact_write_items(TransactItems=actions)
+        assert local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key=key) == {}
+
+    def test_action_limit(self, local_dynamodb):
+        actions = [{'Put': {'TableName': NOTFOUND_TABLE, 'Item': {'productId': {'S': str(i)}}}} for i in range(101)]
+        with pytest.raises(ClientError) as e:
+            local_dynamodb.transact_write_items(TransactItems=actions)
+        assert e.value.response['Error']['Code'] == 'ValidationException'
+
+
+class TestStreams:
+    def test_stream_records(self, local_dynamodb):
+        local_dynamodb.enable_stream(NOTFOUND_TABLE)
+        key = {'productId': {'S': 'stream-1'}}
+
+        local_dynamodb.put_item(TableName=NOTFOUND_TABLE, Item=dict(key, brand={'S': 'JL'}))
+        local_dynamodb.update_item(TableName=NOTFOUND_TABLE, Key=key, UpdateExpression="SET brand = :brand", ExpressionAttributeValues={':brand': {'S': 'John Lewis'}})
+        local_dynamodb.delete_item(TableName=NOTFOUND_TABLE, Key=key)
+
+        records = local_dynamodb.stream_event(NOTFOUND_TABLE)['Records']
+        assert [record['eventName'] for record in records] == ['INSERT', 'MODIFY', 'REMOVE']
+        assert records[1]['dynamodb']['OldImage']['brand'] == {'S': 'JL'}
+        assert records[1]['dynamodb']['NewImage']['brand'] == {'S': 'John Lewis'}
+        assert records[2]['dynamodb']['Keys'] == key
+        assert 'NewImage' not in records[2]['dynamodb']
+        assert records[0]['eventSourceARN'].split(':table/')[1].startswith(NOTFOUND_TABLE + '/')
+
+        assert local_dynamodb.stream_event(NOTFOUND_TABLE) == {'Records': []}, "Records should only be delivered once."
+
+    def test_no_records_without_stream(self, local_dynamodb):
+        local_dynamodb.delete_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}})
+        assert local_dynamodb.streams == {}
+
+
+class TestRunning:
+    def test_sequential_calls(self, local_dynamodb):
+        for i in range(3):
+            local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}})
+        assert local_dynamodb.max_running == 1
+
+    def test_overlapping_calls(self, local_dynamodb):
+        local_dynamodb.latency = 0.1
+        barrier = threading.Barrier(3, timeout=1)
+
+        def get_item():
+            barrier.wait()
+            local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}})
+
+        threads = [threading.Thread(target=get_item) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert local_dynamodb.max_running == 3
+        assert local_dynamodb.max_running_by_operation == {'GetItem': 3}
+        assert local_dynamodb.running == []
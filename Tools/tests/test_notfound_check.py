@@ -1,9 +1,10 @@
+import pytest
 import os
 import json
 import mock
 import boto3
 from moto import mock_sns
-from tools import notfound_check, logger
+from tools import common, counter, deadline, notfound_check, logger
 
 log = logger.setup_test_logger()
 
@@ -36,15 +37,117 @@ class TestHandler:
         assert body['items'] == 0, "Number of items was not as expected."
         assert not body['alert_sent'], "Alert was not sent."
 
+    def test_no_repeat_alert(self, scheduled_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'TOPIC_ARN', 'arn:aws:sns:eu-west-1:123456789012:NotFound-Item-Check-Alerts')
+
+        assert json.loads(notfound_check.handler(scheduled_event, None)['body'])['alert_sent']
+
+        body = json.loads(notfound_check.handler(scheduled_event, None)['body'])
+        assert body['items'] == 3
+        assert body['new_items'] == 0
+        assert not body['alert_sent'], "The same items should not be alerted again."
+
+    def test_alert_for_new_items_only(self, scheduled_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'TOPIC_ARN', 'arn:aws:sns:eu-west-1:123456789012:NotFound-Item-Check-Alerts')
+        notfound_check.handler(scheduled_event, None)
+
+        # One item is resolved and another created by a service that does not touch the counter.
+        dynamodb = common.get_client('dynamodb')
+        dynamodb.delete_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0011-1234-abcdefghijkl'}})
+        dynamodb.put_item(TableName=NOTFOUND_TABLE, Item={'productId': {'S': 'new-item'}, 'createdBy': {'S': 'user'}, 'brand': {'S': 'Brand'}, 'details': {'S': 'Details'}, 'productUrl': {'S': 'https://example.com'}})
+
+        notfound_check.send_msg.reset_mock()
+        body = json.loads(notfound_check.handler(scheduled_event, None)['body'])
+        assert body['items'] == 3
+        assert body['new_items'] == 1
+        assert body['alert_sent']
+        assert notfound_check.send_msg.call_args[0][2] == [{'productId': 'new-item', 'brand': 'Brand', 'details': 'Details'}]
+
+    def test_resolved_items_do_not_alert(self, scheduled_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'TOPIC_ARN', 'arn:aws:sns:eu-west-1:123456789012:NotFound-Item-Check-Alerts')
+        notfound_check.handler(scheduled_event, None)
+
+        dynamodb = common.get_client('dynamodb')
+        dynamodb.delete_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0011-1234-abcdefghijkl'}})
+        counter.adjust(dynamodb, NOTFOUND_TABLE, -1)
+
+        body = json.loads(notfound_check.handler(scheduled_event, None)['body'])
+        assert body['items'] == 2
+        assert body['new_items'] == 0
+        assert not body['alert_sent']
+
+    def test_table_is_not_read_without_added_items(self, scheduled_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'TOPIC_ARN', 'arn:aws:sns:eu-west-1:123456789012:NotFound-Item-Check-Alerts')
+        notfound_check.handler(scheduled_event, None)
+
+        # An item is added, and counted as added as the stream consumer would.
+        dynamodb = common.get_client('dynamodb')
+        dynamodb.put_item(TableName=NOTFOUND_TABLE, Item={'productId': {'S': 'new-item'}, 'createdBy': {'S': 'user'}, 'brand': {'S': 'Brand'}, 'details': {'S': 'Details'}, 'productUrl': {'S': 'https://example.com'}})
+        counter.adjust(dynamodb, NOTFOUND_TABLE, 1)
+
+        body = json.loads(notfound_check.handler(scheduled_event, None)['body'])
+        assert body['new_items'] == 1
+        assert body['alert_sent']
+
+        monkeypatch.setattr(notfound_check, 'get_new_items', mock.MagicMock())
+        body = json.loads(notfound_check.handler(scheduled_event, None)['body'])
+        assert body['new_items'] == 0
+        assert not body['alert_sent']
+        assert notfound_check.get_new_items.call_count == 0, "Table should not be read when no items were added."
+
+    def test_only_marked_items_are_alerted(self, scheduled_event, monkeypatch, notfound_mock, lambda_context):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'TOPIC_ARN', 'arn:aws:sns:eu-west-1:123456789012:NotFound-Item-Check-Alerts')
+        monkeypatch.setitem(os.environ, 'AIO_MAX_WORKERS', '2')
+        low = iter([False, True])
+        monkeypatch.setattr(deadline.Budget, 'low', lambda self: next(low))
+
+        notfound_check.send_msg.reset_mock()
+        body = json.loads(notfound_check.handler(scheduled_event, lambda_context(5000))['body'])
+        assert body['new_items'] == 3
+        assert body['pending_items'] == 1
+        assert body['alert_sent']
+        assert [item['productId'] for item in notfound_check.send_msg.call_args[0][2]] == ['12345678-notf-0010-1234-abcdefghijkl', '12345678-notf-0011-1234-abcdefghijkl']
+
+        assert [item['productId'] for item in notfound_check.get_new_items(NOTFOUND_TABLE)] == ['12345678-notf-0020-1234-abcdefghijkl']
+
+    def test_items_are_unmarked_when_alert_fails(self, scheduled_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'TOPIC_ARN', 'arn:aws:sns:eu-west-1:123456789012:NotFound-Item-Check-Alerts')
+        monkeypatch.setattr(notfound_check, 'send_msg', mock.MagicMock(side_effect=Exception("Could not send SMS alert: Failed")))
+
+        with pytest.raises(Exception):
+            notfound_check.handler(scheduled_event, None)
+
+        assert len(notfound_check.get_new_items(NOTFOUND_TABLE)) == 3, "Items should be alerted by the next run."
+
+
+class TestDigest:
+    def test_new_items_are_projected(self, notfound_mock):
+        items = notfound_check.get_new_items(NOTFOUND_TABLE)
+        assert len(items) == 3
+        assert items[0] == {'productId': '12345678-notf-0010-1234-abcdefghijkl', 'brand': 'JL', 'details': 'Safari Mobile'}
+
+    def test_alerted_items_are_not_new(self, notfound_mock):
+        marked, pending = notfound_check.mark_alerted(NOTFOUND_TABLE, ['12345678-notf-0010-1234-abcdefghijkl', 'resolved-item'], deadline.Budget(None))
+        assert marked == {'12345678-notf-0010-1234-abcdefghijkl'}
+        assert pending == []
+
+        items = notfound_check.get_new_items(NOTFOUND_TABLE)
+        assert [item['productId'] for item in items] == ['12345678-notf-0011-1234-abcdefghijkl', '12345678-notf-0020-1234-abcdefghijkl']
 
-class TestGetItems:
-    def test_get_items_from_empty_table(self, empty_notfound_mock):
-        item_count = notfound_check.get_item_count(NOTFOUND_TABLE)
-        assert item_count == 0, "Notfound table was not empty"
+    def test_build_digest(self):
+        items = [{'productId': str(i), 'brand': 'Brand', 'details': 'Item ' + str(i)} for i in range(12)]
+        lines = notfound_check.build_digest(14, items).split("\n")
 
-    def test_get_items_from_non_empty_table(self, notfound_mock):
-        item_count = notfound_check.get_item_count(NOTFOUND_TABLE)
-        assert item_count == 3, "Notfound table did not contain 1 item"
+        assert lines[0] == 'There are 14 items in the NotFound table, 12 new:'
+        assert lines[1] == '- Brand Item 0'
+        assert len(lines) == 12
+        assert lines[-1] == 'and 2 more.'
 
 
 @mock_sns
@@ -58,4 +161,4 @@ def test_send_msg():
     )
 
     topic_arn = response['TopicArn']
-    assert notfound_check.send_msg(topic_arn, 3)
+    assert notfound_check.send_msg(topic_arn, 3, [{'productId': '12345678-notf-0010-1234-abcdefghijkl', 'brand': 'JL', 'details': 'Safari Mobile'}])
@@ -27,3 +27,14 @@ class TestHandler:
 
         body = json.loads(response['body'])
         assert body['count'] == 3, "Number of items was not as expected."
+
+    def test_exact_mode_uses_segments(self, api_notfound_count_event, monkeypatch, local_dynamodb):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'SCAN_SEGMENT_ITEMS', '1')
+        monkeypatch.setattr(notfound_count, 'dynamodb', local_dynamodb)
+        api_notfound_count_event['queryStringParameters'] = {'mode': 'exact'}
+
+        response = notfound_count.handler(api_notfound_count_event, None)
+        assert response['statusCode'] == 200
+        assert json.loads(response['body'])['count'] == 3
+        assert local_dynamodb.calls.count('Scan') == 3, "Each of the three segments should have been scanned."
@@ -1,3 +1,4 @@
+import pytest
 import os
 import json
 from tools import notfound_get, logger
@@ -65,3 +66,41 @@ class TestHandler:
             "listTitle": "Child User3 1st Birthday",
             "listId": "12345678-list-0002-1234-abcdefghijkl"
         }, "Product item was not as expected"
+
+    def test_without_view(self, api_notfound_get_event, monkeypatch, local_dynamodb):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        monkeypatch.setattr(notfound_get, 'dynamodb', local_dynamodb)
+        local_dynamodb.latency = 0.2
+
+        response = notfound_get.handler(api_notfound_get_event, None)
+
+        assert response['statusCode'] == 200
+        assert json.loads(response['body'])['listTitle'] == "Child User1 1st Birthday"
+        assert sorted(local_dynamodb.calls) == ['BatchGetItem', 'GetItem', 'GetItem', 'Query']
+        assert local_dynamodb.max_running == 3, "Without a view, the item, list and generation should be read concurrently."
+        assert local_dynamodb.calls[-1] == 'BatchGetItem', "The names should be read once the item and list are read."
+
+
+class TestGetUserAndListTitle:
+    def test_user_and_list(self, dynamodb_mock):
+        name, title = notfound_get.get_user_and_list_title(LISTS_TABLE, '12345678-user-0001-1234-abcdefghijkl', '12345678-list-0001-1234-abcdefghijkl')
+        assert name == "Test User1"
+        assert title == "Child User1 1st Birthday"
+
+    def test_no_list(self, dynamodb_mock):
+        name, title = notfound_get.get_user_and_list_title(LISTS_TABLE, '12345678-user-0001-1234-abcdefghijkl', None)
+        assert name == "Test User1"
+        assert title == 'Unknown'
+
+    def test_missing_items(self, dynamodb_mock):
+        name, title = notfound_get.get_user_and_list_title(LISTS_TABLE, '12345678-user-9999-1234-abcdefghijkl', '12345678-list-9999-1234-abcdefghijkl')
+        assert name is None
+        assert title is None
+
+    def test_bad_table(self, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(notfound_get, 'dynamodb', local_dynamodb)
+
+        with pytest.raises(Exception) as e:
+            notfound_get.get_user_and_list_title('lists-unittes', '12345678-user-0001-1234-abcdefghijkl', None)
+        assert str(e.value) == "Unexpected problem getting user and list from lists table."
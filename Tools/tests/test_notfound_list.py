@@ -1,13 +1,63 @@
 import os
 import json
-from tools import notfound_list, logger
+import boto3
+from tools import common, notfound_list, logger
 
 log = logger.setup_test_logger()
 
+LISTS_TABLE = 'lists-unit'
 NOTFOUND_TABLE = 'notfound-unit'
 
 
 class TestHandler:
+    def test_pages_with_cursor(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+
+        product_ids = []
+        api_notfound_list_event['queryStringParameters'] = {'limit': '2'}
+
+        for page in range(3):
+            response = notfound_list.handler(api_notfound_list_event, None)
+            assert response['statusCode'] == 200
+
+            body = json.loads(response['body'])
+            assert len(body['items']) <= 2
+            product_ids += [item['productId'] for item in body['items']]
+
+            if body['nextCursor'] is None:
+                break
+
+            api_notfound_list_event['queryStringParameters'] = {'limit': '2', 'cursor': body['nextCursor']}
+
+        assert product_ids == [
+            "12345678-notf-0010-1234-abcdefghijkl",
+            "12345678-notf-0011-1234-abcdefghijkl",
+            "12345678-notf-0020-1234-abcdefghijkl"
+        ], "Pages did not return every item once."
+
+    def test_all_items_within_default_limit(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+
+        body = json.loads(notfound_list.handler(api_notfound_list_event, None)['body'])
+        assert len(body['items']) == 3
+        assert body['nextCursor'] is None
+
+    def test_invalid_limit(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'limit': '0'}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert response['statusCode'] == 500
+        assert json.loads(response['body'])['error'] == "Limit must be a number between 1 and 1000."
+
+    def test_invalid_cursor(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'cursor': 'not-a-cursor'}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert response['statusCode'] == 500
+        assert json.loads(response['body'])['error'] == "Cursor was not valid."
+
     def test_notfound_empty(self, api_notfound_list_event, monkeypatch, empty_notfound_mock):
         monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
 
@@ -52,3 +102,186 @@ class TestHandler:
             "imageUrl": "https://johnlewis.scene7.com/is/image/JohnLewis/002955092?$rsp-pdp-port-640$",
             "price": "9.00",
         }, "Product item was not as expected"
+
+
+class TestEnrich:
+    def test_enriched_page(self, api_notfound_list_event, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(notfound_list, 'dynamodb', local_dynamodb)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'enrich': 'true'}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert response['statusCode'] == 200
+
+        items = {item['productId']: item for item in json.loads(response['body'])['items']}
+        assert items['12345678-notf-0010-1234-abcdefghijkl']['creatorsName'] == 'Test User1'
+        assert items['12345678-notf-0010-1234-abcdefghijkl']['listId'] == '12345678-list-0001-1234-abcdefghijkl'
+        assert items['12345678-notf-0010-1234-abcdefghijkl']['listTitle'] == 'Child User1 1st Birthday'
+        assert items['12345678-notf-0011-1234-abcdefghijkl']['listId'] is None
+        assert items['12345678-notf-0011-1234-abcdefghijkl']['listTitle'] == 'Unknown'
+        assert items['12345678-notf-0020-1234-abcdefghijkl']['creatorsName'] == 'Test User3'
+        assert items['12345678-notf-0020-1234-abcdefghijkl']['listTitle'] == 'Child User3 1st Birthday'
+
+        # One scan, a query for each product and a read of the cache generation, then one batched read for the distinct
+        # users and lists.
+        assert sorted(local_dynamodb.calls) == ['BatchGetItem', 'GetItem', 'Query', 'Query', 'Query', 'Scan']
+
+    def test_queries_run_in_parallel(self, monkeypatch, local_dynamodb):
+        local_dynamodb.latency = 0.05
+        items = [{'productId': '12345678-notf-00{}-1234-abcdefghijkl'.format(i), 'createdBy': '12345678-user-0001-1234-abcdefghijkl'} for i in range(10, 20)]
+
+        notfound_list.enrichment.enrich(local_dynamodb, LISTS_TABLE, items)
+
+        assert local_dynamodb.calls.count('Query') == 10
+        assert local_dynamodb.max_running_by_operation['Query'] > 1, "List queries were not made in parallel."
+
+    def test_items_with_view_are_not_looked_up(self, local_dynamodb):
+        item = {'productId': '12345678-notf-0010-1234-abcdefghijkl', 'createdBy': '12345678-user-0001-1234-abcdefghijkl',
+                'listId': None, 'creatorsName': 'From View', 'listTitle': 'Unknown'}
+
+        assert notfound_list.enrichment.enrich(local_dynamodb, LISTS_TABLE, [item]) == [item]
+        assert item['creatorsName'] == 'From View'
+        assert local_dynamodb.calls == []
+
+    def test_not_enriched_by_default(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+
+        body = json.loads(notfound_list.handler(api_notfound_list_event, None)['body'])
+        assert 'creatorsName' not in body['items'][0]
+
+    def test_invalid_enrich(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'enrich': 'yes'}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert json.loads(response['body'])['error'] == "Enrich must be true or false."
+
+
+class TestClusters:
+    def add_canonical_urls(self, urls_by_id):
+        dynamodb = boto3.client('dynamodb', region_name='eu-west-1')
+        for product_id, url in urls_by_id.items():
+            dynamodb.update_item(
+                TableName=NOTFOUND_TABLE,
+                Key={'productId': {'S': product_id}},
+                UpdateExpression='SET canonicalUrl = :url',
+                ExpressionAttributeValues={':url': {'S': url}}
+            )
+
+    def test_clusters(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        self.add_canonical_urls({
+            '12345678-notf-0010-1234-abcdefghijkl': 'johnlewis.com/p1',
+            '12345678-notf-0011-1234-abcdefghijkl': 'johnlewis.com/p2',
+            '12345678-notf-0020-1234-abcdefghijkl': 'johnlewis.com/p1'
+        })
+        api_notfound_list_event['queryStringParameters'] = {'mode': 'clusters'}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert response['statusCode'] == 200
+
+        clusters = json.loads(response['body'])['clusters']
+        assert [cluster['canonicalUrl'] for cluster in clusters] == ['johnlewis.com/p1', 'johnlewis.com/p2'], "Largest cluster should be first."
+        assert sorted(clusters[0]['productIds']) == ['12345678-notf-0010-1234-abcdefghijkl', '12345678-notf-0020-1234-abcdefghijkl']
+        assert clusters[0]['items'][0]['canonicalUrl'] == 'johnlewis.com/p1'
+
+    def test_cluster_for_url(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        self.add_canonical_urls({
+            '12345678-notf-0010-1234-abcdefghijkl': 'johnlewis.com/p1',
+            '12345678-notf-0020-1234-abcdefghijkl': 'johnlewis.com/p1'
+        })
+        api_notfound_list_event['queryStringParameters'] = {'mode': 'clusters', 'url': 'https://www.johnlewis.com/p1?utm_source=email'}
+
+        clusters = json.loads(notfound_list.handler(api_notfound_list_event, None)['body'])['clusters']
+        assert len(clusters) == 1
+        assert len(clusters[0]['productIds']) == 2
+
+    def test_items_without_canonical_url(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'mode': 'clusters'}
+
+        assert json.loads(notfound_list.handler(api_notfound_list_event, None)['body'])['clusters'] == []
+
+
+class TestExport:
+    def test_export(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'mode': 'export'}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert response['statusCode'] == 200
+        assert response['headers']['Content-Type'] == 'application/x-ndjson'
+
+        lines = response['body'].splitlines()
+        assert len(lines) == 3
+        assert json.loads(lines[0])['brand'] == 'JL'
+        assert 'X-Next-Cursor' not in response['headers']
+
+    def test_parallel_segments(self, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(notfound_list, 'dynamodb', local_dynamodb)
+        local_dynamodb.load(NOTFOUND_TABLE, [
+            {'productId': 'export-' + str(i), 'createdBy': 'user', 'brand': 'Brand', 'details': 'Details', 'productUrl': 'https://example.com/' + str(i)}
+            for i in range(37)
+        ])
+        local_dynamodb.latency = 0.05
+
+        body, cursor = notfound_list.export_items(NOTFOUND_TABLE, segments=4)
+
+        product_ids = [json.loads(line)['productId'] for line in body.splitlines()]
+        assert len(product_ids) == 40
+        assert len(set(product_ids)) == 40, "Segments should not overlap."
+        assert cursor is None
+        assert local_dynamodb.calls.count('Scan') == 4
+        assert local_dynamodb.max_running_by_operation['Scan'] == 4, "Segments were not scanned in parallel."
+
+    def test_pages_with_cursor(self, api_notfound_list_event, monkeypatch, local_dynamodb):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'EXPORT_PAGE_ITEMS', '8')
+        monkeypatch.setattr(notfound_list, 'dynamodb', local_dynamodb)
+        local_dynamodb.load(NOTFOUND_TABLE, [
+            {'productId': 'export-' + str(i), 'createdBy': 'user', 'brand': 'Brand', 'details': 'Details', 'productUrl': 'https://example.com/' + str(i)}
+            for i in range(37)
+        ])
+
+        product_ids = []
+        api_notfound_list_event['queryStringParameters'] = {'mode': 'export', 'segments': '4'}
+        for page in range(20):
+            response = notfound_list.handler(api_notfound_list_event, None)
+            assert response['statusCode'] == 200
+
+            lines = response['body'].splitlines()
+            assert len(lines) <= 8, "Each response should be limited to a page of items."
+            product_ids += [json.loads(line)['productId'] for line in lines]
+
+            if 'X-Next-Cursor' not in response['headers']:
+                break
+
+            api_notfound_list_event['queryStringParameters'] = {'mode': 'export', 'cursor': response['headers']['X-Next-Cursor']}
+
+        assert len(product_ids) == 40
+        assert len(set(product_ids)) == 40, "Pages did not return every item once."
+
+    def test_invalid_cursor(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'mode': 'export', 'cursor': common.encode_token({'segments': 2})}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert response['statusCode'] == 500
+        assert json.loads(response['body'])['error'] == "Cursor was not valid."
+
+    def test_invalid_segments(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'mode': 'export', 'segments': '100'}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert response['statusCode'] == 500
+        assert json.loads(response['body'])['error'] == "Segments must be a number between 1 and 8."
+
+    def test_unknown_mode(self, api_notfound_list_event, monkeypatch, notfound_mock):
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        api_notfound_list_event['queryStringParameters'] = {'mode': 'everything'}
+
+        response = notfound_list.handler(api_notfound_list_event, None)
+        assert json.loads(response['body'])['error'] == "List mode everything is not supported."
@@ -0,0 +1,219 @@
+import pytest
+import os
+import json
+from tools import counter, enrichment, notfound_get, notfound_view, logger
+
+log = logger.setup_test_logger()
+
+LISTS_TABLE = 'lists-unit'
+NOTFOUND_TABLE = 'notfound-unit'
+
+PRODUCT_ID = '12345678-notf-0010-1234-abcdefghijkl'
+USER_ID = '12345678-user-0001-1234-abcdefghijkl'
+LIST_ID = '12345678-list-0001-1234-abcdefghijkl'
+
+
+@pytest.fixture
+def streams(local_dynamodb, monkeypatch):
+    monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+    monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+    monkeypatch.setattr(notfound_view, 'dynamodb', local_dynamodb)
+    local_dynamodb.enable_stream(NOTFOUND_TABLE)
+    local_dynamodb.enable_stream(LISTS_TABLE)
+
+    return local_dynamodb
+
+
+def get_item(dynamodb, product_id=PRODUCT_ID):
+    return dynamodb.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': product_id}}).get('Item')
+
+
+def deliver(dynamodb, table):
+    response = notfound_view.handler(dynamodb.stream_event(table), None)
+    assert response == {'batchItemFailures': []}
+
+
+def add_notfound_item(dynamodb):
+    # The item is in the test data, so it is removed first for the put to be an insert.
+    dynamodb.delete_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': PRODUCT_ID}})
+    dynamodb.put_item(TableName=NOTFOUND_TABLE, Item={
+        'productId': {'S': PRODUCT_ID},
+        'createdBy': {'S': USER_ID},
+        'brand': {'S': 'JL'},
+        'details': {'S': 'Safari Mobile'},
+        'productUrl': {'S': 'https://www.johnlewis.com/john-lewis-partners-safari-mobile/p3439165'}
+    })
+    deliver(dynamodb, NOTFOUND_TABLE)
+
+
+class TestNotfoundRecords:
+    def test_insert_builds_view(self, streams):
+        add_notfound_item(streams)
+
+        item = get_item(streams)
+        assert item['listId'] == {'S': LIST_ID}
+        assert item['creatorsName'] == {'S': 'Test User1'}
+        assert item['listTitle'] == {'S': 'Child User1 1st Birthday'}
+        assert item['canonicalUrl'] == {'S': 'johnlewis.com/john-lewis-partners-safari-mobile/p3439165'}
+        assert 'viewUpdatedAt' in item
+
+    def test_insert_without_creator(self, streams):
+        streams.delete_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': PRODUCT_ID}})
+        streams.put_item(TableName=NOTFOUND_TABLE, Item={
+            'productId': {'S': PRODUCT_ID},
+            'brand': {'S': 'JL'},
+            'details': {'S': 'Safari Mobile'}
+        })
+        deliver(streams, NOTFOUND_TABLE)
+
+        item = get_item(streams)
+        assert item['creatorsName'] == {'NULL': True}
+        assert item['canonicalUrl'] == {'NULL': True}
+
+    def test_url_change_updates_canonical_url(self, streams):
+        add_notfound_item(streams)
+        streams.stream_event(NOTFOUND_TABLE)
+
+        streams.update_item(
+            TableName=NOTFOUND_TABLE,
+            Key={'productId': {'S': PRODUCT_ID}},
+            UpdateExpression='SET productUrl = :url',
+            ExpressionAttributeValues={':url': {'S': 'https://m.johnlewis.com/p3439165?utm_source=sms'}}
+        )
+        streams.calls.clear()
+        deliver(streams, NOTFOUND_TABLE)
+
+        assert streams.calls == ['UpdateItem']
+        assert get_item(streams)['canonicalUrl'] == {'S': 'johnlewis.com/p3439165'}
+
+    def test_view_updates_are_not_processed_again(self, streams):
+        add_notfound_item(streams)
+        streams.calls.clear()
+
+        event = streams.stream_event(NOTFOUND_TABLE)
+        assert [record['eventName'] for record in event['Records']] == ['MODIFY']
+
+        notfound_view.handler(event, None)
+        assert streams.calls == []
+
+    def test_counter_follows_inserts_and_removes(self, streams):
+        counter.recount(streams, NOTFOUND_TABLE)
+        streams.stream_event(NOTFOUND_TABLE)
+
+        add_notfound_item(streams)
+        streams.put_item(TableName=NOTFOUND_TABLE, Item={'productId': {'S': 'notfound-new'}, 'createdBy': {'S': USER_ID}, 'productUrl': {'S': 'https://shop.com/new'}})
+        deliver(streams, NOTFOUND_TABLE)
+        assert counter.get_count(streams, NOTFOUND_TABLE) == 4
+
+        streams.delete_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': 'notfound-new'}})
+        deliver(streams, NOTFOUND_TABLE)
+        assert counter.get_count(streams, NOTFOUND_TABLE) == 3
+
+    def test_counter_is_ignored(self, streams):
+        streams.put_item(TableName=NOTFOUND_TABLE, Item={'productId': {'S': 'COUNTER#items'}, 'itemCount': {'N': '3'}})
+        streams.calls.clear()
+
+        deliver(streams, NOTFOUND_TABLE)
+        assert streams.calls == []
+
+    def test_notfound_get_skips_lookups(self, streams, monkeypatch, api_notfound_get_event):
+        add_notfound_item(streams)
+        monkeypatch.setattr(notfound_get, 'dynamodb', streams)
+        streams.calls.clear()
+
+        response = notfound_get.handler(api_notfound_get_event, None)
+        body = json.loads(response['body'])
+        assert body['creatorsName'] == 'Test User1'
+        assert body['listTitle'] == 'Child User1 1st Birthday'
+        assert body['listId'] == LIST_ID
+        assert sorted(streams.calls) == ['GetItem', 'GetItem', 'Query'], "With a view, the names should not be looked up."
+
+
+class TestListsRecords:
+    def test_list_title_change(self, streams):
+        add_notfound_item(streams)
+        streams.stream_event(NOTFOUND_TABLE)
+
+        streams.update_item(
+            TableName=LISTS_TABLE,
+            Key={'PK': {'S': 'LIST#' + LIST_ID}, 'SK': {'S': 'USER#' + USER_ID}},
+            UpdateExpression='SET title = :title',
+            ExpressionAttributeValues={':title': {'S': 'Renamed List'}}
+        )
+        deliver(streams, LISTS_TABLE)
+
+        assert get_item(streams)['listTitle'] == {'S': 'Renamed List'}
+        assert enrichment.get_generation(streams, NOTFOUND_TABLE) == 1, "Enrichment caches should be invalidated."
+
+    def test_user_name_change(self, streams):
+        add_notfound_item(streams)
+
+        streams.update_item(
+            TableName=LISTS_TABLE,
+            Key={'PK': {'S': 'USER#' + USER_ID}, 'SK': {'S': 'USER#' + USER_ID}},
+            UpdateExpression='SET #n = :name',
+            ExpressionAttributeNames={'#n': 'name'},
+            ExpressionAttributeValues={':name': {'S': 'Renamed User'}}
+        )
+        deliver(streams, LISTS_TABLE)
+
+        assert get_item(streams)['creatorsName'] == {'S': 'Renamed User'}
+        assert get_item(streams, '12345678-notf-0020-1234-abcdefghijkl')['createdBy'] != {'S': USER_ID}
+
+    def test_other_changes_are_ignored(self, streams):
+        add_notfound_item(streams)
+        streams.calls.clear()
+
+        streams.update_item(
+            TableName=LISTS_TABLE,
+            Key={'PK': {'S': 'USER#' + USER_ID}, 'SK': {'S': 'USER#' + USER_ID}},
+            UpdateExpression='SET email = :email',
+            ExpressionAttributeValues={':email': {'S': 'new@example.com'}}
+        )
+        deliver(streams, LISTS_TABLE)
+
+        assert streams.calls == ['UpdateItem']
+
+    def test_product_removed_from_list(self, streams):
+        add_notfound_item(streams)
+
+        streams.delete_item(TableName=LISTS_TABLE, Key={'PK': {'S': 'LIST#' + LIST_ID}, 'SK': {'S': 'PRODUCT#' + PRODUCT_ID}})
+        deliver(streams, LISTS_TABLE)
+
+        item = get_item(streams)
+        assert item['listId'] == {'NULL': True}
+        assert item['listTitle'] == {'S': 'Unknown'}
+
+    def test_deleted_product_is_not_recreated(self, streams):
+        add_notfound_item(streams)
+        streams.delete_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': PRODUCT_ID}})
+
+        streams.delete_item(TableName=LISTS_TABLE, Key={'PK': {'S': 'LIST#' + LIST_ID}, 'SK': {'S': 'PRODUCT#' + PRODUCT_ID}})
+        deliver(streams, LISTS_TABLE)
+
+        assert get_item(streams) is None
+
+
+class TestHandler:
+    def test_failed_record_is_reported(self, streams, monkeypatch):
+        add_notfound_item(streams)
+        streams.stream_event(NOTFOUND_TABLE)
+        streams.update_item(
+            TableName=LISTS_TABLE,
+            Key={'PK': {'S': 'LIST#' + LIST_ID}, 'SK': {'S': 'USER#' + USER_ID}},
+            UpdateExpression='SET title = :title',
+            ExpressionAttributeValues={':title': {'S': 'Renamed List'}}
+        )
+        event = streams.stream_event(LISTS_TABLE)
+        del streams.tables[NOTFOUND_TABLE]
+
+        response = notfound_view.handler(event, None)
+        assert response == {'batchItemFailures': [{'itemIdentifier': event['Records'][0]['dynamodb']['SequenceNumber']}]}
+
+    def test_rebuild(self, streams):
+        response = notfound_view.handler({'rebuild': True}, None)
+        assert json.loads(response['body']) == {'rebuilt': 3}
+
+        item = get_item(streams, '12345678-notf-0020-1234-abcdefghijkl')
+        assert item['creatorsName'] == {'S': 'Test User3'}
+        assert item['listTitle'] == {'S': 'Child User3 1st Birthday'}
@@ -0,0 +1,74 @@
+import pytest
+import os
+import mock
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+from tools import common, fanout, prewarm, logger
+
+log = logger.setup_test_logger()
+
+
+def credentials():
+    return {
+        'AccessKeyId': 'ASIAEXAMPLE',
+        'SecretAccessKey': 'secret',
+        'SessionToken': 'token',
+        'Expiration': datetime.now(timezone.utc) + timedelta(minutes=60)
+    }
+
+
+@pytest.fixture
+def products_environment(monkeypatch):
+    variables = {
+        'ENVIRONMENT': 'test',
+        'CROSS_ACCOUNT_ROLE': 'Tools-Service-Cross-Account-Exection-Role',
+        'PRODUCTS_TEST_TABLE_NAME': 'products-test-unit',
+        'PRODUCTS_STAGING_TABLE_NAME': 'products-staging-unit',
+        'PRODUCTS_PROD_TABLE_NAME': 'products-prod-unit',
+        'ACCOUNT_ID_TEST': '111111111111',
+        'ACCOUNT_ID_STAGING': '222222222222',
+        'ACCOUNT_ID_PROD': '333333333333'
+    }
+    for name, value in variables.items():
+        monkeypatch.setitem(os.environ, name, value)
+
+    monkeypatch.setattr(common, 'credentials_cache', {})
+    monkeypatch.setattr(common, 'clients', {})
+
+
+class TestPrewarm:
+    def test_skipped_outside_lambda(self, products_environment, monkeypatch):
+        monkeypatch.delitem(os.environ, 'AWS_LAMBDA_FUNCTION_NAME', raising=False)
+        assert prewarm.prewarm() == {}
+
+    def test_skipped_without_variables(self, monkeypatch):
+        monkeypatch.setitem(os.environ, 'AWS_LAMBDA_FUNCTION_NAME', 'Tools-ProductsCreate')
+        monkeypatch.delitem(os.environ, 'ACCOUNT_ID_PROD', raising=False)
+        assert prewarm.prewarm() == {}
+
+    @mock.patch("tools.common.assume_role", side_effect=lambda role_arn: credentials())
+    def test_warms_all_environments(self, mock_assume_role, products_environment, monkeypatch, empty_products_mock):
+        monkeypatch.setitem(os.environ, 'AWS_LAMBDA_FUNCTION_NAME', 'Tools-ProductsCreate')
+
+        results = prewarm.prewarm()
+        assert results == {'test': fanout.SUCCEEDED, 'staging': fanout.SUCCEEDED, 'prod': fanout.SUCCEEDED}
+
+        # Only the other accounts need a role, and the credentials are then used by the handlers.
+        assert mock_assume_role.call_count == 2
+        assert len(common.credentials_cache) == 2
+        assert ('dynamodb', '222222222222', None) in common.clients
+        assert ('dynamodb', '333333333333', None) in common.clients
+
+    @mock.patch("tools.common.assume_role", side_effect=ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Denied'}}, 'AssumeRole'))
+    def test_failure_falls_back_to_first_use(self, mock_assume_role, products_environment, monkeypatch, empty_products_mock):
+        monkeypatch.setitem(os.environ, 'AWS_LAMBDA_FUNCTION_NAME', 'Tools-ProductsCreate')
+
+        results = prewarm.at_init()
+        assert results['test'] == fanout.SUCCEEDED
+        assert results['staging'] == fanout.FAILED
+        assert results['prod'] == fanout.FAILED
+        assert common.credentials_cache == {}
+
+    def test_errors_do_not_stop_init(self, monkeypatch):
+        monkeypatch.setattr(prewarm, 'prewarm', mock.MagicMock(side_effect=Exception("Unexpected")))
+        assert prewarm.at_init() == {}
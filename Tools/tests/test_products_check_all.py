@@ -2,6 +2,7 @@ import pytest
 import os
 import json
 import mock
+import time
 import boto3
 from tools import products_check_all, logger
 
@@ -190,8 +191,29 @@ class TestCheckEnvironments:
         }, "Results were not as expected"
 
     def test_table_get_item_error(self, products_all_environments, tables, accounts, product):
-        tables = {'test': 'products-test-unit-bad'}
+        tables = {'test': 'products-test-unit-bad', 'staging': 'products-staging-unit'}
 
-        with pytest.raises(Exception) as e:
-            products_check_all.check_environments(tables, accounts, 'Cross-Account-Assume-Role', 'test', product)
-        assert str(e.value) == "Unexpected problem getting product from table.", "Exception not as expected."
+        results = products_check_all.check_environments(tables, accounts, 'Cross-Account-Assume-Role', 'test', product)
+
+        assert results == {
+            "staging": "IN SYNC",
+            "test": "ERROR"
+        }, "Results were not as expected"
+
+    def test_slow_environment_times_out(self, products_all_environments, tables, accounts, product, monkeypatch):
+        monkeypatch.setitem(os.environ, 'FANOUT_TIMEOUT_SECONDS', '0.2')
+        get_item = products_check_all.get_item
+
+        def slow_get_item(table_name, *args):
+            if table_name == 'products-staging-unit':
+                time.sleep(0.5)
+                return product
+            return get_item(table_name, *args)
+
+        with mock.patch("tools.products_check_all.get_item", slow_get_item):
+            results = products_check_all.check_environments(tables, accounts, 'Cross-Account-Assume-Role', 'test', product)
+
+        assert results == {
+            "staging": "TIMED OUT",
+            "test": "IN SYNC"
+        }, "Results were not as expected"
@@ -5,6 +5,7 @@ import os
 import json
 import mock
 import boto3
+from botocore.exceptions import ClientError
 from tools import products_create, logger
 
 log = logger.setup_test_logger()
@@ -196,6 +197,7 @@ class TestUpdateTables:
         assert len(results['test'].split(":")[1]) == 36
         assert not errors, "Errors boolean should be false"
 
+    @mock.patch("tools.common.assume_role", mock.MagicMock(side_effect=ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Not authorized'}}, 'AssumeRole')))
     def test_fails_due_to_no_permission(self, products_all_environments, accounts, product):
         tables = {
             'test': PRODUCTS_TEST_TABLE,
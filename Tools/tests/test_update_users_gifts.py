@@ -1,8 +1,9 @@
 import pytest
 import os
 import json
+import time
 import boto3
-from tools import update_users_gifts, logger
+from tools import update_users_gifts, deadline, logger
 
 log = logger.setup_test_logger()
 
@@ -45,75 +46,6 @@ class TestDeleteProductFromNotfoundTable:
         assert not result, "Delete did not fail."
 
 
-class TestAddProductItems:
-    def test_add_product_items(self, dynamodb_mock, find_product_and_reserved_items):
-        list_id = find_product_and_reserved_items[0]['PK']['S']
-        id = '12345678-prod-abcd-1234-abcdefghijkl'
-        products_items = update_users_gifts.build_list_product_items(find_product_and_reserved_items, id)
-        adds = update_users_gifts.add_product_items(LISTS_TABLE, products_items)
-        assert len(adds['failed']) == 0, "There should be no failed items"
-        assert len(adds['added']) == 3, "There should be 3 added items"
-
-        # Check the table was updated with right number of items
-        dynamodb = boto3.client('dynamodb', region_name='eu-west-1')
-
-        test_response = dynamodb.query(
-            TableName=LISTS_TABLE,
-            KeyConditionExpression="PK = :PK",
-            ExpressionAttributeValues={":PK":  {'S': list_id}}
-        )
-
-        assert len(test_response['Items']) == 10, "Total Items for the list was not as expected."
-
-        # Check that the correct items were deleted:
-        for item in products_items:
-            response = dynamodb.query(
-                TableName=LISTS_TABLE,
-                IndexName='SK-index',
-                KeyConditionExpression="SK = :SK",
-                ExpressionAttributeValues={":SK": item['SK']}
-            )
-
-            assert len(response['Items']) == 1, "Item was not added as expected."
-
-
-class TestDeleteNotfoundItems:
-    def test_delete_notfound_items(self, dynamodb_mock, find_product_and_reserved_items):
-        list_id = find_product_and_reserved_items[0]['PK']['S']
-        deletes = update_users_gifts.delete_notfound_items(LISTS_TABLE, find_product_and_reserved_items)
-        assert len(deletes['failed']) == 0, "There should be no failed items"
-        assert len(deletes['deleted']) == 3, "There should be 3 failed items"
-
-        # Check the table was updated with right number of items
-        dynamodb = boto3.client('dynamodb', region_name='eu-west-1')
-
-        test_response = dynamodb.query(
-            TableName=LISTS_TABLE,
-            KeyConditionExpression="PK = :PK",
-            ExpressionAttributeValues={":PK":  {'S': list_id}}
-        )
-
-        assert len(test_response['Items']) == 4, "Total Items for the list was not as expected."
-
-        # Check that the correct items were deleted:
-        for item in find_product_and_reserved_items:
-            response = dynamodb.query(
-                TableName=LISTS_TABLE,
-                IndexName='SK-index',
-                KeyConditionExpression="SK = :SK",
-                ExpressionAttributeValues={":SK": item['SK']}
-            )
-
-            assert len(response['Items']) == 0, "Item was not deleted as expected."
-
-    def test_entry_not_exists(self, dynamodb_mock):
-        items = [{'PK': {'S': 'LIST#12345678-list-0001-1234-abcdefghijkl'}, 'SK': {'S': 'PRODUCT#12345678-notf-1010-1234-abcdefghijkl'}, 'quantity': {'N': '4'}, 'reserved': {'N': '3'}, 'type': {'S': 'notfound'}}]
-
-        deletes = update_users_gifts.delete_notfound_items(LISTS_TABLE, items)
-        assert len(deletes['failed']) == 1, "There should be 1 failed items"
-        assert len(deletes['deleted']) == 0, "There should be 0 failed items"
-
-
 class TestBuildListProductItems:
     def test_build_list_items(self, find_product_and_reserved_items):
         id = '12345678-prod-abcd-1234-abcdefghijkl'
@@ -149,24 +81,87 @@ class TestFindProductAndReservedItems:
         assert len(items) == 3
 
 
-class TestGetAllListItems:
-    def test_get_all_list_items(self, dynamodb_mock):
-        list_id = '12345678-list-0001-1234-abcdefghijkl'
-        items = update_users_gifts.get_all_list_items(LISTS_TABLE, list_id)
-        assert len(items) == 7, "Number of items was not as expected."
+class TestGetProductListItems:
+    def test_only_product_items_are_read(self, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        local_dynamodb.load(LISTS_TABLE, [
+            {'PK': 'LIST#12345678-list-0001-1234-abcdefghijkl', 'SK': 'RESERVATION#12345678-prod-{:04d}-1234-abcdefghijkl#user#resv'.format(i)}
+            for i in range(100, 150)
+        ])
+        notfound_id = '12345678-notf-0010-1234-abcdefghijkl'
+
+        items = update_users_gifts.aio.run(update_users_gifts.get_product_list_items, LISTS_TABLE, '12345678-list-0001-1234-abcdefghijkl', notfound_id)
+        assert [item['SK']['S'].split('#')[0:2] for item in items] == [['PRODUCT', notfound_id], ['RESERVATION', notfound_id], ['RESERVATION', notfound_id]]
+        assert sorted(local_dynamodb.calls) == ['GetItem', 'Query']
+
+    def test_reservations_follow_all_pages(self, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        local_dynamodb.load(LISTS_TABLE, [
+            {'PK': 'LIST#12345678-list-0001-1234-abcdefghijkl', 'SK': 'RESERVATION#12345678-notf-0010-1234-abcdefghijkl#user-{}#resv'.format(i)}
+            for i in range(10)
+        ])
+        original = local_dynamodb.query
+        monkeypatch.setattr(local_dynamodb, 'query', lambda **kwargs: original(Limit=4, **kwargs))
+
+        items = update_users_gifts.get_list_reserved_items(LISTS_TABLE, '12345678-list-0001-1234-abcdefghijkl', '12345678-notf-0010-1234-abcdefghijkl')
+        assert len(items) == 12
+        assert local_dynamodb.calls.count('Query') == 3
+
+    def test_product_not_in_list(self, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
 
-    def test_list_does_not_exist(self, dynamodb_mock):
-        list_id = '12345678-list-0100-1234-abcdefghijkl'
         with pytest.raises(Exception) as e:
-            update_users_gifts.get_all_list_items(LISTS_TABLE, list_id)
-        assert str(e.value) == "No query results for List ID 12345678-list-0100-1234-abcdefghijkl.", "Exception not as expected."
+            update_users_gifts.aio.run(update_users_gifts.get_product_list_items, LISTS_TABLE, '12345678-list-0001-1234-abcdefghijkl', '12345678-notf-9999-1234-abcdefghijkl')
+        assert str(e.value) == "No query results for List ID 12345678-list-0001-1234-abcdefghijkl."
+
+
+def get_list_items(local_dynamodb, list_id):
+    return local_dynamodb.query(TableName=LISTS_TABLE, KeyConditionExpression="PK = :PK", ExpressionAttributeValues={":PK": {'S': "LIST#" + list_id}})['Items']
+
+
+def add_to_other_lists(local_dynamodb, notfound_id, list_ids):
+    # Copies the product's items in the first list to the other lists, as if it had been added to each of them.
+    items = update_users_gifts.find_product_and_reserved_items(get_list_items(local_dynamodb, '12345678-list-0001-1234-abcdefghijkl'), notfound_id)
+    for list_id in list_ids:
+        for item in items:
+            local_dynamodb.put_item(TableName=LISTS_TABLE, Item=dict(item, PK={'S': 'LIST#' + list_id}))
+    local_dynamodb.calls.clear()
+
 
+def slow(work, seconds):
+    def run(*args):
+        time.sleep(seconds)
+        return work(*args)
 
-class TestGetListId:
-    def test_get_list_id(self, dynamodb_mock):
+    return run
+
+
+def count_items(local_dynamodb, table_name):
+    return len(local_dynamodb.scan(TableName=table_name)['Items'])
+
+
+class TestGetListIds:
+    def test_get_list_ids(self, dynamodb_mock):
         id = '12345678-notf-0010-1234-abcdefghijkl'
-        list_id = update_users_gifts.get_list_id(LISTS_TABLE, id)
-        assert list_id == '12345678-list-0001-1234-abcdefghijkl'
+        list_ids = update_users_gifts.get_list_ids(LISTS_TABLE, id)
+        assert list_ids == ['12345678-list-0001-1234-abcdefghijkl']
+
+    def test_product_in_several_lists(self, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        add_to_other_lists(local_dynamodb, '12345678-notf-0010-1234-abcdefghijkl', ['12345678-list-0101-1234-abcdefghijkl', '12345678-list-0102-1234-abcdefghijkl'])
+
+        # Every page of the index is followed, so no list is missed.
+        original = local_dynamodb.query
+        monkeypatch.setattr(local_dynamodb, 'query', lambda **kwargs: original(Limit=1, **kwargs))
+
+        list_ids = update_users_gifts.get_list_ids(LISTS_TABLE, '12345678-notf-0010-1234-abcdefghijkl')
+        assert sorted(list_ids) == ['12345678-list-0001-1234-abcdefghijkl', '12345678-list-0101-1234-abcdefghijkl', '12345678-list-0102-1234-abcdefghijkl']
+        assert local_dynamodb.calls.count('Query') >= 3
+
+    def test_product_in_no_lists(self, dynamodb_mock):
+        with pytest.raises(Exception) as e:
+            update_users_gifts.get_list_ids(LISTS_TABLE, '12345678-notf-9999-1234-abcdefghijkl')
+        assert str(e.value) == "No lists for product 12345678-notf-9999-1234-abcdefghijkl were returned."
 
 
 class TestPutProductInProductsTable:
@@ -312,8 +307,274 @@ class TestGetProductFromNotfound:
         assert str(e.value) == "Unexpected problem getting product from table.", "Exception not as expected."
 
 
+class TestBuildTransactions:
+    def items(self, count):
+        existing = [{'PK': {'S': 'LIST#1'}, 'SK': {'S': 'RESERVATION#old#' + str(i)}} for i in range(count)]
+        added = [{'PK': {'S': 'LIST#1'}, 'SK': {'S': 'RESERVATION#new#' + str(i)}} for i in range(count)]
+        return existing, added
+
+    def test_one_transaction(self):
+        existing, added = self.items(3)
+        transactions = update_users_gifts.build_transactions(LISTS_TABLE, NOTFOUND_TABLE, 'notfound-1', existing, added)
+
+        assert len(transactions) == 1
+        actions, pairs = transactions[0]
+        assert [list(action.keys())[0] for action in actions] == ['Delete', 'Put', 'Delete', 'Put', 'Delete', 'Put', 'Delete']
+        assert actions[-1]['Delete']['TableName'] == NOTFOUND_TABLE
+        assert len(pairs) == 3
+
+    def test_chunked_to_action_limit(self):
+        existing, added = self.items(120)
+        transactions = update_users_gifts.build_transactions(LISTS_TABLE, NOTFOUND_TABLE, 'notfound-1', existing, added)
+
+        assert [len(actions) for actions, pairs in transactions] == [100, 100, 41]
+        assert transactions[-1][0][-1]['Delete']['TableName'] == NOTFOUND_TABLE, "Notfound item should be deleted last."
+        for actions, pairs in transactions:
+            deleted = [action['Delete']['Key']['SK']['S'] for action in actions if 'Delete' in action and action['Delete']['TableName'] == LISTS_TABLE]
+            assert deleted == [existing['SK']['S'] for existing, add in pairs], "An item and its replacement should be in the same transaction."
+
+    def test_notfound_delete_in_own_transaction_when_full(self):
+        existing, added = self.items(50)
+        transactions = update_users_gifts.build_transactions(LISTS_TABLE, NOTFOUND_TABLE, 'notfound-1', existing, added)
+
+        assert [len(actions) for actions, pairs in transactions] == [100, 1]
+
+    def test_without_notfound_delete(self):
+        existing, added = self.items(50)
+        transactions = update_users_gifts.build_transactions(LISTS_TABLE, NOTFOUND_TABLE, 'notfound-1', existing, added, delete_notfound=False)
+
+        assert [len(actions) for actions, pairs in transactions] == [100]
+        assert all(action['Delete']['TableName'] == LISTS_TABLE for action in transactions[0][0] if 'Delete' in action)
+
+
+class TestReplaceListItems:
+    def test_failed_transaction_changes_nothing(self, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        notfound_id = '12345678-notf-0010-1234-abcdefghijkl'
+        list_items = get_list_items(local_dynamodb, '12345678-list-0001-1234-abcdefghijkl')
+        existing = update_users_gifts.find_product_and_reserved_items(list_items, notfound_id)
+
+        # The replacement product is already in the list, so its put fails the whole transaction.
+        added = update_users_gifts.build_list_product_items(existing, '12345678-prod-0001-1234-abcdefghijkl')
+        deletes, adds, notfound_deleted = update_users_gifts.replace_list_items(LISTS_TABLE, NOTFOUND_TABLE, notfound_id, existing, added)
+
+        assert not notfound_deleted
+        assert deletes == {'deleted': [], 'failed': existing}
+        assert adds == {'added': [], 'failed': added}
+        assert len(get_list_items(local_dynamodb, '12345678-list-0001-1234-abcdefghijkl')) == len(list_items)
+        assert 'Item' in local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': notfound_id}})
+
+    def test_later_transactions_not_attempted_after_failure(self, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        monkeypatch.setattr(update_users_gifts, 'TRANSACTION_MAX_ACTIONS', 2)
+        monkeypatch.setattr(update_users_gifts, 'transact_write', lambda actions: False)
+
+        existing = [{'PK': {'S': 'LIST#1'}, 'SK': {'S': 'RESERVATION#old#' + str(i)}} for i in range(2)]
+        added = [{'PK': {'S': 'LIST#1'}, 'SK': {'S': 'RESERVATION#new#' + str(i)}} for i in range(2)]
+        deletes, adds, notfound_deleted = update_users_gifts.replace_list_items(LISTS_TABLE, NOTFOUND_TABLE, 'notfound-1', existing, added)
+
+        assert not notfound_deleted
+        assert len(deletes['failed']) == 2
+        assert len(adds['failed']) == 2
+
+
 class TestHandler:
+    def test_low_budget_returns_continuation(self, api_update_users_gifts_event, monkeypatch, local_dynamodb, lambda_context):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+
+        response = update_users_gifts.handler(api_update_users_gifts_event, lambda_context(1000))
+        assert response['statusCode'] == 202
+
+        body = json.loads(response['body'])
+        assert body['partial']
+        assert body['stoppedAt'] == 'update list items'
+        assert 'products-product-created_succeeded' in body
+
+        state = deadline.decode_token(body['continuation'])
+        assert state['id'] == '12345678-notf-0010-1234-abcdefghijkl'
+        assert state['productsId'] == body['products-product-created_succeeded']['productId']['S']
+        assert state['listIds'] == ['12345678-list-0001-1234-abcdefghijkl']
+        assert 'listsUpdated' not in state
+
+        # Resuming with the token completes the remaining steps without creating the product again.
+        api_update_users_gifts_event['queryStringParameters'] = {'continuation': body['continuation']}
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 200
+
+        body = json.loads(response['body'])
+        assert 'products-product-created_succeeded' not in body
+        assert len(body['lists-products-added_succeeded']) == 3
+        assert body['lists-products-added_succeeded'][0]['SK']['S'] == 'PRODUCT#' + state['productsId']
+        assert body['notfound-product-deleted_succeeded']
+
+    def test_resume_after_create_ran_out_of_time(self, api_update_users_gifts_event, monkeypatch, local_dynamodb, lambda_context):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        monkeypatch.setattr(update_users_gifts, 'products_table_create_product', slow(update_users_gifts.products_table_create_product, 0.6))
+        products = count_items(local_dynamodb, PRODUCTS_TABLE)
+
+        response = update_users_gifts.handler(api_update_users_gifts_event, lambda_context(700))
+        body = json.loads(response['body'])
+        assert body['stoppedAt'] == 'create product'
+        state = deadline.decode_token(body['continuation'])
+        assert 'productsId' not in state
+
+        # The product is created after the invocation stopped, then put again with the same id on resuming.
+        time.sleep(0.5)
+        api_update_users_gifts_event['queryStringParameters'] = {'continuation': body['continuation']}
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 200
+
+        body = json.loads(response['body'])
+        assert body['products-product-created_succeeded']['productId']['S'] == state['newProductsId']
+        assert body['notfound-product-deleted_succeeded']
+        assert count_items(local_dynamodb, PRODUCTS_TABLE) == products + 1
+
+    def test_resume_after_lists_ran_out_of_time(self, api_update_users_gifts_event, monkeypatch, local_dynamodb, lambda_context):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        monkeypatch.setitem(os.environ, 'BUDGET_LOW_MS', '100')
+        monkeypatch.setattr(update_users_gifts, 'replace_list_items', slow(update_users_gifts.replace_list_items, 0.6))
+        products = count_items(local_dynamodb, PRODUCTS_TABLE)
+
+        response = update_users_gifts.handler(api_update_users_gifts_event, lambda_context(700))
+        body = json.loads(response['body'])
+        assert body['stoppedAt'] == 'update list items'
+        state = deadline.decode_token(body['continuation'])
+        assert 'listsUpdated' not in state
+
+        # The list and notfound item are replaced after the invocation stopped, so resuming has nothing left to do.
+        time.sleep(0.5)
+        api_update_users_gifts_event['queryStringParameters'] = {'continuation': body['continuation']}
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 200
+
+        body = json.loads(response['body'])
+        assert body['notfound-product-deleted_succeeded']
+        assert count_items(local_dynamodb, PRODUCTS_TABLE) == products + 1
+        assert update_users_gifts.get_list_product_item(LISTS_TABLE, '12345678-list-0001-1234-abcdefghijkl', state['productsId'])
+
+    def test_with_local_dynamodb(self, api_update_users_gifts_event, monkeypatch, local_dynamodb):
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        local_dynamodb.latency = 0.1
+
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 200
+
+        body = json.loads(response['body'])
+        assert len(body['lists-products-added_succeeded']) == 3
+        assert len(body['lists-notfound-deleted_succeeded']) == 3
+        assert body['notfound-product-deleted_succeeded']
+
+        # The list items and notfound item are replaced in one transaction.
+        assert sorted(local_dynamodb.calls) == ['GetItem', 'GetItem', 'PutItem', 'Query', 'Query', 'TransactWriteItems']
+        assert local_dynamodb.max_running > 1, "Independent calls did not overlap."
+
+    def test_product_in_several_lists(self, api_update_users_gifts_event, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        monkeypatch.setitem(os.environ, 'RESOLVE_MAX_LISTS', '2')
+        other_lists = ['12345678-list-01{:02d}-1234-abcdefghijkl'.format(i) for i in range(3)]
+        add_to_other_lists(local_dynamodb, '12345678-notf-0010-1234-abcdefghijkl', other_lists)
+        local_dynamodb.latency = 0.1
+
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 200
+
+        body = json.loads(response['body'])
+        assert sorted(body['list-results']) == sorted(['12345678-list-0001-1234-abcdefghijkl'] + other_lists)
+        for result in body['list-results'].values():
+            assert result == {'updated': True, 'deleted': 3, 'added': 3}
+        assert len(body['lists-products-added_succeeded']) == 12
+        assert body['notfound-product-deleted_succeeded']
+
+        products_id = body['products-product-created_succeeded']['productId']['S']
+        for list_id in other_lists:
+            items = get_list_items(local_dynamodb, list_id)
+            assert sorted(item['SK']['S'].split('#')[1] for item in items) == [products_id] * 3
+
+        # The notfound item is deleted once every list has been updated.
+        assert 'Item' not in local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}})
+        assert local_dynamodb.calls.count('TransactWriteItems') == 4
+        assert local_dynamodb.max_running_by_operation['TransactWriteItems'] == 2, "Lists were not updated concurrently, up to the limit."
+
+    def test_failed_list_keeps_notfound_item(self, api_update_users_gifts_event, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        add_to_other_lists(local_dynamodb, '12345678-notf-0010-1234-abcdefghijkl', ['12345678-list-0101-1234-abcdefghijkl'])
+
+        original = update_users_gifts.transact_write
+        failing = 'LIST#12345678-list-0101-1234-abcdefghijkl'
+        monkeypatch.setattr(update_users_gifts, 'transact_write', lambda actions: False if failing in json.dumps(actions) else original(actions))
+
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 202
+        body = json.loads(response['body'])
+        assert body['list-results']['12345678-list-0001-1234-abcdefghijkl']['updated']
+        assert body['list-results']['12345678-list-0101-1234-abcdefghijkl'] == {'updated': False, 'deleted': 0, 'added': 0}
+        assert body['notfound-product-deleted_failed']
+        assert body['stoppedAt'] == 'update list items'
+        assert 'Item' in local_dynamodb.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}})
+
+        state = deadline.decode_token(body['continuation'])
+        assert state['productsId'] == body['products-product-created_succeeded']['productId']['S']
+        assert state['listsUpdated'] == ['12345678-list-0001-1234-abcdefghijkl']
+
+        # Resuming from the token only updates the list that failed, with the product already created.
+        monkeypatch.setattr(update_users_gifts, 'transact_write', original)
+        products = count_items(local_dynamodb, PRODUCTS_TABLE)
+        api_update_users_gifts_event['queryStringParameters'] = {'continuation': body['continuation']}
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 200
+
+        body = json.loads(response['body'])
+        assert list(body['list-results']) == ['12345678-list-0101-1234-abcdefghijkl']
+        assert body['notfound-product-deleted_succeeded']
+        assert count_items(local_dynamodb, PRODUCTS_TABLE) == products
+
+    def test_continuation_with_single_list(self, api_update_users_gifts_event, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+
+        # A token from before products in several lists could be resolved, with the list already updated.
+        state = {'id': '12345678-notf-0010-1234-abcdefghijkl', 'productsId': 'products-1', 'listId': '12345678-list-0001-1234-abcdefghijkl', 'listUpdated': True}
+        api_update_users_gifts_event['queryStringParameters'] = {'continuation': deadline.encode_token(state)}
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 200
+
+        body = json.loads(response['body'])
+        assert 'list-results' not in body
+        assert body['notfound-product-deleted_succeeded']
+        assert sorted(local_dynamodb.calls) == ['DeleteItem', 'GetItem']
+
+    def test_continuation_for_other_product(self, api_update_users_gifts_event, monkeypatch, dynamodb_mock):
+        monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+        monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+        monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+        api_update_users_gifts_event['queryStringParameters'] = {'continuation': deadline.encode_token({'id': '12345678-notf-0011-1234-abcdefghijkl'})}
+
+        response = update_users_gifts.handler(api_update_users_gifts_event, None)
+        assert response['statusCode'] == 500
+        assert json.loads(response['body'])['error'] == "Continuation token was not for product 12345678-notf-0010-1234-abcdefghijkl."
+
     def test_handler(self, api_update_users_gifts_event, monkeypatch, dynamodb_mock):
+        # End to end against moto, rather than the local fake, so the transaction is checked by a real implementation.
         monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
         monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
         monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
@@ -339,7 +600,8 @@ class TestHandler:
         assert len(lists_added) == 3
         assert len(lists_deleted) == 3
 
-    def test_handler_search_hidding_flag(self, api_update_users_gifts_event_2, monkeypatch, dynamodb_mock):
+    def test_handler_search_hidding_flag(self, api_update_users_gifts_event_2, monkeypatch, local_dynamodb):
+        monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
         monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
         monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
         monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
@@ -0,0 +1,208 @@
+import pytest
+import os
+import json
+import time
+from tools import update_users_gifts, update_users_gifts_bulk, logger
+
+log = logger.setup_test_logger()
+
+LISTS_TABLE = 'lists-unit'
+NOTFOUND_TABLE = 'notfound-unit'
+PRODUCTS_TABLE = 'products-unit'
+
+DETAILS = {
+    "brand": "John Lewis",
+    "details": "John Lewis & Partners Safari Mobile",
+    "retailer": "johnlewis.com",
+    "imageUrl": "https://johnlewis.scene7.com/is/image/JohnLewis/237244063?$rsp-pdp-port-640$",
+    "productUrl": "https://www.johnlewis.com/john-lewis-partners-safari-mobile/p3439165?tagid=123456",
+    "price": "20.99"
+}
+
+
+@pytest.fixture
+def bulk_event(api_update_users_gifts_bulk_event):
+    def event(products):
+        api_update_users_gifts_bulk_event['body'] = json.dumps({'products': products})
+        return api_update_users_gifts_bulk_event
+
+    return event
+
+
+@pytest.fixture
+def tables(monkeypatch, local_dynamodb):
+    monkeypatch.setattr(update_users_gifts, 'dynamodb', local_dynamodb)
+    monkeypatch.setattr(update_users_gifts_bulk, 'dynamodb', local_dynamodb)
+    monkeypatch.setitem(os.environ, 'PRODUCTS_TABLE_NAME', PRODUCTS_TABLE)
+    monkeypatch.setitem(os.environ, 'NOTFOUND_TABLE_NAME', NOTFOUND_TABLE)
+    monkeypatch.setitem(os.environ, 'LISTS_TABLE_NAME', LISTS_TABLE)
+    return local_dynamodb
+
+
+def count_items(tables, table_name):
+    return len(tables.scan(TableName=table_name)['Items'])
+
+
+class TestGetProductsDetails:
+    def test_get_products_details(self, bulk_event):
+        products = update_users_gifts_bulk.get_products_details(bulk_event([dict(DETAILS, id='notfound-1'), dict(DETAILS, id='notfound-2')]))
+        assert list(products) == ['notfound-1', 'notfound-2']
+        assert products['notfound-1']['brand'] == "John Lewis"
+
+    def test_no_products(self, bulk_event):
+        with pytest.raises(Exception) as e:
+            update_users_gifts_bulk.get_products_details(bulk_event([]))
+        assert str(e.value) == "API Event body did not contain the products."
+
+    def test_too_many_products(self, monkeypatch, bulk_event):
+        monkeypatch.setitem(os.environ, 'BULK_MAX_PRODUCTS', '1')
+        with pytest.raises(Exception) as e:
+            update_users_gifts_bulk.get_products_details(bulk_event([dict(DETAILS, id='notfound-1'), dict(DETAILS, id='notfound-2')]))
+        assert str(e.value) == "Too many products, at most 1 can be resolved at once."
+
+    def test_product_given_twice(self, bulk_event):
+        with pytest.raises(Exception) as e:
+            update_users_gifts_bulk.get_products_details(bulk_event([dict(DETAILS, id='notfound-1'), dict(DETAILS, id='notfound-1')]))
+        assert str(e.value) == "Product notfound-1 was given more than once."
+
+
+class TestCreateProducts:
+    def test_identical_products_created_once(self, tables):
+        existing = count_items(tables, PRODUCTS_TABLE)
+        tables.calls.clear()
+        products = {'notfound-1': {'brand': {'S': 'A'}}, 'notfound-2': {'brand': {'S': 'A'}}, 'notfound-3': {'brand': {'S': 'B'}}}
+        products_ids = update_users_gifts_bulk.assign_products_ids(products, {})
+        created = update_users_gifts_bulk.products_table_create_products(PRODUCTS_TABLE, products, products_ids)
+
+        assert products_ids['notfound-1'] == products_ids['notfound-2']
+        assert products_ids['notfound-1'] != products_ids['notfound-3']
+        assert created == {'notfound-1': True, 'notfound-2': True, 'notfound-3': True}
+        assert tables.calls == ['BatchWriteItem']
+        assert count_items(tables, PRODUCTS_TABLE) == existing + 2
+
+    def test_resumed_products_keep_their_id(self):
+        products = {'notfound-1': {'brand': {'S': 'A'}}, 'notfound-2': {'brand': {'S': 'A'}}}
+        products_ids = update_users_gifts_bulk.assign_products_ids(products, {'notfound-1': 'products-1', 'notfound-3': 'products-3'})
+
+        assert products_ids['notfound-1'] == 'products-1'
+        assert products_ids['notfound-2'] not in ['products-1', 'products-3']
+        assert products_ids['notfound-3'] == 'products-3'
+
+    def test_unprocessed_products_fail(self, monkeypatch, tables):
+        monkeypatch.setattr(update_users_gifts_bulk.common, 'batch_write_items', lambda client, table, puts=(), deletes=(): [{'PutRequest': {'Item': puts[0]}}])
+        created = update_users_gifts_bulk.products_table_create_products(PRODUCTS_TABLE, {'notfound-1': {'brand': {'S': 'A'}}}, {'notfound-1': 'products-1'})
+
+        assert created == {'notfound-1': False}
+
+
+class TestHandler:
+    def test_handler(self, tables, bulk_event):
+        products = [dict(DETAILS, id='12345678-notf-0010-1234-abcdefghijkl'), dict(DETAILS, id='12345678-notf-0020-1234-abcdefghijkl', brand='Other')]
+        response = update_users_gifts_bulk.handler(bulk_event(products), None)
+        assert response['statusCode'] == 200
+
+        results = json.loads(response['body'])['results']
+        assert results['12345678-notf-0010-1234-abcdefghijkl']['resolved']
+        assert results['12345678-notf-0010-1234-abcdefghijkl']['lists'] == {'12345678-list-0001-1234-abcdefghijkl': {'updated': True, 'deleted': 3, 'added': 3}}
+        assert results['12345678-notf-0020-1234-abcdefghijkl']['resolved']
+        assert results['12345678-notf-0010-1234-abcdefghijkl']['productId'] != results['12345678-notf-0020-1234-abcdefghijkl']['productId']
+
+        for id, result in results.items():
+            assert 'Item' not in tables.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': id}})
+            assert 'Item' in tables.get_item(TableName=PRODUCTS_TABLE, Key={'productId': {'S': result['productId']}})
+
+        # The notfound items, list product items and new products are read and written in batches.
+        assert tables.calls.count('BatchGetItem') == 2
+        assert tables.calls.count('BatchWriteItem') == 2
+
+    def test_failures_are_per_product(self, tables, bulk_event):
+        products = [
+            dict(DETAILS, id='12345678-notf-0010-1234-abcdefghijkl'),
+            dict(DETAILS, id='12345678-notf-0011-1234-abcdefghijkl'),
+            dict(DETAILS, id='12345678-notf-9999-1234-abcdefghijkl'),
+            {'id': '12345678-notf-0020-1234-abcdefghijkl', 'brand': 'John Lewis'}
+        ]
+        response = update_users_gifts_bulk.handler(bulk_event(products), None)
+        assert response['statusCode'] == 200
+
+        results = json.loads(response['body'])['results']
+        assert results['12345678-notf-0010-1234-abcdefghijkl']['resolved']
+        assert results['12345678-notf-0011-1234-abcdefghijkl'] == {'resolved': False, 'error': "No lists for product 12345678-notf-0011-1234-abcdefghijkl were returned."}
+        assert results['12345678-notf-9999-1234-abcdefghijkl'] == {'resolved': False, 'error': "No product returned for the id 12345678-notf-9999-1234-abcdefghijkl."}
+        assert results['12345678-notf-0020-1234-abcdefghijkl'] == {'resolved': False, 'error': "API Event body did not contain the details."}
+
+        assert 'Item' in tables.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0011-1234-abcdefghijkl'}})
+        assert 'Item' in tables.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0020-1234-abcdefghijkl'}})
+
+    def test_failed_list_keeps_notfound_item(self, monkeypatch, tables, bulk_event):
+        monkeypatch.setattr(update_users_gifts, 'transact_write', lambda actions: False)
+        response = update_users_gifts_bulk.handler(bulk_event([dict(DETAILS, id='12345678-notf-0010-1234-abcdefghijkl')]), None)
+
+        result = json.loads(response['body'])['results']['12345678-notf-0010-1234-abcdefghijkl']
+        assert not result['resolved']
+        assert result['error'] == "List 12345678-list-0001-1234-abcdefghijkl could not be updated."
+        assert 'Item' in tables.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0010-1234-abcdefghijkl'}})
+
+    def test_failed_list_resumes_with_product_id(self, monkeypatch, tables, bulk_event):
+        original = update_users_gifts.transact_write
+        monkeypatch.setattr(update_users_gifts, 'transact_write', lambda actions: False)
+        response = update_users_gifts_bulk.handler(bulk_event([dict(DETAILS, id='12345678-notf-0010-1234-abcdefghijkl')]), None)
+        failed = json.loads(response['body'])['results']['12345678-notf-0010-1234-abcdefghijkl']
+        assert not failed['resolved']
+        products = count_items(tables, PRODUCTS_TABLE)
+
+        # Giving the product id back resumes with the product already created.
+        monkeypatch.setattr(update_users_gifts, 'transact_write', original)
+        product = {'id': '12345678-notf-0010-1234-abcdefghijkl', 'productId': failed['productId']}
+        response = update_users_gifts_bulk.handler(bulk_event([product]), None)
+
+        result = json.loads(response['body'])['results']['12345678-notf-0010-1234-abcdefghijkl']
+        assert result['resolved']
+        assert result['productId'] == failed['productId']
+        assert count_items(tables, PRODUCTS_TABLE) == products
+
+    def test_resumed_product_without_lists_left(self, tables, bulk_event):
+        product = {'id': '12345678-notf-0011-1234-abcdefghijkl', 'productId': 'products-1'}
+        response = update_users_gifts_bulk.handler(bulk_event([product]), None)
+
+        result = json.loads(response['body'])['results']['12345678-notf-0011-1234-abcdefghijkl']
+        assert result == {'resolved': True, 'productId': 'products-1'}
+        assert 'Item' not in tables.get_item(TableName=NOTFOUND_TABLE, Key={'productId': {'S': '12345678-notf-0011-1234-abcdefghijkl'}})
+
+    def test_low_budget_returns_partial_results(self, monkeypatch, tables, bulk_event, lambda_context):
+        products = count_items(tables, PRODUCTS_TABLE)
+        response = update_users_gifts_bulk.handler(bulk_event([dict(DETAILS, id='12345678-notf-0010-1234-abcdefghijkl')]), lambda_context(1200))
+        assert response['statusCode'] == 202
+
+        body = json.loads(response['body'])
+        assert body['partial']
+        assert body['stoppedAt'] == 'update lists'
+        result = body['results']['12345678-notf-0010-1234-abcdefghijkl']
+        assert result['error'] == "Not enough time left to complete step: update lists."
+        assert not result['resolved']
+
+        # Giving the item again with its productId puts the same product again, then updates the list.
+        product = dict(DETAILS, id='12345678-notf-0010-1234-abcdefghijkl', productId=result['productId'])
+        response = update_users_gifts_bulk.handler(bulk_event([product]), None)
+        assert response['statusCode'] == 200
+
+        result = json.loads(response['body'])['results']['12345678-notf-0010-1234-abcdefghijkl']
+        assert result['resolved']
+        assert result['productId'] == product['productId']
+        assert count_items(tables, PRODUCTS_TABLE) == products + 1
+
+    def test_backlog(self, tables, bulk_event):
+        ids = ['12345678-notf-{:04d}-1234-abcdefghijkl'.format(i) for i in range(1000, 1200)]
+        tables.load(NOTFOUND_TABLE, [{'productId': id, 'createdBy': 'user', 'productUrl': 'https://shop.com/' + id} for id in ids])
+        tables.load(LISTS_TABLE, [{'PK': 'LIST#list-' + id[14:18], 'SK': 'PRODUCT#' + id, 'type': 'notfound', 'quantity': 1} for id in ids])
+        tables.calls.clear()
+        tables.latency = 0.005
+
+        start = time.monotonic()
+        response = update_users_gifts_bulk.handler(bulk_event([dict(DETAILS, id=id) for id in ids]), None)
+        elapsed = time.monotonic() - start
+
+        results = json.loads(response['body'])['results']
+        assert all(result['resolved'] for result in results.values())
+        assert len(set(result['productId'] for result in results.values())) == 1, "Identical products should only be created once."
+        assert elapsed < 5
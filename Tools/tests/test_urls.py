@@ -0,0 +1,31 @@
+import pytest
+from tools import urls, logger
+
+log = logger.setup_test_logger()
+
+CANONICAL = 'johnlewis.com/john-lewis-partners-safari-mobile/p3439165'
+
+
+@pytest.mark.parametrize("url", [
+    'https://www.johnlewis.com/john-lewis-partners-safari-mobile/p3439165',
+    'http://johnlewis.com/john-lewis-partners-safari-mobile/p3439165/',
+    'https://m.johnlewis.com/john-lewis-partners-safari-mobile/p3439165',
+    'https://WWW.JohnLewis.com:443/john-lewis-partners-safari-mobile/p3439165#reviews',
+    'https://www.johnlewis.com/john-lewis-partners-safari-mobile/p3439165?utm_source=google&utm_medium=cpc&gclid=abc',
+    ' https://www.johnlewis.com//john-lewis-partners-safari-mobile/p3439165?fbclid=123 '
+])
+def test_same_product(url):
+    assert urls.canonical_url(url) == CANONICAL
+
+
+def test_product_parameters_are_kept_and_sorted():
+    assert urls.canonical_url('https://www.shop.com/product?size=2&id=123&utm_campaign=sale') == 'shop.com/product?id=123&size=2'
+
+
+def test_different_products():
+    assert urls.canonical_url('https://www.shop.com/product?id=1') != urls.canonical_url('https://www.shop.com/product?id=2')
+    assert urls.canonical_url('https://www.shop.com/a') != urls.canonical_url('https://www.other.com/a')
+
+
+def test_path_case_is_kept():
+    assert urls.canonical_url('https://www.shop.com/Product/ABC') == 'shop.com/Product/ABC'
@@ -0,0 +1,71 @@
+# Overlaps independent dynamodb calls with asyncio, so a handler takes about as long as its longest chain of dependent
+# calls rather than the sum of all of them.  The boto3 clients are blocking, so each call runs on a shared thread pool.
+import asyncio
+import functools
+import threading
+from concurrent import futures
+from tools import config, limiter, logger
+
+log = logger.setup_logger()
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    global executor
+
+    with executor_lock:
+        if executor is None:
+            executor = futures.ThreadPoolExecutor(max_workers=config.get().aio_max_workers, thread_name_prefix='aio')
+
+    return executor
+
+
+async def call(work, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(limiter.in_context(work), *args, **kwargs))
+
+
+async def value(result):
+    return result
+
+
+async def gather(*awaitables):
+    # Every call is left to finish, then the first error in argument order is raised, so a handler fails the same
+    # way whichever call happens to complete first.
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+
+    return results
+
+
+async def gather_bounded(limit, work, keys):
+    # Runs work(key) for every key with at most limit running at once, e.g. so one request cannot take every thread.
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(key):
+        async with semaphore:
+            return await work(key)
+
+    return await gather(*[bounded(key) for key in keys])
+
+
+def run(work, *args):
+    return asyncio.run(work(*args))
+
+
+class Client:
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        operation = getattr(self._client, name)
+
+        async def call_operation(**kwargs):
+            return await call(operation, **kwargs)
+
+        return call_operation
@@ -1,27 +1,49 @@
 import json
-import boto3
-import os
 from datetime import datetime, timedelta
-from tools import common, logger
+from tools import common, config, deadline, lazy, logger
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
 
-dynamodb = boto3.client('dynamodb')
+dynamodb = common.lazy_client('dynamodb')
 
 
+@lazy.report_imports
 def handler(event, context):
     data = {}
-    lists_table = common.get_env_variable(os.environ, 'LISTS_TABLE_NAME')
-    products_table = common.get_env_variable(os.environ, 'PRODUCTS_TABLE_NAME')
-    retention_days = common.get_env_variable(os.environ, 'RETENTION_DAYS')
-
+    budget = deadline.Budget(context)
+    settings = config.get('LISTS_TABLE_NAME', 'PRODUCTS_TABLE_NAME', 'RETENTION_DAYS')
+    lists_table = settings.lists_table
+    products_table = settings.products_table
+    retention_days = settings.retention_days
+
+    # The schedule cannot pass a continuation token back, so a backup that is not created is reported as an error for
+    # the alarm.  A backup that runs out of time after it has started may still be created, so it is not retried.
+    not_created = []
     for table in [lists_table, products_table]:
-        create_backup(table)
-        delete_old_backups(table, retention_days)
+        try:
+            budget.call('create backup (' + table + ')', create_backup, table)
+        except deadline.BudgetExceeded:
+            not_created.append(table)
+            continue
+
         data[table] = True
 
+        # Old backups are removed on the next daily run if there is not enough time left.
+        if budget.low():
+            log.info("Budget is low, skipping deletion of old backups ({}).".format(table))
+            data.setdefault('skipped', []).append('delete old backups (' + table + ')')
+            continue
+
+        try:
+            budget.call('delete old backups (' + table + ')', delete_old_backups, table, retention_days, repeatable=True)
+        except deadline.BudgetExceeded as e:
+            data.setdefault('skipped', []).append(e.step)
+
+    if not_created:
+        raise Exception("Backups were not created for tables: {}.".format(", ".join(not_created)))
+
     response = common.create_response(200, json.dumps(data))
 
     return response
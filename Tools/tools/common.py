@@ -1,12 +1,45 @@
 # A collection of methods that are common across all modules.
+import base64
+import binascii
+import functools
 import json
-import boto3
-from datetime import datetime
-from tools import logger
+import queue
+import threading
+import time
+from concurrent import futures
+from datetime import datetime, timedelta, timezone
+from tools import config, lazy, limiter, logger
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
+# boto3 is only loaded when the first client is created, which keeps it out of the import phase of every handler.
+boto3 = lazy.Module('boto3')
+botocore_config = lazy.Module('botocore.config')
+
+# The most keys dynamodb accepts in one BatchGetItem request.
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+
+# Assumed role credentials are cached for the life of the container, and refreshed this many seconds before they expire.
+CREDENTIALS_REFRESH_SECONDS = 300
+
+credentials_cache = {}
+credentials_locks = {}
+credentials_lock = threading.Lock()
+
+# AWS clients are shared by all handlers in the container, so that connections are reused across invocations.
+clients = {}
+clients_lock = threading.Lock()
+
+# Pages of scan and query results are fetched ahead of the caller, and batches of keys are read, on these threads.
+page_executor = None
+page_executor_lock = threading.Lock()
+
+# Segments of a parallel scan are read on these threads, each with its own pages.
+segment_executor = None
+segment_executor_lock = threading.Lock()
+
 
 def currentTimestamp():
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -22,12 +55,12 @@ def get_env_variable(osenv, name):
     return variable
 
 
-def create_response(code, body):
+def create_response(code, body, content_type='application/json'):
     log.info("Creating response with status code ({}) and body ({})".format(code, body))
     response = {'statusCode': code,
                 'body': body,
                 'headers': {
-                    'Content-Type': 'application/json',
+                    'Content-Type': content_type,
                     'Access-Control-Allow-Origin': '*'
                 }}
     return response
@@ -56,16 +89,36 @@ def get_path_id(event):
     return id
 
 
-def new_product_details(event):
-    product = {}
+def get_query_parameter(event, name):
+    parameters = event.get('queryStringParameters') or {}
+    return parameters.get(name)
+
+
+def encode_token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
 
-    expected_keys = ["brand", "details", "retailer", "imageUrl", "productUrl", "price"]
 
+def decode_token(token, name):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise Exception(name + " was not valid.")
+
+
+def new_product_details(event):
     try:
         body = json.loads(event['body'])
     except Exception:
         raise Exception('API Event body did not exist.')
 
+    return product_details(body)
+
+
+def product_details(body):
+    product = {}
+
+    expected_keys = ["brand", "details", "retailer", "imageUrl", "productUrl", "price"]
+
     for key in expected_keys:
         if key in body:
             product[key] = body[key]
@@ -115,33 +168,321 @@ def cross_account_role_required(table_name, env):
         return False
 
 
+def client_config(service, read_timeout=None):
+    # The limiter retries throttled dynamodb calls with its own backoff, so botocore makes a single attempt, rather than
+    # retrying them before the limiter sees the throttle.  botocore's max_attempts does not count the first attempt.
+    settings = config.get()
+    retries = {'mode': settings.client_retry_mode}
+    if service == 'dynamodb':
+        retries['total_max_attempts'] = 1
+    else:
+        retries['max_attempts'] = settings.client_max_attempts
+
+    return botocore_config.Config(
+        max_pool_connections=settings.client_max_pool_connections,
+        connect_timeout=settings.client_connect_timeout,
+        read_timeout=read_timeout or settings.client_read_timeout,
+        tcp_keepalive=True,
+        retries=retries
+    )
+
+
+def get_client(service, account_id=None, region=None, credentials=None):
+    key = (service, account_id, region)
+
+    with clients_lock:
+        entry = clients.get(key)
+
+        if entry is None or (credentials is not None and entry['credentials'] is not credentials):
+            log.info("Creating {} client. Account: {} Region: {}.".format(service, account_id, region))
+            kwargs = {'region_name': region, 'config': client_config(service)}
+
+            if credentials is not None:
+                kwargs['aws_access_key_id'] = credentials['AccessKeyId']
+                kwargs['aws_secret_access_key'] = credentials['SecretAccessKey']
+                kwargs['aws_session_token'] = credentials['SessionToken']
+
+            client = boto3.client(service, **kwargs)
+
+            # All dynamodb calls go through the adaptive limiter for the tables they use, which also shortens the read
+            # timeout of calls made near the end of a budgeted step.
+            if service == 'dynamodb':
+                client = limiter.LimitedClient(client, functools.partial(create_timeout_client, service, kwargs), config.get().client_read_timeout)
+
+            entry = {'client': client, 'credentials': credentials}
+            clients[key] = entry
+
+    return entry['client']
+
+
+def create_timeout_client(service, kwargs, timeout):
+    log.info("Creating {} client with read timeout {}.".format(service, timeout))
+    return boto3.client(service, **dict(kwargs, config=client_config(service, read_timeout=timeout)))
+
+
+def lazy_client(service):
+    return lazy.Proxy(lambda: get_client(service))
+
+
+def get_role_arn(account_id, env):
+    return "arn:aws:iam::" + account_id + ":role/Tools-Service-Cross-Account-Exection-Role" + "-" + env
+
+
+def assume_role(role_arn):
+    sts_connection = get_client('sts')
+    response = sts_connection.assume_role(
+        RoleArn=role_arn,
+        RoleSessionName="cross_acct_lambda"
+    )
+
+    return response['Credentials']
+
+
+def credentials_expiring(credentials):
+    refresh_time = datetime.now(timezone.utc) + timedelta(seconds=CREDENTIALS_REFRESH_SECONDS)
+    return credentials['Expiration'] <= refresh_time
+
+
+def get_role_credentials(account_id, role_arn):
+    key = (account_id, role_arn)
+
+    with credentials_lock:
+        lock = credentials_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        credentials = credentials_cache.get(key)
+
+        if credentials is None or credentials_expiring(credentials):
+            log.info("Assuming role ({}) for account {}.".format(role_arn, account_id))
+            credentials = assume_role(role_arn)
+            credentials_cache[key] = credentials
+        else:
+            log.info("Using cached credentials for role ({}), which expire at {}.".format(role_arn, credentials['Expiration']))
+
+    return credentials
+
+
 def get_dynamodb_client(table_name, account_ids, role_prefix, env):
     if cross_account_role_required(table_name, env):
         log.info("Cross account role required to connect to table in different account. Environment: {} Table: {}.".format(env, table_name))
-        role_arn = "arn:aws:iam::" + account_ids[table_name] + ":role/Tools-Service-Cross-Account-Exection-Role" + "-" + env
+        role_arn = get_role_arn(account_ids[table_name], env)
 
         try:
-            sts_connection = boto3.client('sts')
-            acct_b = sts_connection.assume_role(
-                RoleArn=role_arn,
-                RoleSessionName="cross_acct_lambda"
-            )
-
-            ACCESS_KEY = acct_b['Credentials']['AccessKeyId']
-            SECRET_KEY = acct_b['Credentials']['SecretAccessKey']
-            SESSION_TOKEN = acct_b['Credentials']['SessionToken']
-
-            # create service client using the assumed role credentials, e.g. S3
-            client = boto3.client(
-                'dynamodb',
-                aws_access_key_id=ACCESS_KEY,
-                aws_secret_access_key=SECRET_KEY,
-                aws_session_token=SESSION_TOKEN,
-            )
-
-            return client
+            credentials = get_role_credentials(account_ids[table_name], role_arn)
         except ClientError as e:
             raise Exception("Error assuming role ({}): {}".format(role_arn, e))
+
+        # The client is rebuilt from the assumed role credentials only when they have been refreshed.
+        return get_client('dynamodb', account_id=account_ids[table_name], credentials=credentials)
     else:
         log.info("Returning simple dynamodb client. Environment: {} Table: {}.".format(env, table_name))
-        return boto3.client('dynamodb')
+        return get_client('dynamodb')
+
+
+def get_page_executor():
+    global page_executor
+
+    with page_executor_lock:
+        if page_executor is None:
+            page_executor = futures.ThreadPoolExecutor(max_workers=config.get().page_max_workers, thread_name_prefix='pages')
+
+    return page_executor
+
+
+def projection_arguments(projection, kwargs):
+    names = dict(kwargs.get('ExpressionAttributeNames', {}))
+    placeholders = []
+
+    for index, attribute in enumerate(projection):
+        placeholder = '#projection' + str(index)
+        names[placeholder] = attribute
+        placeholders.append(placeholder)
+
+    return {'ProjectionExpression': ', '.join(placeholders), 'ExpressionAttributeNames': names}
+
+
+def pages(client, operation, page_size=None, projection=None, max_items=None, **kwargs):
+    # Follows LastEvaluatedKey, requesting the next page while the caller works on the current one.
+    call = getattr(client, operation)
+    if projection:
+        kwargs.update(projection_arguments(projection, kwargs))
+
+    def fetch(start_key, remaining):
+        arguments = dict(kwargs)
+        limits = [limit for limit in [page_size, remaining] if limit is not None]
+        if limits:
+            arguments['Limit'] = min(limits)
+        if start_key:
+            arguments['ExclusiveStartKey'] = start_key
+
+        return call(**arguments)
+
+    remaining = max_items
+    future = get_page_executor().submit(limiter.in_context(fetch), None, remaining)
+
+    while future is not None:
+        page = future.result()
+
+        if remaining is not None:
+            remaining -= page['Count']
+
+        future = None
+        if 'LastEvaluatedKey' in page and (remaining is None or remaining > 0):
+            future = get_page_executor().submit(limiter.in_context(fetch), page['LastEvaluatedKey'], remaining)
+
+        log.info("{} page returned {} items. More pages: {}.".format(operation, page['Count'], future is not None))
+
+        yield page
+
+
+def paginate(client, operation, page_size=None, projection=None, max_items=None, **kwargs):
+    for page in pages(client, operation, page_size=page_size, projection=projection, max_items=max_items, **kwargs):
+        for item in page['Items']:
+            yield item
+
+
+def get_segment_executor():
+    global segment_executor
+
+    with segment_executor_lock:
+        if segment_executor is None:
+            segment_executor = futures.ThreadPoolExecutor(max_workers=config.get().scan_max_segments, thread_name_prefix='segments')
+
+    return segment_executor
+
+
+def count_segments(client, table_name):
+    # Sized from the approximate item count, which dynamodb updates every six hours, so small tables use a single scan.
+    settings = config.get()
+
+    try:
+        item_count = client.describe_table(TableName=table_name)['Table']['ItemCount']
+    except ClientError as e:
+        log.info("Could not describe table {}, counting with one segment. Exception: {}".format(table_name, e))
+        return 1
+
+    segments = -(-item_count // settings.scan_segment_items)
+
+    return max(1, min(settings.scan_max_segments, segments))
+
+
+def scan_segments(client, table_name, segments, **kwargs):
+    # Pages are yielded as soon as any segment returns them, so their order across segments is not fixed.
+    if segments == 1:
+        yield from pages(client, 'scan', TableName=table_name, **kwargs)
+        return
+
+    results = queue.Queue()
+
+    def scan_segment(segment):
+        try:
+            for page in pages(client, 'scan', TableName=table_name, Segment=segment, TotalSegments=segments, **kwargs):
+                results.put(page)
+            results.put(None)
+        except Exception as e:
+            results.put(e)
+
+    for segment in range(segments):
+        get_segment_executor().submit(limiter.in_context(scan_segment), segment)
+
+    finished = 0
+    while finished < segments:
+        result = results.get()
+
+        if result is None:
+            finished += 1
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            yield result
+
+
+def scan_segment_pages(client, table_name, segments, start_keys, limit=None, **kwargs):
+    # Reads one page of each segment in start_keys in parallel, from its start key or from the start of the segment if
+    # the key is None.  Callers that page through a table across invocations keep the last key of each segment.
+    def scan_segment(segment):
+        arguments = dict(kwargs, TableName=table_name)
+        if segments > 1:
+            arguments.update(Segment=segment, TotalSegments=segments)
+        if limit:
+            arguments['Limit'] = limit
+        if start_keys[segment]:
+            arguments['ExclusiveStartKey'] = start_keys[segment]
+
+        return client.scan(**arguments)
+
+    ordered = sorted(start_keys)
+
+    return dict(zip(ordered, get_segment_executor().map(limiter.in_context(scan_segment), ordered)))
+
+
+def count_items(client, table_name, segments=None, **kwargs):
+    if segments is None:
+        segments = count_segments(client, table_name)
+
+    count = sum(page['Count'] for page in scan_segments(client, table_name, segments, Select='COUNT', **kwargs))
+    log.info("Counted {} items in table {} with {} segments.".format(count, table_name, segments))
+
+    return count
+
+
+def batch_get_items(client, table_name, keys, projection=None, consistent=False):
+    # Reads the keys in batches of up to 100 in parallel, retrying any unprocessed keys with backoff.
+    arguments = {}
+    if projection:
+        arguments = projection_arguments(projection, {})
+    if consistent:
+        arguments['ConsistentRead'] = True
+
+    def get_batch(batch):
+        items = []
+        request = {table_name: dict(arguments, Keys=batch)}
+        attempts = config.get().limiter_max_attempts
+
+        for attempt in range(attempts):
+            response = client.batch_get_item(RequestItems=request)
+            items.extend(response['Responses'].get(table_name, []))
+
+            request = response.get('UnprocessedKeys')
+            if not request:
+                return items
+
+            log.info("{} keys were not processed, retrying.".format(len(request[table_name]['Keys'])))
+            time.sleep(limiter.backoff(attempt))
+
+        raise Exception("Keys were still unprocessed after {} attempts.".format(attempts))
+
+    # A request cannot ask for the same key twice.
+    unique_keys = list({json.dumps(key, sort_keys=True): key for key in keys}.values())
+    batches = [unique_keys[i:i + BATCH_GET_SIZE] for i in range(0, len(unique_keys), BATCH_GET_SIZE)]
+    results = list(get_page_executor().map(limiter.in_context(get_batch), batches))
+
+    return [item for items in results for item in items]
+
+
+def batch_write_items(client, table_name, puts=(), deletes=()):
+    # Writes in batches of up to 25 in parallel, retrying any unprocessed requests with backoff.  Batch writes cannot be
+    # conditional, and the requests still unprocessed after the last attempt are returned rather than raised, so the
+    # caller can report which items failed.
+    def write_batch(batch):
+        request = {table_name: batch}
+        attempts = config.get().limiter_max_attempts
+
+        for attempt in range(attempts):
+            response = client.batch_write_item(RequestItems=request)
+
+            request = response.get('UnprocessedItems')
+            if not request:
+                return []
+
+            log.info("{} requests were not processed, retrying.".format(len(request[table_name])))
+            time.sleep(limiter.backoff(attempt))
+
+        log.error("{} requests were still unprocessed after {} attempts.".format(len(request[table_name]), attempts))
+        return request[table_name]
+
+    requests = [{'PutRequest': {'Item': item}} for item in puts] + [{'DeleteRequest': {'Key': key}} for key in deletes]
+    batches = [requests[i:i + BATCH_WRITE_SIZE] for i in range(0, len(requests), BATCH_WRITE_SIZE)]
+    results = list(get_page_executor().map(limiter.in_context(write_batch), batches))
+
+    return [request for unprocessed in results for request in unprocessed]
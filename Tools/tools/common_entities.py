@@ -10,6 +10,12 @@ class Notfound:
             self.price = item.get('price').get('S')
         if item.get('imageUrl'):
             self.imageUrl = item.get('imageUrl').get('S')
+        if item.get('viewUpdatedAt'):
+            self.listId = item.get('listId').get('S')
+            self.creatorsName = item.get('creatorsName').get('S')
+            self.listTitle = item.get('listTitle').get('S')
+        if item.get('canonicalUrl'):
+            self.canonicalUrl = item.get('canonicalUrl').get('S')
 
     def __repr__(self):
         return "Product<{} -- {} -- {} -- {} -- {}>".format(self.productId, self.brand, self.details, self.productUrl, self.createdBy)
@@ -29,6 +35,14 @@ class Notfound:
         if hasattr(self, 'imageUrl'):
             product['imageUrl'] = self.imageUrl
 
+        if hasattr(self, 'listTitle'):
+            product['listId'] = self.listId
+            product['creatorsName'] = self.creatorsName
+            product['listTitle'] = self.listTitle
+
+        if hasattr(self, 'canonicalUrl'):
+            product['canonicalUrl'] = self.canonicalUrl
+
         return product
 
 
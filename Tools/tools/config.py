@@ -0,0 +1,189 @@
+# Configuration for the tools functions, read from the environment once per container.
+import os
+import threading
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, NamedTuple, Optional
+from tools import logger
+
+log = logger.setup_logger()
+
+ENVIRONMENTS = ('test', 'staging', 'prod')
+
+# Environment variables required by each group of handlers.
+PRODUCTS_VARIABLES = (
+    'ENVIRONMENT',
+    'CROSS_ACCOUNT_ROLE',
+    'PRODUCTS_TEST_TABLE_NAME',
+    'PRODUCTS_STAGING_TABLE_NAME',
+    'PRODUCTS_PROD_TABLE_NAME',
+    'ACCOUNT_ID_TEST',
+    'ACCOUNT_ID_STAGING',
+    'ACCOUNT_ID_PROD'
+)
+CHECK_VARIABLES = PRODUCTS_VARIABLES + ('PRIMARY_ENVIRONMENT', 'UPDATE_ENVIRONMENTS')
+TABLE_VARIABLES = ('PRODUCTS_TABLE_NAME', 'NOTFOUND_TABLE_NAME', 'LISTS_TABLE_NAME')
+
+
+class Config(NamedTuple):
+    environment: Optional[str]
+    cross_account_role: Optional[str]
+    products_table: Optional[str]
+    notfound_table: Optional[str]
+    lists_table: Optional[str]
+    product_tables: Mapping[str, str]
+    table_accounts: Mapping[str, str]
+    primary_environment: Optional[str]
+    update_environments: Optional[str]
+    topic_arn: Optional[str]
+    retention_days: Optional[int]
+    client_max_pool_connections: int
+    client_connect_timeout: float
+    client_read_timeout: float
+    client_retry_mode: str
+    client_max_attempts: int
+    fanout_max_workers: int
+    fanout_timeout: float
+    function_name: str
+    prewarm_timeout: float
+    aio_max_workers: int
+    page_max_workers: int
+    resolve_max_lists: int
+    bulk_max_products: int
+    scan_max_segments: int
+    scan_segment_items: int
+    list_default_limit: int
+    list_max_limit: int
+    export_page_items: int
+    count_mode: str
+    enrichment_cache_size: int
+    enrichment_cache_ttl: float
+    import_budget_ms: float
+    limiter_rate: float
+    limiter_min_rate: float
+    limiter_max_rate: float
+    limiter_max_attempts: int
+    limiter_backoff_base: float
+    limiter_backoff_cap: float
+    budget_reserve_ms: float
+    budget_low_ms: float
+    budget_default_ms: float
+    budget_max_workers: int
+    missing: FrozenSet[str]
+
+    def require(self, *names):
+        for name in names:
+            if name in self.missing:
+                raise Exception(name + ' environment variable not set correctly.')
+
+        return self
+
+
+config = None
+config_lock = threading.Lock()
+
+
+def get(*names):
+    global config
+
+    if config is None:
+        with config_lock:
+            if config is None:
+                config = load(os.environ)
+
+    return config.require(*names)
+
+
+def reset():
+    global config
+    config = None
+
+
+def load(osenv):
+    missing = set()
+
+    def variable(name):
+        if name not in osenv:
+            missing.add(name)
+            return None
+        return osenv[name]
+
+    def setting(name, default, convert):
+        try:
+            return convert(osenv.get(name, default))
+        except ValueError:
+            raise Exception(name + ' environment variable not set correctly.')
+
+    product_tables = {}
+    table_accounts = {}
+    for env in ENVIRONMENTS:
+        table = variable('PRODUCTS_' + env.upper() + '_TABLE_NAME')
+        account = variable('ACCOUNT_ID_' + env.upper())
+        if table is not None:
+            product_tables[env] = table
+            if account is not None:
+                table_accounts[table] = account
+
+    primary_environment = variable('PRIMARY_ENVIRONMENT')
+    if primary_environment is not None and primary_environment not in ENVIRONMENTS:
+        raise Exception('PRIMARY_ENVIRONMENT environment variable not set correctly.')
+
+    update_environments = variable('UPDATE_ENVIRONMENTS')
+    if update_environments is not None:
+        for env in update_environments.split(","):
+            if env not in ENVIRONMENTS:
+                raise Exception('UPDATE_ENVIRONMENTS environment variable not set correctly.')
+
+    retention_days = variable('RETENTION_DAYS')
+    if retention_days is not None:
+        retention_days = setting('RETENTION_DAYS', None, int)
+
+    loaded = Config(
+        environment=variable('ENVIRONMENT'),
+        cross_account_role=variable('CROSS_ACCOUNT_ROLE'),
+        products_table=variable('PRODUCTS_TABLE_NAME'),
+        notfound_table=variable('NOTFOUND_TABLE_NAME'),
+        lists_table=variable('LISTS_TABLE_NAME'),
+        product_tables=MappingProxyType(product_tables),
+        table_accounts=MappingProxyType(table_accounts),
+        primary_environment=primary_environment,
+        update_environments=update_environments,
+        topic_arn=variable('TOPIC_ARN'),
+        retention_days=retention_days,
+        client_max_pool_connections=setting('CLIENT_MAX_POOL_CONNECTIONS', '10', int),
+        client_connect_timeout=setting('CLIENT_CONNECT_TIMEOUT', '1', float),
+        client_read_timeout=setting('CLIENT_READ_TIMEOUT', '2', float),
+        client_retry_mode=setting('CLIENT_RETRY_MODE', 'standard', str),
+        client_max_attempts=setting('CLIENT_MAX_ATTEMPTS', '3', int),
+        fanout_max_workers=setting('FANOUT_MAX_WORKERS', '3', int),
+        fanout_timeout=setting('FANOUT_TIMEOUT_SECONDS', '2.5', float),
+        function_name=setting('AWS_LAMBDA_FUNCTION_NAME', '', str),
+        prewarm_timeout=setting('PREWARM_TIMEOUT_SECONDS', '2', float),
+        aio_max_workers=setting('AIO_MAX_WORKERS', '10', int),
+        page_max_workers=setting('PAGE_MAX_WORKERS', '8', int),
+        resolve_max_lists=setting('RESOLVE_MAX_LISTS', '4', int),
+        bulk_max_products=setting('BULK_MAX_PRODUCTS', '200', int),
+        scan_max_segments=setting('SCAN_MAX_SEGMENTS', '8', int),
+        scan_segment_items=setting('SCAN_SEGMENT_ITEMS', '5000', int),
+        list_default_limit=setting('LIST_DEFAULT_LIMIT', '100', int),
+        list_max_limit=setting('LIST_MAX_LIMIT', '1000', int),
+        export_page_items=setting('EXPORT_PAGE_ITEMS', '2000', int),
+        count_mode=setting('COUNT_MODE', '', str),
+        enrichment_cache_size=setting('ENRICHMENT_CACHE_SIZE', '1000', int),
+        enrichment_cache_ttl=setting('ENRICHMENT_CACHE_TTL_SECONDS', '300', float),
+        import_budget_ms=setting('IMPORT_BUDGET_MS', '500', float),
+        limiter_rate=setting('LIMITER_RATE', '100', float),
+        limiter_min_rate=setting('LIMITER_MIN_RATE', '1', float),
+        limiter_max_rate=setting('LIMITER_MAX_RATE', '1000', float),
+        limiter_max_attempts=setting('LIMITER_MAX_ATTEMPTS', '5', int),
+        limiter_backoff_base=setting('LIMITER_BACKOFF_BASE', '0.05', float),
+        limiter_backoff_cap=setting('LIMITER_BACKOFF_CAP', '1', float),
+        budget_reserve_ms=setting('BUDGET_RESERVE_MS', '300', float),
+        budget_low_ms=setting('BUDGET_LOW_MS', '1000', float),
+        budget_default_ms=setting('BUDGET_DEFAULT_MS', '30000', float),
+        budget_max_workers=setting('BUDGET_MAX_WORKERS', '2', int),
+        missing=frozenset(missing)
+    )
+
+    log.info("Configuration loaded from environment: {}".format(loaded._replace(missing=sorted(missing))))
+
+    return loaded
@@ -0,0 +1,123 @@
+# Keeps the number of items in the notfound table in a counter item, so it can be read with a single GetItem instead
+# of a scan.  The notfound_view stream consumer adjusts the counter as items are created and deleted, and a recount
+# repairs any drift.  Where the consumer is not deployed, COUNT_MODE=exact makes every count a recount.
+from tools import common, config, logger
+from botocore.exceptions import ClientError
+
+log = logger.setup_logger()
+
+COUNTER_ID = 'COUNTER#items'
+COUNT_ATTRIBUTE = 'itemCount'
+ADDED_ATTRIBUTE = 'addedCount'
+EXACT = 'exact'
+
+
+def counter_key():
+    return {'productId': {'S': COUNTER_ID}}
+
+
+def exclude_counter():
+    # Scan arguments which leave the counter item out of the results.
+    return {
+        'FilterExpression': 'productId <> :counterId',
+        'ExpressionAttributeValues': {':counterId': {'S': COUNTER_ID}}
+    }
+
+
+def get_mode(event):
+    mode = event.get('mode') or common.get_query_parameter(event, 'mode') or config.get().count_mode or None
+
+    if mode not in [None, EXACT]:
+        raise Exception("Count mode {} is not supported.".format(mode))
+
+    return mode
+
+
+def get_count(client, table_name):
+    try:
+        response = client.get_item(TableName=table_name, Key=counter_key(), ConsistentRead=True)
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting item count from table.")
+
+    # The counter item also holds other state, such as the enrichment cache generation, so it can exist without a count.
+    if COUNT_ATTRIBUTE not in response.get('Item', {}):
+        log.info("No counter item in table {}.".format(table_name))
+        return None
+
+    # A count below zero can only be drift, so it is treated as missing and the items are recounted.
+    count = int(response['Item'][COUNT_ATTRIBUTE]['N'])
+    if count < 0:
+        log.error("Counter in table {} has drifted below zero ({}).".format(table_name, count))
+        return None
+
+    return count
+
+
+def set_count(client, table_name, count):
+    # Other attributes of the counter item, such as the count at the last alert, are kept.
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key=counter_key(),
+            UpdateExpression="SET " + COUNT_ATTRIBUTE + " = :count, countedAt = :countedAt",
+            ExpressionAttributeValues={':count': {'N': str(count)}, ':countedAt': {'S': common.currentTimestamp()}}
+        )
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem saving item count to table.")
+
+    return count
+
+
+def adjust(client, table_name, delta):
+    # Only an existing counter is adjusted, as a new one would start from the wrong number.  It is created by a recount.
+    # Items added are also counted on their own, which only grows, so a change is seen even when as many are deleted.
+    update = "ADD " + COUNT_ATTRIBUTE + " :delta"
+    if delta > 0:
+        update += ", " + ADDED_ATTRIBUTE + " :delta"
+
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key=counter_key(),
+            UpdateExpression=update,
+            ConditionExpression="attribute_exists(" + COUNT_ATTRIBUTE + ")",
+            ExpressionAttributeValues={':delta': {'N': str(delta)}}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == "ConditionalCheckFailedException":
+            log.info("No counter item in table {} to adjust.".format(table_name))
+        else:
+            log.error("Counter could not be adjusted by {}. Exception: {}".format(delta, e))
+
+        return False
+
+    log.info("Counter in table {} adjusted by {}.".format(table_name, delta))
+
+    return True
+
+
+def count_items(client, table_name, segments=None):
+    return common.count_items(client, table_name, segments=segments, **exclude_counter())
+
+
+def recount(client, table_name):
+    try:
+        count = count_items(client, table_name)
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem counting items in table.")
+
+    log.info("Recounted {} items in table {}.".format(count, table_name))
+
+    return set_count(client, table_name, count)
+
+
+def get_or_recount(client, table_name, exact=False):
+    count = None if exact else get_count(client, table_name)
+
+    if count is None:
+        count = recount(client, table_name)
+
+    return count
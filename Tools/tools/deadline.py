@@ -0,0 +1,137 @@
+# Keeps handlers within the lambda timeout, by giving each call a share of the remaining time and stopping with a
+# partial result and continuation token when the time runs out.
+import json
+import threading
+import time
+from concurrent import futures
+from tools import common, config, limiter, logger
+
+log = logger.setup_logger()
+
+# The executor is shared by all invocations in the container.  A step that ran out of time keeps its thread until it
+# finishes, so while any is still running the executor is replaced rather than reused, and the steps of the next
+# invocation are not left waiting behind it.
+executor = None
+executor_lock = threading.Lock()
+stuck = set()
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, step):
+        super().__init__("Not enough time left to complete step: " + step + ".")
+        self.step = step
+
+
+def get_executor():
+    global executor
+
+    with executor_lock:
+        running = [future for future in stuck if not future.done()]
+        stuck.clear()
+
+        if executor is not None and running:
+            log.info("{} steps that ran out of time are still running, starting a new executor.".format(len(running)))
+            executor.shutdown(wait=False)
+            executor = None
+
+        if executor is None:
+            executor = futures.ThreadPoolExecutor(max_workers=config.get().budget_max_workers, thread_name_prefix='budget')
+
+    return executor
+
+
+class Budget:
+    def __init__(self, context):
+        settings = config.get()
+        self.reserve_ms = settings.budget_reserve_ms
+        self.low_ms = settings.budget_low_ms
+
+        # Without a lambda context, e.g. when invoked locally, assume the default function timeout.
+        if context is not None:
+            self.remaining_ms = context.get_remaining_time_in_millis
+        else:
+            deadline = time.monotonic() + settings.budget_default_ms / 1000
+            self.remaining_ms = lambda: max(0, (deadline - time.monotonic()) * 1000)
+
+    def __repr__(self):
+        return "Budget<{}ms available>".format(int(self.available_ms()))
+
+    def available_ms(self):
+        return max(0, self.remaining_ms() - self.reserve_ms)
+
+    def exhausted(self):
+        return self.available_ms() <= 0
+
+    def low(self):
+        return self.available_ms() < self.low_ms
+
+    def timeout(self, maximum=None):
+        seconds = self.available_ms() / 1000
+        if maximum is not None:
+            seconds = min(seconds, maximum)
+
+        return seconds
+
+    def check(self, step):
+        if self.exhausted():
+            log.error("Budget exhausted before step: {}.".format(step))
+            raise BudgetExceeded(step)
+
+    def require(self, step):
+        if self.low():
+            log.error("Budget too low to start step: {}.".format(step))
+            raise BudgetExceeded(step)
+
+    def call(self, step, work, *args, repeatable=False):
+        # Work that has started cannot be stopped, so a step that runs out of time only raises BudgetExceeded, and is
+        # given a continuation, when it never started or is safe to run again while the first attempt may still finish.
+        # The dynamodb calls of the step are given no more than the time left before its deadline.
+        self.check(step)
+
+        timeout = self.timeout()
+        step_deadline = time.monotonic() + timeout
+
+        def run_step():
+            limiter.call_deadline.set(step_deadline)
+            return work(*args)
+
+        future = get_executor().submit(limiter.in_context(run_step))
+        try:
+            return future.result(timeout=timeout)
+        except futures.TimeoutError:
+            log.error("Step {} did not complete within {} seconds.".format(step, timeout))
+            cancelled = future.cancel()
+            if not cancelled:
+                with executor_lock:
+                    stuck.add(future)
+
+            if cancelled or repeatable:
+                raise BudgetExceeded(step)
+
+            raise Exception("Step {} did not complete in time, and may still complete.".format(step))
+
+
+def encode_token(state):
+    return common.encode_token(state)
+
+
+def decode_token(token):
+    return common.decode_token(token, "Continuation token")
+
+
+def get_continuation(event):
+    token = event.get('continuation') or common.get_query_parameter(event, 'continuation')
+
+    if token is None:
+        return None
+
+    return decode_token(token)
+
+
+def partial_response(data, step, state):
+    data['partial'] = True
+    data['stoppedAt'] = step
+    data['continuation'] = encode_token(state)
+    log.info("Returning partial result, stopped at step: {}.".format(step))
+
+    return common.create_response(202, json.dumps(data))
@@ -0,0 +1,212 @@
+# Creator names and list titles used to enrich notfound items, cached in the container.  An operator working through a
+# queue of items usually sees the same few users and lists, so repeat lookups are answered without calling dynamodb.
+# Each container has its own cache, so a rename is made known to all of them with a generation number on the notfound
+# counter item, which the notfound_view function increments.  A lookup reads the generation, and a container whose cache
+# is from an earlier generation starts a new one.  Entries also expire after ENRICHMENT_CACHE_TTL_SECONDS.
+import threading
+import time
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+from tools import aio, common, config, counter, logger
+
+log = logger.setup_logger()
+
+GENERATION_ATTRIBUTE = 'enrichmentGeneration'
+
+
+class Cache:
+    def __init__(self, max_size, ttl, generation=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = generation
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                self.entries.pop(key, None)
+                return False, None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.entries)}
+
+
+cache = None
+cache_lock = threading.Lock()
+
+
+def get_cache(generation=None):
+    global cache
+
+    with cache_lock:
+        if cache is not None and generation is not None and cache.generation != generation:
+            log.info("Enrichment cache is from generation {}, starting generation {}.".format(cache.generation, generation))
+            cache = None
+
+        if cache is None:
+            settings = config.get()
+            cache = Cache(settings.enrichment_cache_size, settings.enrichment_cache_ttl, generation)
+
+    return cache
+
+
+def reset():
+    global cache
+    cache = None
+
+
+def get_generation(client, notfound_table):
+    try:
+        response = client.get_item(TableName=notfound_table, Key=counter.counter_key(), ProjectionExpression=GENERATION_ATTRIBUTE)
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting enrichment generation from table.")
+
+    return int(response.get('Item', {}).get(GENERATION_ATTRIBUTE, {}).get('N', '0'))
+
+
+def invalidate(client, notfound_table):
+    # Called when a user or list is renamed, so every container reads names and titles from the table again.
+    try:
+        client.update_item(
+            TableName=notfound_table,
+            Key=counter.counter_key(),
+            UpdateExpression="ADD " + GENERATION_ATTRIBUTE + " :one",
+            ExpressionAttributeValues={':one': {'N': '1'}}
+        )
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem invalidating enrichment caches.")
+
+    log.info("Enrichment caches invalidated.")
+
+    return True
+
+
+def lookup(client, table_name, user_ids=(), lists=(), cached=True, generation=None):
+    # Returns the names of the users and the titles of the lists, given as (list id, owner's user id) pairs.  Anything
+    # not in the cache is read with one batched read, and anything missing from the table is cached as None.  Without
+    # cached, everything is read from the table, e.g. when the result is to be stored.  The cache is only used if it is
+    # from the given generation.
+    cache = get_cache(generation)
+    names = {}
+    titles = {}
+    keys = []
+
+    for user_id in set(user_ids):
+        # Items without a creator have no name, and their list has no key to read its title with.
+        if user_id is None:
+            names[user_id] = None
+            continue
+
+        found, names[user_id] = cache.get('USER#' + user_id) if cached else (False, None)
+        if not found:
+            keys.append({'PK': {'S': 'USER#' + user_id}, 'SK': {'S': 'USER#' + user_id}})
+
+    for list_id, user_id in set(lists):
+        if user_id is None:
+            titles[list_id] = None
+            continue
+
+        found, titles[list_id] = cache.get('LIST#' + list_id) if cached else (False, None)
+        if not found:
+            keys.append({'PK': {'S': 'LIST#' + list_id}, 'SK': {'S': 'USER#' + user_id}})
+
+    if keys:
+        items = common.batch_get_items(client, table_name, keys, projection=['PK', 'name', 'title'])
+        values = {item['PK']['S']: item for item in items}
+
+        for key in keys:
+            pk = key['PK']['S']
+            item = values.get(pk, {})
+
+            if pk.startswith('USER#'):
+                value = item.get('name', {}).get('S')
+                names[pk.split('#', 1)[1]] = value
+            else:
+                value = item.get('title', {}).get('S')
+                titles[pk.split('#', 1)[1]] = value
+
+            cache.put(pk, value)
+
+    log.info("Enrichment lookup read {} keys. Cache: {}".format(len(keys), cache.stats()))
+
+    return names, titles
+
+
+def get_list_id(client, table_name, product_id):
+    items = list(common.paginate(
+        client,
+        'query',
+        max_items=1,
+        projection=['PK'],
+        TableName=table_name,
+        IndexName='SK-index',
+        KeyConditionExpression="SK = :SK",
+        ExpressionAttributeValues={":SK":  {'S': "PRODUCT#{}".format(product_id)}}
+    ))
+
+    if len(items) == 0:
+        return None
+
+    return items[0]['PK']['S'].split("#")[1]
+
+
+async def get_list_ids(client, table_name, product_ids):
+    # The lists of all of the products are queried on the SK index at the same time.
+    product_ids = list(product_ids)
+    list_ids = await aio.gather(*[aio.call(get_list_id, client, table_name, product_id) for product_id in product_ids])
+
+    return dict(zip(product_ids, list_ids))
+
+
+async def get_list_ids_and_generation(client, table_name, notfound_table, product_ids):
+    if notfound_table is None:
+        return await get_list_ids(client, table_name, product_ids), None
+
+    return await aio.gather(get_list_ids(client, table_name, product_ids), aio.call(get_generation, client, notfound_table))
+
+
+def enrich(client, table_name, products, notfound_table=None):
+    # Adds the list, creator's name and list title to each product, as returned by notfound_get, with one round of
+    # queries for the lists and the cache generation, and one round of batched reads for the names and titles.
+    # Products that already hold them, from the notfound_view stream consumer, are left as they are.
+    pending = [product for product in products if 'listTitle' not in product]
+    if len(pending) == 0:
+        return products
+
+    product_ids = set(product['productId'] for product in pending)
+    list_ids, generation = aio.run(get_list_ids_and_generation, client, table_name, notfound_table, product_ids)
+
+    users = set(product.get('createdBy') for product in pending)
+    lists = set((list_ids[product['productId']], product.get('createdBy')) for product in pending if list_ids[product['productId']])
+    names, titles = lookup(client, table_name, users, lists, generation=generation)
+
+    for product in pending:
+        list_id = list_ids[product['productId']]
+        product['listId'] = list_id
+        product['creatorsName'] = names[product.get('createdBy')]
+        product['listTitle'] = titles[list_id] if list_id else 'Unknown'
+
+    return products
@@ -0,0 +1,63 @@
+# Runs the same piece of work for several environments concurrently, e.g. a product update in test, staging and prod.
+import threading
+import time
+from concurrent import futures
+from tools import config, logger
+
+log = logger.setup_logger()
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+TIMED_OUT = 'timed out'
+
+# The executor is shared by all invocations in the container, so threads are only started once.  Work that timed out
+# keeps its thread until it finishes, so while any is still running the executor is replaced rather than reused, and
+# the work of the next invocation is not left waiting behind it.
+executor = None
+executor_lock = threading.Lock()
+stuck = set()
+
+
+def get_executor():
+    global executor
+
+    with executor_lock:
+        running = [future for future in stuck if not future.done()]
+        stuck.clear()
+
+        if executor is not None and running:
+            log.info("{} timed out calls are still running, starting a new executor.".format(len(running)))
+            executor.shutdown(wait=False)
+            executor = None
+
+        if executor is None:
+            executor = futures.ThreadPoolExecutor(max_workers=config.get().fanout_max_workers, thread_name_prefix='fanout')
+
+    return executor
+
+
+def run(work, keys, timeout=None):
+    if timeout is None:
+        timeout = config.get().fanout_timeout
+
+    deadline = time.monotonic() + timeout
+    pending = {}
+    for key in keys:
+        pending[key] = get_executor().submit(work, key)
+
+    outcomes = {}
+    for key, future in pending.items():
+        try:
+            outcomes[key] = (SUCCEEDED, future.result(timeout=max(0, deadline - time.monotonic())))
+        except futures.TimeoutError:
+            # Work that has started cannot be cancelled, and may still complete after it is reported as timed out.
+            if not future.cancel():
+                with executor_lock:
+                    stuck.add(future)
+            log.error("Work for {} did not complete within {} seconds.".format(key, timeout))
+            outcomes[key] = (TIMED_OUT, None)
+        except Exception as e:
+            log.error("Work for {} failed. Exception: {}".format(key, e))
+            outcomes[key] = (FAILED, e)
+
+    return outcomes
@@ -0,0 +1,85 @@
+# Defers loading heavy modules and creating clients until they are first used, and reports what that cost.
+import functools
+import importlib
+import threading
+import time
+from tools import config, logger
+
+log = logger.setup_logger()
+
+# Milliseconds spent importing each lazily loaded module, in the order they were loaded.
+import_times = {}
+import_lock = threading.Lock()
+
+
+def timed_import(name):
+    with import_lock:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        if name not in import_times:
+            import_times[name] = round((time.perf_counter() - start) * 1000, 1)
+            log.info("Imported {} in {}ms.".format(name, import_times[name]))
+
+    return module
+
+
+class Proxy:
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+class Module(Proxy):
+    def __init__(self, name):
+        super().__init__(lambda: timed_import(name))
+        self._name = name
+
+    def __repr__(self):
+        return "LazyModule<{}>".format(self._name)
+
+
+def import_report(handler_name):
+    total = round(sum(import_times.values()), 1)
+    budget = config.get().import_budget_ms
+
+    report = {
+        'handler': handler_name,
+        'imports': dict(import_times),
+        'total_ms': total,
+        'budget_ms': budget,
+        'over_budget': total > budget
+    }
+
+    if report['over_budget']:
+        log.warning("Import time budget exceeded: {}".format(report))
+    else:
+        log.info("Import time report: {}".format(report))
+
+    return report
+
+
+def report_imports(handler):
+    reported = []
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        try:
+            return handler(event, context)
+        finally:
+            if not reported:
+                reported.append(True)
+                import_report(handler.__module__)
+
+    return wrapper
@@ -0,0 +1,207 @@
+# Adaptive rate limiting for dynamodb calls, so parallel work backs off when a table is throttling and speeds up when it is not.
+import contextvars
+import math
+import random
+import threading
+import time
+from tools import config, logger
+from botocore.exceptions import ClientError
+
+log = logger.setup_logger()
+
+THROTTLING_ERRORS = ['ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded']
+
+# The rate is halved when a table throttles, and grows by a fixed step for each successful call.
+DECREASE_FACTOR = 0.5
+INCREASE_STEP = 1.0
+
+# Client methods that do not call dynamodb.
+UNLIMITED_METHODS = ['can_paginate', 'close', 'generate_presigned_url', 'get_paginator', 'get_waiter']
+
+# The deadline of the budgeted step a call is made for.  Calls made before it get no more than the time left as their
+# read timeout, and are not retried after it, so the work of a step that ran out of time stops soon after.  Shorter
+# timeouts are rounded up to this step, so only a few clients are created for them.
+call_deadline = contextvars.ContextVar('call_deadline', default=None)
+TIMEOUT_STEP = 0.25
+
+
+class AdaptiveLimiter:
+    def __init__(self, rate, min_rate, max_rate):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.throttles = 0
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return "AdaptiveLimiter<rate {:.1f}/s -- throttles {}>".format(self.rate, self.throttles)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self.burst = max(1.0, self.rate)
+            self.tokens = min(self.tokens, self.burst)
+            self.throttles += 1
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + INCREASE_STEP)
+            self.burst = max(1.0, self.rate)
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def remaining():
+    deadline = call_deadline.get()
+    if deadline is None:
+        return None
+
+    return deadline - time.monotonic()
+
+
+def read_timeout(default):
+    left = remaining()
+    if left is None or left >= default:
+        return None
+
+    return max(TIMEOUT_STEP, math.ceil(left / TIMEOUT_STEP) * TIMEOUT_STEP)
+
+
+def in_context(work):
+    # Executor threads do not inherit the caller's context, so the work runs in a copy of it, with the same deadline.
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(work, *args, **kwargs)
+
+    return run
+
+
+def get_limiter(table_name):
+    with limiters_lock:
+        if table_name not in limiters:
+            settings = config.get()
+            limiters[table_name] = AdaptiveLimiter(settings.limiter_rate, settings.limiter_min_rate, settings.limiter_max_rate)
+
+        return limiters[table_name]
+
+
+def backoff(attempt):
+    settings = config.get()
+    ceiling = min(settings.limiter_backoff_cap, settings.limiter_backoff_base * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def is_throttling_error(e):
+    return isinstance(e, ClientError) and e.response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+
+def call(table_names, operation, **kwargs):
+    table_limiters = [get_limiter(table_name) for table_name in table_names]
+    attempts = config.get().limiter_max_attempts
+
+    for attempt in range(attempts):
+        for table_limiter in table_limiters:
+            table_limiter.acquire()
+
+        try:
+            response = operation(**kwargs)
+        except ClientError as e:
+            if not is_throttling_error(e):
+                raise e
+
+            for table_limiter in table_limiters:
+                table_limiter.throttled()
+
+            if attempt == attempts - 1:
+                log.error("Tables {} still throttling after {} attempts.".format(table_names, attempts))
+                raise e
+
+            delay = backoff(attempt)
+            left = remaining()
+            if left is not None and left <= delay:
+                log.error("Tables {} throttled, with no time left to retry.".format(table_names))
+                raise e
+
+            log.info("Tables {} throttled, retrying in {:.3f} seconds. Limiters: {}".format(table_names, delay, table_limiters))
+            time.sleep(delay)
+            continue
+
+        for table_limiter in table_limiters:
+            table_limiter.succeeded()
+
+        return response
+
+
+def get_table_names(kwargs):
+    if 'TableName' in kwargs:
+        return [kwargs['TableName']]
+
+    if 'RequestItems' in kwargs:
+        return sorted(kwargs['RequestItems'].keys())
+
+    if 'TransactItems' in kwargs:
+        table_names = set()
+        for item in kwargs['TransactItems']:
+            for action in item.values():
+                table_names.add(action['TableName'])
+        return sorted(table_names)
+
+    return []
+
+
+class LimitedClient:
+    def __init__(self, client, timeout_client=None, default_timeout=None):
+        self._client = client
+        self._timeout_client = timeout_client
+        self._default_timeout = default_timeout
+        self._timeout_clients = {}
+        self._lock = threading.Lock()
+
+    def client_for_call(self):
+        # Within a budgeted step, a call is made with a client whose read timeout ends at the step's deadline.
+        timeout = read_timeout(self._default_timeout) if self._timeout_client else None
+        if timeout is None:
+            return self._client
+
+        with self._lock:
+            if timeout not in self._timeout_clients:
+                self._timeout_clients[timeout] = self._timeout_client(timeout)
+
+            return self._timeout_clients[timeout]
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+
+        if not callable(attribute) or name in UNLIMITED_METHODS:
+            return attribute
+
+        def limited(**kwargs):
+            operation = getattr(self.client_for_call(), name)
+            table_names = get_table_names(kwargs)
+            if not table_names:
+                return operation(**kwargs)
+
+            return call(table_names, operation, **kwargs)
+
+        return limited
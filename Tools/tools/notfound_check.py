@@ -1,30 +1,58 @@
 import json
-import boto3
-import os
-from tools import common, logger
+from tools import aio, common, config, counter, deadline, lazy, logger
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
+# Each item included in an alert is marked, so an alert is only sent for new items, and the count at the last alert is
+# kept on the counter item.  The counter also keeps the number of items added, as of the last check that marked every
+# new item, so the table is only scanned when items have been added since.
+ALERTED_ATTRIBUTE = 'alertedAt'
+CHECKED_ATTRIBUTE = 'checkedAddedCount'
+DIGEST_ATTRIBUTES = ['productId', 'brand', 'details']
+DIGEST_MAX_ITEMS = 10
 
-dynamodb = boto3.client('dynamodb')
-sns = boto3.client('sns')
 
+dynamodb = common.lazy_client('dynamodb')
+sns = common.lazy_client('sns')
 
+
+@lazy.report_imports
 def handler(event, context):
     data = {}
+    budget = deadline.Budget(context)
+
+    settings = config.get('TOPIC_ARN', 'NOTFOUND_TABLE_NAME')
+    topic_arn = settings.topic_arn
+    table_name = settings.notfound_table
+
+    exact = counter.get_mode(event) == counter.EXACT
+    item_count = counter.get_or_recount(dynamodb, table_name, exact=exact)
+    added, checked = get_added_counts(table_name)
+    data['alert_sent'] = False
+
+    # Items are created by another service, so the new ones are found by reading the table.  Where the stream consumer
+    # does not count the items added, the table is read every time.
+    if added is not None and added == checked:
+        log.info("No items have been added since the last check.")
+        new_items, pending = [], []
+    else:
+        new_items = get_new_items(table_name)
+        log.info("{} of {} items are new since the last alert.".format(len(new_items), item_count))
 
-    topic_arn = common.get_env_variable(os.environ, 'TOPIC_ARN')
-    table_name = common.get_env_variable(os.environ, 'NOTFOUND_TABLE_NAME')
+        marked, pending = mark_alerted(table_name, [item['productId'] for item in new_items], budget)
+        alerted = [item for item in new_items if item['productId'] in marked]
 
-    item_count = get_item_count(table_name)
+        if alerted:
+            data['alert_sent'] = send_alert(table_name, topic_arn, item_count, alerted)
+            save_alerted_count(table_name, item_count)
 
-    if item_count > 0:
-        send_response = send_msg(topic_arn, item_count)
-        data['alert_sent'] = send_response
-    else:
-        data['alert_sent'] = False
+        # Items left unmarked are found again by the next run, so the count is only saved once every item is marked.
+        if added is not None and not pending:
+            save_checked_count(table_name, added)
 
+    data['new_items'] = len(new_items)
+    data['pending_items'] = len(pending)
     data['items'] = item_count
 
     response = common.create_response(200, json.dumps(data))
@@ -32,30 +60,150 @@ def handler(event, context):
     return response
 
 
-def get_item_count(table_name):
-    log.info("Scanning table: {}".format(table_name))
-
+def get_added_counts(table_name):
     try:
-        response = dynamodb.scan(
+        response = dynamodb.get_item(
             TableName=table_name,
+            Key=counter.counter_key(),
+            ProjectionExpression=counter.ADDED_ATTRIBUTE + ", " + CHECKED_ATTRIBUTE,
+            ConsistentRead=True
         )
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting alert state from table.")
+
+    item = response.get('Item', {})
+    added, checked = [int(item[name]['N']) if name in item else None for name in [counter.ADDED_ATTRIBUTE, CHECKED_ATTRIBUTE]]
+
+    return added, checked
+
+
+def get_new_items(table_name):
+    arguments = counter.exclude_counter()
+    arguments['FilterExpression'] += " AND attribute_not_exists(" + ALERTED_ATTRIBUTE + ")"
+
+    try:
+        items = [
+            {attribute: item[attribute]['S'] for attribute in DIGEST_ATTRIBUTES if attribute in item}
+            for item in common.paginate(dynamodb, 'scan', projection=DIGEST_ATTRIBUTES, TableName=table_name, **arguments)
+        ]
     except ClientError as e:
         log.error("Exception: {}.".format(e))
         raise Exception("Unexpected problem getting product from table.")
 
-    items = response['Items']
-    item_count = len(items)
-    log.info("Number of items in table: {}".format(item_count))
+    log.info("Number of new items in table: {}".format(len(items)))
+
+    return items
+
+
+def mark_item(table_name, id, values):
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key={'productId': {'S': id}},
+            UpdateExpression="SET " + ALERTED_ATTRIBUTE + " = :alertedAt",
+            ConditionExpression="attribute_exists(productId)",
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            log.info("Product {} was resolved before it was marked as alerted.".format(id))
+            return False
+
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem marking product as alerted.")
+
+    return True
+
+
+async def mark_items(table_name, ids, values):
+    return await aio.gather(*[aio.call(mark_item, table_name, id, values) for id in ids])
+
+
+def mark_alerted(table_name, ids, budget):
+    # The items are marked in rounds of concurrent updates, and no round is started once the budget is low.  A large
+    # backlog, e.g. on the first run, is then marked over several runs, and each run alerts only for the items it marked.
+    values = {':alertedAt': {'S': common.currentTimestamp()}}
+    size = config.get().aio_max_workers
+
+    marked = set()
+    pending = list(ids)
+    while pending and not budget.low():
+        ids, pending = pending[:size], pending[size:]
+        results = aio.run(mark_items, table_name, ids, values)
+        marked.update(id for id, result in zip(ids, results) if result)
+
+    if pending:
+        log.info("Budget too low to mark {} items as alerted.".format(len(pending)))
+
+    return marked, pending
+
+
+def unmark_alerted(table_name, ids):
+    for id in ids:
+        try:
+            dynamodb.update_item(TableName=table_name, Key={'productId': {'S': id}}, UpdateExpression="REMOVE " + ALERTED_ATTRIBUTE)
+        except ClientError as e:
+            log.error("Product {} could not be unmarked as alerted. Exception: {}".format(id, e))
+
+
+def send_alert(table_name, topic_arn, item_count, items):
+    # The items are marked before the alert is sent, so they are unmarked if it fails, to be alerted by the next run.
+    try:
+        return send_msg(topic_arn, item_count, items)
+    except Exception:
+        unmark_alerted(table_name, [item['productId'] for item in items])
+        raise
+
+
+def save_alerted_count(table_name, item_count):
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key=counter.counter_key(),
+            UpdateExpression="SET alertedCount = :count",
+            ConditionExpression="attribute_exists(productId)",
+            ExpressionAttributeValues={':count': {'N': str(item_count)}}
+        )
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem saving alert state to table.")
+
+    return True
+
+
+def save_checked_count(table_name, added):
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key=counter.counter_key(),
+            UpdateExpression="SET " + CHECKED_ATTRIBUTE + " = :added",
+            ConditionExpression="attribute_exists(productId)",
+            ExpressionAttributeValues={':added': {'N': str(added)}}
+        )
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem saving alert state to table.")
+
+    return True
+
+
+def build_digest(item_count, new_items):
+    lines = ['There are ' + str(item_count) + ' items in the NotFound table, ' + str(len(new_items)) + ' new:']
+    lines += ['- {} {}'.format(item.get('brand', ''), item.get('details', '')).rstrip() for item in new_items[:DIGEST_MAX_ITEMS]]
+
+    if len(new_items) > DIGEST_MAX_ITEMS:
+        lines.append('and ' + str(len(new_items) - DIGEST_MAX_ITEMS) + ' more.')
 
-    return item_count
+    return "\n".join(lines)
 
 
-def send_msg(topic, item_count):
-    log.info("Sending SMS message with item count: {}".format(item_count))
+def send_msg(topic, item_count, new_items):
+    log.info("Sending SMS message with item count: {}, new items: {}".format(item_count, len(new_items)))
     try:
         response = sns.publish(
             TopicArn=topic,
-            Message='There are ' + str(item_count) + ' items in the NotFound table.',
+            Message=build_digest(item_count, new_items),
             MessageAttributes={
                 'AWS.SNS.SMS.SenderID': {
                     'DataType': 'String',
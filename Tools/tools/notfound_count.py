@@ -1,19 +1,18 @@
 import json
-import os
-import boto3
-from tools import common, logger
-from botocore.exceptions import ClientError
+from tools import common, config, counter, lazy, logger
 
 log = logger.setup_logger()
 
-dynamodb = boto3.client('dynamodb')
+dynamodb = common.lazy_client('dynamodb')
 
 
+@lazy.report_imports
 def handler(event, context):
     try:
-        table_name = common.get_env_variable(os.environ, 'NOTFOUND_TABLE_NAME')
+        table_name = config.get('NOTFOUND_TABLE_NAME').notfound_table
 
-        count = get_item_count(table_name)
+        exact = counter.get_mode(event) == counter.EXACT
+        count = counter.get_or_recount(dynamodb, table_name, exact=exact)
 
         data = {"count": count}
 
@@ -24,21 +23,3 @@ def handler(event, context):
         return response
 
     return response
-
-
-def get_item_count(table_name):
-    log.info("Scanning table: {}".format(table_name))
-
-    try:
-        response = dynamodb.scan(
-            TableName=table_name,
-        )
-    except ClientError as e:
-        log.error("Exception: {}.".format(e))
-        raise Exception("Unexpected problem getting product from table.")
-
-    items = response['Items']
-    item_count = len(items)
-    log.info("Number of items in table: {}".format(item_count))
-
-    return item_count
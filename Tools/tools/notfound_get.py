@@ -1,29 +1,22 @@
 import json
-import os
-import boto3
-from tools import common, logger
+from tools import aio, common, config, enrichment, lazy, logger
 from tools.common_entities import Notfound
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
-dynamodb = boto3.client('dynamodb')
+dynamodb = common.lazy_client('dynamodb')
 
 
+@lazy.report_imports
 def handler(event, context):
     try:
-        notfound_table_name = common.get_env_variable(os.environ, 'NOTFOUND_TABLE_NAME')
-        lists_table_name = common.get_env_variable(os.environ, 'LISTS_TABLE_NAME')
+        settings = config.get('NOTFOUND_TABLE_NAME', 'LISTS_TABLE_NAME')
+        notfound_table_name = settings.notfound_table
+        lists_table_name = settings.lists_table
         id = common.get_path_id(event)
 
-        data = get_item(notfound_table_name, id)
-
-        data['creatorsName'] = get_user(lists_table_name, data['createdBy'])
-        data['listId'] = get_list_id(lists_table_name, id)
-        if data['listId']:
-            data['listTitle'] = get_list_title(lists_table_name, data['listId'], data['createdBy'])
-        else:
-            data['listTitle'] = 'Unknown'
+        data = aio.run(get_details, notfound_table_name, lists_table_name, id)
 
         response = common.create_response(200, json.dumps(data))
     except Exception as e:
@@ -34,74 +27,64 @@ def handler(event, context):
     return response
 
 
-def get_user(table_name, id):
-    key = {
-        'PK': {'S': 'USER#' + id},
-        'SK': {'S': 'USER#' + id}
-    }
-
-    try:
-        response = dynamodb.get_item(
-            TableName=table_name,
-            Key=key
-        )
-    except ClientError as e:
-        log.error("Exception: {}.".format(e))
-        raise Exception("Unexpected problem getting user from lists table.")
-
-    log.info("Get user response: {}".format(response))
+async def get_details(notfound_table_name, lists_table_name, id):
+    # The list and the enrichment cache generation are read while the item is read, so an item without a view still
+    # takes two round trips.  Items kept up to date by the notfound_view stream consumer already hold the list,
+    # creator's name and list title, and the list and generation are ignored.
+    data, list_id, generation = await aio.gather(
+        aio.call(get_item, notfound_table_name, id),
+        aio.call(get_list_id, lists_table_name, id),
+        aio.call(enrichment.get_generation, dynamodb, notfound_table_name)
+    )
+    if 'listTitle' in data:
+        return data
 
-    if 'Item' not in response:
-        return None
+    data['listId'] = list_id
 
-    return response['Item']['name']['S']
+    data['creatorsName'], data['listTitle'] = await aio.call(get_user_and_list_title, lists_table_name, data['createdBy'], list_id, generation)
 
+    return data
 
-def get_list_title(table_name, list_id, user_id):
-    key = {
-        'PK': {'S': 'LIST#' + list_id},
-        'SK': {'S': 'USER#' + user_id}
-    }
 
-    log.info("Querying for key in lists table: {}".format(key))
+def get_user_and_list_title(table_name, user_id, list_id, generation=None):
+    # Both are read with one BatchGetItem, unless they are already cached.
+    lists = [(list_id, user_id)] if list_id else []
 
     try:
-        response = dynamodb.get_item(
-            TableName=table_name,
-            Key=key
-        )
+        names, titles = enrichment.lookup(dynamodb, table_name, [user_id], lists, generation=generation)
     except ClientError as e:
         log.error("Exception: {}.".format(e))
-        raise Exception("Unexpected problem getting list from lists table.")
+        raise Exception("Unexpected problem getting user and list from lists table.")
 
-    log.info("Get list response: {}".format(response))
+    log.info("Creator's name: {}. List title: {}.".format(names, titles))
 
-    if 'Item' not in response:
-        return None
-
-    return response['Item']['title']['S']
+    return names[user_id], titles[list_id] if list_id else 'Unknown'
 
 
 def get_list_id(table_name, id):
     log.info("Querying for SK in lists table: PRODUCT#{}".format(id))
 
     try:
-        response = dynamodb.query(
+        items = list(common.paginate(
+            dynamodb,
+            'query',
+            max_items=1,
+            projection=['PK'],
             TableName=table_name,
             IndexName='SK-index',
             KeyConditionExpression="SK = :SK",
             ExpressionAttributeValues={":SK":  {'S': "PRODUCT#{}".format(id)}}
-        )
+        ))
     except ClientError as e:
         log.error("Exception: {}.".format(e))
         raise Exception("Unexpected problem querying for list in lists table.")
 
-    log.info("List Query response: {}".format(response))
+    log.info("List Query items: {}".format(items))
 
-    if len(response['Items']) == 0:
+    if len(items) == 0:
         return None
 
-    return response['Items'][0]['PK']['S'].split("#")[1]
+    return items[0]['PK']['S'].split("#")[1]
 
 
 def get_item(table_name, id):
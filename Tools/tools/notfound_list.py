@@ -1,24 +1,54 @@
 import json
-import os
-import boto3
-from tools import common, logger
+from tools import common, config, counter, enrichment, lazy, logger, urls
 from tools.common_entities import Notfound
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
-dynamodb = boto3.client('dynamodb')
+dynamodb = common.lazy_client('dynamodb')
 
+EXPORT = 'export'
+EXPORT_CURSOR_HEADER = 'X-Next-Cursor'
+CLUSTERS = 'clusters'
+CLUSTER_INDEX = 'canonicalUrl-index'
 
+
+@lazy.report_imports
 def handler(event, context):
     try:
-        table_name = common.get_env_variable(os.environ, 'NOTFOUND_TABLE_NAME')
-
-        response_items = get_items(table_name)
-        items = parse_items(response_items)
-        data = {"items": items}
-
-        response = common.create_response(200, json.dumps(data))
+        settings = config.get('NOTFOUND_TABLE_NAME')
+        table_name = settings.notfound_table
+
+        mode = common.get_query_parameter(event, 'mode')
+        if mode not in [None, EXPORT, CLUSTERS]:
+            raise Exception("List mode {} is not supported.".format(mode))
+
+        enrich = get_enrich(event)
+
+        if mode == EXPORT:
+            # The whole table, one item per line, a page at a time.  The cursor for the next page is in a header, as the
+            # body is not JSON.
+            segments = get_segments(event, settings.scan_max_segments)
+            body, next_cursor = export_items(table_name, segments, get_export_cursor(event), settings.export_page_items)
+            response = common.create_response(200, body, content_type='application/x-ndjson')
+            response['headers']['Access-Control-Expose-Headers'] = EXPORT_CURSOR_HEADER
+            if next_cursor:
+                response['headers'][EXPORT_CURSOR_HEADER] = next_cursor
+        elif mode == CLUSTERS:
+            # Items for the same product, by canonical url, so they can be resolved together.
+            data = {"clusters": get_clusters(table_name, common.get_query_parameter(event, 'url'))}
+            response = common.create_response(200, json.dumps(data))
+        else:
+            limit = get_limit(event, settings.list_default_limit, settings.list_max_limit)
+            start_key = get_start_key(event)
+
+            response_items, last_key = get_page(table_name, limit, start_key)
+            items = parse_items(response_items)
+            if enrich:
+                items = enrich_items(config.get('LISTS_TABLE_NAME').lists_table, table_name, items)
+            data = {"items": items, "nextCursor": common.encode_token(last_key) if last_key else None}
+
+            response = common.create_response(200, json.dumps(data))
     except Exception as e:
         log.error("Exception: {}".format(e))
         response = common.create_response(500, json.dumps({'error': str(e)}))
@@ -27,21 +57,155 @@ def handler(event, context):
     return response
 
 
-def get_items(table_name):
-    log.info("Scanning table: {}".format(table_name))
+def get_limit(event, default, maximum):
+    limit = common.get_query_parameter(event, 'limit')
+    if limit is None:
+        return default
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+
+    if limit < 1 or limit > maximum:
+        raise Exception("Limit must be a number between 1 and {}.".format(maximum))
+
+    return limit
+
+
+def get_start_key(event):
+    cursor = common.get_query_parameter(event, 'cursor')
+    if cursor is None:
+        return None
+
+    return common.decode_token(cursor, "Cursor")
+
+
+def get_enrich(event):
+    enrich = common.get_query_parameter(event, 'enrich')
+    if enrich not in [None, 'true', 'false']:
+        raise Exception("Enrich must be true or false.")
+
+    return enrich == 'true'
+
+
+def enrich_items(lists_table_name, notfound_table_name, items):
+    log.info("Enriching {} items from table {}.".format(len(items), lists_table_name))
 
     try:
-        response = dynamodb.scan(
-            TableName=table_name,
-        )
+        return enrichment.enrich(dynamodb, lists_table_name, items, notfound_table_name)
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting users and lists from lists table.")
+
+
+def get_segments(event, maximum):
+    segments = common.get_query_parameter(event, 'segments')
+    if segments is None:
+        return None
+
+    try:
+        segments = int(segments)
+    except ValueError:
+        segments = 0
+
+    if segments < 1 or segments > maximum:
+        raise Exception("Segments must be a number between 1 and {}.".format(maximum))
+
+    return segments
+
+
+def get_export_cursor(event):
+    cursor = get_start_key(event)
+    if cursor is None:
+        return None
+
+    if not isinstance(cursor, dict) or not isinstance(cursor.get('segments'), int) or not isinstance(cursor.get('keys'), list):
+        raise Exception("Cursor was not valid.")
+
+    return cursor
+
+
+def export_items(table_name, segments=None, cursor=None, max_items=None):
+    # Each call reads one page of every segment not yet finished, in parallel, so a response stays within the lambda
+    # timeout and response size whatever the size of the table.  The cursor holds the next key of each segment.
+    if cursor is not None:
+        segments = cursor['segments']
+        start_keys = {segment: key for segment, key in cursor['keys']}
+    else:
+        if segments is None:
+            segments = common.count_segments(dynamodb, table_name)
+        start_keys = {segment: None for segment in range(segments)}
+
+    limit = -(-max_items // len(start_keys)) if max_items else None
+    log.info("Exporting table {} with {} segments, {} still to read.".format(table_name, segments, len(start_keys)))
+
+    try:
+        pages = common.scan_segment_pages(dynamodb, table_name, segments, start_keys, limit=limit, **counter.exclude_counter())
     except ClientError as e:
         log.error("Exception: {}.".format(e))
         raise Exception("Unexpected problem getting product from table.")
 
-    items = response['Items']
-    log.info("Number of items in table: {}".format(len(items)))
+    lines = []
+    next_keys = []
+    for segment, page in pages.items():
+        lines.extend(json.dumps(Notfound(item).get_product()) + "\n" for item in page['Items'])
+        if 'LastEvaluatedKey' in page:
+            next_keys.append([segment, page['LastEvaluatedKey']])
 
-    return items
+    log.info("Exported {} items. {} segments have more pages.".format(len(lines), len(next_keys)))
+
+    next_cursor = common.encode_token({'segments': segments, 'keys': next_keys}) if next_keys else None
+
+    return "".join(lines), next_cursor
+
+
+def get_clusters(table_name, url=None):
+    # All clusters are read from the index, largest first, or just the cluster of the given url.
+    arguments = {'TableName': table_name, 'IndexName': CLUSTER_INDEX}
+    if url:
+        arguments['KeyConditionExpression'] = "canonicalUrl = :canonicalUrl"
+        arguments['ExpressionAttributeValues'] = {':canonicalUrl': {'S': urls.canonical_url(url)}}
+
+    try:
+        items = list(common.paginate(dynamodb, 'query' if url else 'scan', **arguments))
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting product from table.")
+
+    clusters = {}
+    for item in items:
+        clusters.setdefault(item['canonicalUrl']['S'], []).append(Notfound(item).get_product())
+
+    log.info("{} items in {} clusters.".format(len(items), len(clusters)))
+
+    return [
+        {"canonicalUrl": canonical_url, "productIds": [item['productId'] for item in cluster], "items": cluster}
+        for canonical_url, cluster in sorted(clusters.items(), key=lambda cluster: (-len(cluster[1]), cluster[0]))
+    ]
+
+
+def get_page(table_name, limit, start_key):
+    log.info("Scanning table {} for up to {} items from {}.".format(table_name, limit, start_key))
+
+    arguments = counter.exclude_counter()
+    if start_key:
+        arguments['ExclusiveStartKey'] = start_key
+
+    items = []
+    last_key = None
+
+    try:
+        for page in common.pages(dynamodb, 'scan', max_items=limit, TableName=table_name, **arguments):
+            items.extend(page['Items'])
+            last_key = page.get('LastEvaluatedKey')
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting product from table.")
+
+    log.info("Number of items in page: {}. Last key: {}".format(len(items), last_key))
+
+    return items, last_key
 
 
 def parse_items(response_items):
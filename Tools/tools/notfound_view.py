@@ -0,0 +1,200 @@
+# Keeps a denormalized view of each notfound item, the list it was added to, its creator's name and the list title,
+# on the notfound item itself.  It consumes the streams of the notfound and lists tables, so the view follows changes
+# to either, and notfound_get and notfound_list can return an item without joining it with the lists table.  It also
+# keeps the canonical url of each item, the key of the index that groups items for the same product, and the item
+# counter in step with the items created and deleted.
+import json
+import time
+from tools import common, config, counter, enrichment, lazy, logger, urls
+from botocore.exceptions import ClientError
+
+log = logger.setup_logger()
+
+dynamodb = common.lazy_client('dynamodb')
+
+VIEW_ATTRIBUTE = 'viewUpdatedAt'
+
+
+@lazy.report_imports
+def handler(event, context):
+    settings = config.get('NOTFOUND_TABLE_NAME', 'LISTS_TABLE_NAME')
+    notfound_table, lists_table = settings.notfound_table, settings.lists_table
+
+    # Invoked directly with {"rebuild": true}, the view of every item is rebuilt, e.g. after the consumer is deployed.
+    if event.get('rebuild'):
+        return common.create_response(200, json.dumps({'rebuilt': rebuild_views(notfound_table, lists_table)}))
+
+    for record in event['Records']:
+        try:
+            process_record(notfound_table, lists_table, record)
+        except Exception as e:
+            # The failed record and those after it are retried, so the view is never updated out of order.  Retries are
+            # capped by the event source, which then sends the record to the failure queue, so a record that can never
+            # be processed does not hold up the stream.
+            log.error("Exception processing record {}: {}".format(record['eventID'], e))
+            return {'batchItemFailures': [{'itemIdentifier': record['dynamodb']['SequenceNumber']}]}
+
+    return {'batchItemFailures': []}
+
+
+def get_table_name(record):
+    return record['eventSourceARN'].split(':table/')[1].split('/')[0]
+
+
+def get_value(image, name):
+    return image.get(name, {}).get('S')
+
+
+def process_record(notfound_table, lists_table, record):
+    table_name = get_table_name(record)
+    old = record['dynamodb'].get('OldImage', {})
+    new = record['dynamodb'].get('NewImage', {})
+    log.info("Processing {} record from table {}: {}".format(record['eventName'], table_name, record['dynamodb']['Keys']))
+
+    if table_name == notfound_table:
+        created = record['eventName'] == 'INSERT'
+        removed = record['eventName'] == 'REMOVE'
+        reassigned = record['eventName'] == 'MODIFY' and get_value(old, 'createdBy') != get_value(new, 'createdBy')
+
+        moved = record['eventName'] == 'MODIFY' and get_value(old, 'productUrl') != get_value(new, 'productUrl')
+
+        # The view's own updates leave the creator and url unchanged, so they are not processed again.
+        if record['dynamodb']['Keys']['productId']['S'] == counter.COUNTER_ID:
+            return
+        elif created or reassigned:
+            refresh_view(notfound_table, lists_table, get_value(new, 'productId'), get_value(new, 'createdBy'), get_value(new, 'productUrl'))
+        elif moved:
+            write_view(notfound_table, get_value(new, 'productId'), 'SET canonicalUrl = :canonicalUrl', canonical_url_value(get_value(new, 'productUrl')))
+
+        # Items are created by other services, so the counter follows the stream rather than the writers.  It is
+        # adjusted last, so a record that fails and is retried is only counted once.
+        if created or removed:
+            counter.adjust(dynamodb, notfound_table, 1 if created else -1)
+    elif table_name == lists_table:
+        image = new or old
+        pk, sk = get_value(image, 'PK'), get_value(image, 'SK')
+
+        if pk.startswith('LIST#') and sk.startswith('PRODUCT#') and get_value(image, 'type') == 'notfound':
+            refresh_product(notfound_table, lists_table, sk.split('#')[1])
+        elif pk.startswith('LIST#') and sk.startswith('USER#') and new and get_value(old, 'title') != get_value(new, 'title'):
+            update_views(notfound_table, 'listId', pk.split('#')[1], 'listTitle', get_value(new, 'title'))
+            enrichment.invalidate(dynamodb, notfound_table)
+        elif pk.startswith('USER#') and pk == sk and new and get_value(old, 'name') != get_value(new, 'name'):
+            update_views(notfound_table, 'createdBy', pk.split('#')[1], 'creatorsName', get_value(new, 'name'))
+            enrichment.invalidate(dynamodb, notfound_table)
+    else:
+        log.info("Ignoring record from table {}.".format(table_name))
+
+
+def attribute_value(value):
+    if value is None:
+        return {'NULL': True}
+
+    return {'S': value}
+
+
+def canonical_url_value(product_url):
+    return {':canonicalUrl': attribute_value(urls.canonical_url(product_url) if product_url else None)}
+
+
+def refresh_product(notfound_table, lists_table, product_id):
+    try:
+        response = dynamodb.get_item(
+            TableName=notfound_table,
+            Key={'productId': {'S': product_id}},
+            ProjectionExpression='createdBy, productUrl'
+        )
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting product from table.")
+
+    if 'Item' not in response:
+        log.info("Product {} is no longer in the notfound table.".format(product_id))
+        return False
+
+    return refresh_view(notfound_table, lists_table, product_id, get_value(response['Item'], 'createdBy'), get_value(response['Item'], 'productUrl'))
+
+
+def refresh_view(notfound_table, lists_table, product_id, user_id, product_url):
+    try:
+        list_id = enrichment.get_list_id(dynamodb, lists_table, product_id)
+        lists = [(list_id, user_id)] if list_id else []
+        names, titles = enrichment.lookup(dynamodb, lists_table, [user_id], lists, cached=False)
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting user and list from lists table.")
+
+    view = {
+        ':listId': attribute_value(list_id),
+        ':creatorsName': attribute_value(names[user_id]),
+        ':listTitle': attribute_value(titles[list_id] if list_id else 'Unknown'),
+        ':updatedAt': {'S': str(int(time.time()))}
+    }
+    view.update(canonical_url_value(product_url))
+
+    update = 'SET listId = :listId, creatorsName = :creatorsName, listTitle = :listTitle, canonicalUrl = :canonicalUrl, viewUpdatedAt = :updatedAt'
+
+    return write_view(notfound_table, product_id, update, view)
+
+
+def update_views(notfound_table, match_attribute, match_value, attribute, value):
+    # Renames are rare and the notfound table is small, so the items to update are found with a scan.
+    try:
+        items = list(common.paginate(
+            dynamodb,
+            'scan',
+            projection=['productId'],
+            TableName=notfound_table,
+            FilterExpression=match_attribute + " = :match AND attribute_exists(" + VIEW_ATTRIBUTE + ")",
+            ExpressionAttributeValues={':match': {'S': match_value}}
+        ))
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting product from table.")
+
+    log.info("Updating {} of {} views with {} {}.".format(attribute, len(items), match_attribute, match_value))
+
+    view = {':value': attribute_value(value), ':updatedAt': {'S': str(int(time.time()))}}
+    updated = 0
+    for item in items:
+        if write_view(notfound_table, item['productId']['S'], 'SET ' + attribute + ' = :value, viewUpdatedAt = :updatedAt', view):
+            updated += 1
+
+    return updated
+
+
+def write_view(notfound_table, product_id, update, values):
+    try:
+        dynamodb.update_item(
+            TableName=notfound_table,
+            Key={'productId': {'S': product_id}},
+            UpdateExpression=update,
+            ConditionExpression='attribute_exists(productId)',
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            log.info("Product {} was deleted before its view was updated.".format(product_id))
+            return False
+
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem updating view of product.")
+
+    return True
+
+
+def rebuild_views(notfound_table, lists_table):
+    try:
+        items = list(common.paginate(dynamodb, 'scan', projection=['productId', 'createdBy', 'productUrl'], TableName=notfound_table, **counter.exclude_counter()))
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting product from table.")
+
+    rebuilt = 0
+    for item in items:
+        if refresh_view(notfound_table, lists_table, item['productId']['S'], get_value(item, 'createdBy'), get_value(item, 'productUrl')):
+            rebuilt += 1
+
+    log.info("Rebuilt {} views.".format(rebuilt))
+
+    return rebuilt
@@ -0,0 +1,48 @@
+# Assumes the cross account roles and opens a dynamodb connection to each account while the lambda container is
+# initialising, so the first request to each environment does not pay for it.  Anything that is not warmed is set up on
+# first use, as before.
+from tools import common, config, fanout, logger
+
+log = logger.setup_logger()
+
+
+def warm_environment(table_name, account_ids, role_prefix, env):
+    dynamodb = common.get_dynamodb_client(table_name, account_ids, role_prefix, env)
+
+    # Any response means the connection is open, so errors from the call itself are not a failure.
+    try:
+        dynamodb.describe_endpoints()
+    except Exception as e:
+        log.info("Endpoint call failed after connecting ({}): {}".format(table_name, e))
+
+    return True
+
+
+def prewarm():
+    settings = config.get()
+
+    if not settings.function_name:
+        log.info("Not running in lambda, skipping pre-warming.")
+        return {}
+
+    missing = [name for name in config.PRODUCTS_VARIABLES if name in settings.missing]
+    if missing:
+        log.info("Skipping pre-warming, environment variables not set: {}.".format(missing))
+        return {}
+
+    def warm(environment):
+        return warm_environment(settings.product_tables[environment], settings.table_accounts, settings.cross_account_role, settings.environment)
+
+    outcomes = fanout.run(warm, list(settings.product_tables), timeout=settings.prewarm_timeout)
+    results = {environment: state for environment, (state, value) in outcomes.items()}
+    log.info("Pre-warming results: {}".format(results))
+
+    return results
+
+
+def at_init():
+    try:
+        return prewarm()
+    except Exception as e:
+        log.error("Pre-warming failed, clients will be created on first use. Exception: {}".format(e))
+        return {}
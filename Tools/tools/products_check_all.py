@@ -1,32 +1,26 @@
 import json
-import os
-from tools import common, logger
+from tools import common, config, fanout, lazy, logger, prewarm
 from tools.common_entities import Product
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
+# Cross account sessions are set up while the container initialises.
+prewarm.at_init()
 
+
+@lazy.report_imports
 def handler(event, context):
     try:
         id = common.get_path_id(event)
 
-        env = common.get_env_variable(os.environ, 'ENVIRONMENT')
-        role_prefix = common.get_env_variable(os.environ, 'CROSS_ACCOUNT_ROLE')
-        account_ids = {
-            common.get_env_variable(os.environ, 'PRODUCTS_TEST_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_TEST'),
-            common.get_env_variable(os.environ, 'PRODUCTS_STAGING_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_STAGING'),
-            common.get_env_variable(os.environ, 'PRODUCTS_PROD_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_PROD')
-        }
-
-        primary_env = common.get_env_variable(os.environ, 'PRIMARY_ENVIRONMENT')
-        update_envs = common.get_env_variable(os.environ, 'UPDATE_ENVIRONMENTS')
-
-        all_tables = {
-            'test': common.get_env_variable(os.environ, 'PRODUCTS_TEST_TABLE_NAME'),
-            'staging': common.get_env_variable(os.environ, 'PRODUCTS_STAGING_TABLE_NAME'),
-            'prod': common.get_env_variable(os.environ, 'PRODUCTS_PROD_TABLE_NAME')
-        }
+        settings = config.get(*config.CHECK_VARIABLES)
+        env = settings.environment
+        role_prefix = settings.cross_account_role
+        account_ids = settings.table_accounts
+        primary_env = settings.primary_environment
+        update_envs = settings.update_environments
+        all_tables = settings.product_tables
 
         # Step 1: Update tables object to only include  non-primary environments.
         primary_table, secondary_tables = split_tables(all_tables, primary_env, update_envs)
@@ -64,21 +58,30 @@ def check_environments(tables, account_ids, role_prefix, env, product):
 
     product.pop('priceCheckedDate', None)
 
-    for environment in tables:
-        table = tables[environment]
+    def check(environment):
         try:
-            env_product = get_item(table, account_ids, role_prefix, env, product['productId'])
-            env_product.pop('priceCheckedDate', None)
-
-            if env_product == product:
-                results[environment] = "IN SYNC"
-            else:
-                results[environment] = "NOT IN SYNC"
+            env_product = get_item(tables[environment], account_ids, role_prefix, env, product['productId'])
         except Exception as e:
             if str(e) == "No product exists with id: {}".format(product['productId']):
-                results[environment] = "DOES NOT EXIST"
-            else:
-                raise e
+                return "DOES NOT EXIST"
+            raise e
+
+        env_product.pop('priceCheckedDate', None)
+
+        if env_product == product:
+            return "IN SYNC"
+        else:
+            return "NOT IN SYNC"
+
+    outcomes = fanout.run(check, tables)
+
+    for environment, (state, value) in outcomes.items():
+        if state == fanout.SUCCEEDED:
+            results[environment] = value
+        elif state == fanout.TIMED_OUT:
+            results[environment] = "TIMED OUT"
+        else:
+            results[environment] = "ERROR"
 
     return results
 
@@ -1,27 +1,22 @@
 import json
-import os
 import time
 import uuid
-from tools import common, logger
+from tools import common, config, fanout, lazy, logger, prewarm
 
 log = logger.setup_logger()
 
+# Cross account sessions are set up while the container initialises.
+prewarm.at_init()
 
+
+@lazy.report_imports
 def handler(event, context):
     try:
-        env = common.get_env_variable(os.environ, 'ENVIRONMENT')
-        role_prefix = common.get_env_variable(os.environ, 'CROSS_ACCOUNT_ROLE')
-        account_ids = {
-            common.get_env_variable(os.environ, 'PRODUCTS_TEST_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_TEST'),
-            common.get_env_variable(os.environ, 'PRODUCTS_STAGING_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_STAGING'),
-            common.get_env_variable(os.environ, 'PRODUCTS_PROD_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_PROD')
-        }
-
-        tables = {
-            'test': common.get_env_variable(os.environ, 'PRODUCTS_TEST_TABLE_NAME'),
-            'staging': common.get_env_variable(os.environ, 'PRODUCTS_STAGING_TABLE_NAME'),
-            'prod': common.get_env_variable(os.environ, 'PRODUCTS_PROD_TABLE_NAME')
-        }
+        settings = config.get(*config.PRODUCTS_VARIABLES)
+        env = settings.environment
+        role_prefix = settings.cross_account_role
+        account_ids = settings.table_accounts
+        tables = settings.product_tables
 
         environments_to_update = common.check_environments(event)
 
@@ -52,13 +47,19 @@ def update_tables(tables, account_ids, role_prefix, env, environments_to_update,
     results = {}
     errors = False
 
-    for environment in environments_to_update:
-        table = tables[environment]
-        try:
-            put_product(table, account_ids, role_prefix, env, product)
+    def put(environment):
+        return put_product(tables[environment], account_ids, role_prefix, env, product)
+
+    outcomes = fanout.run(put, environments_to_update)
+
+    for environment, (state, value) in outcomes.items():
+        if state == fanout.SUCCEEDED:
             results[environment] = "Success:" + product['productId']['S']
-        except Exception as e:
-            results[environment] = "Failed:" + str(e)
+        elif state == fanout.TIMED_OUT:
+            results[environment] = "Timeout:Product was not created within the time limit, it may still be created ({}).".format(tables[environment])
+            errors = True
+        else:
+            results[environment] = "Failed:" + str(value)
             errors = True
 
     return results, errors
@@ -1,18 +1,17 @@
 import json
-import os
-import boto3
-from tools import common, logger
+from tools import common, config, lazy, logger
 from tools.common_entities import Product
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
-dynamodb = boto3.client('dynamodb')
+dynamodb = common.lazy_client('dynamodb')
 
 
+@lazy.report_imports
 def handler(event, context):
     try:
-        table_name = common.get_env_variable(os.environ, 'PRODUCTS_TABLE_NAME')
+        table_name = config.get('PRODUCTS_TABLE_NAME').products_table
         id = common.get_path_id(event)
 
         product = get_item(table_name, id)
@@ -1,27 +1,22 @@
 import json
-import os
 import time
-from tools import common, logger
+from tools import common, config, fanout, lazy, logger, prewarm
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
+# Cross account sessions are set up while the container initialises.
+prewarm.at_init()
 
+
+@lazy.report_imports
 def handler(event, context):
     try:
-        env = common.get_env_variable(os.environ, 'ENVIRONMENT')
-        role_prefix = common.get_env_variable(os.environ, 'CROSS_ACCOUNT_ROLE')
-        account_ids = {
-            common.get_env_variable(os.environ, 'PRODUCTS_TEST_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_TEST'),
-            common.get_env_variable(os.environ, 'PRODUCTS_STAGING_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_STAGING'),
-            common.get_env_variable(os.environ, 'PRODUCTS_PROD_TABLE_NAME'): common.get_env_variable(os.environ, 'ACCOUNT_ID_PROD')
-        }
-
-        tables = {
-            'test': common.get_env_variable(os.environ, 'PRODUCTS_TEST_TABLE_NAME'),
-            'staging': common.get_env_variable(os.environ, 'PRODUCTS_STAGING_TABLE_NAME'),
-            'prod': common.get_env_variable(os.environ, 'PRODUCTS_PROD_TABLE_NAME')
-        }
+        settings = config.get(*config.PRODUCTS_VARIABLES)
+        env = settings.environment
+        role_prefix = settings.cross_account_role
+        account_ids = settings.table_accounts
+        tables = settings.product_tables
 
         environments_to_update = common.check_environments(event)
 
@@ -47,18 +42,25 @@ def make_changes(tables, account_ids, role_prefix, env, environments_to_update,
     results = {}
     error = False
 
-    for env_to_update in environments_to_update:
-        try:
-            table = tables[env_to_update]
-            exists = get_product(table, account_ids, role_prefix, env, id)
-            if exists:
-                update_product(table, account_ids, role_prefix, env, id, product)
-                results[env_to_update] = "Updated: " + id
-            else:
-                put_product(table, account_ids, role_prefix, env, id, product)
-                results[env_to_update] = "Created: " + id
-        except Exception as e:
-            log.error("Exception: {}".format(e))
+    def change(env_to_update):
+        table = tables[env_to_update]
+        exists = get_product(table, account_ids, role_prefix, env, id)
+        if exists:
+            update_product(table, account_ids, role_prefix, env, id, product)
+            return "Updated: " + id
+        else:
+            put_product(table, account_ids, role_prefix, env, id, product)
+            return "Created: " + id
+
+    outcomes = fanout.run(change, environments_to_update)
+
+    for env_to_update, (state, value) in outcomes.items():
+        if state == fanout.SUCCEEDED:
+            results[env_to_update] = value
+        elif state == fanout.TIMED_OUT:
+            results[env_to_update] = "Timeout: Update did not complete within the time limit, it may still complete"
+            error = True
+        else:
             results[env_to_update] = "Failed: Unexpected error when updating"
             error = True
 
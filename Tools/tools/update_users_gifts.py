@@ -1,58 +1,117 @@
 import json
-import os
-import boto3
 import uuid
 import copy
-from tools import common, logger
+from tools import aio, common, config, deadline, lazy, logger
 from botocore.exceptions import ClientError
 
 log = logger.setup_logger()
 
-dynamodb = boto3.client('dynamodb')
+TRANSACTION_MAX_ACTIONS = 100
 
+dynamodb = common.lazy_client('dynamodb')
 
+
+@lazy.report_imports
 def handler(event, context):
-    try:
-        data = {}
+    data = {}
+    state = {}
+    budget = deadline.Budget(context)
 
-        products_table, notfound_table, lists_table = common.get_table_names(os.environ)
+    try:
+        settings = config.get(*config.TABLE_VARIABLES)
+        products_table, notfound_table, lists_table = settings.products_table, settings.notfound_table, settings.lists_table
 
         # Step 1: Get the product Id and details from event.
         notfound_id = common.get_path_id(event)
         new_product_details = common.new_product_details(event)
 
+        # A continuation token holds the steps completed by a previous invocation that ran out of time.
+        state = deadline.get_continuation(event) or {'id': notfound_id}
+        if state.get('id') != notfound_id:
+            raise Exception("Continuation token was not for product {}.".format(notfound_id))
+
         # Step 2: Create new product item in products table
-        # Get the existing product item from notfound table.  Then use the table to prepare object to be added to products table
-        notfound_product = notfound_table_get_product(notfound_table, notfound_id)
-        products_product = build_products_item(notfound_product, new_product_details)
-        products_id = products_table_create_product(products_table, products_product)
-        if products_id:
+        # Get the existing product item from notfound table, and the lists it was added to.  Then use the item to prepare object to be added to products table
+        # Every step is safe to run again, so a step that runs out of time is resumed from the token even if the attempt
+        # that ran out of time goes on to complete.
+        upgrade_state(state)
+        notfound_product, list_ids = budget.call('get notfound product', aio.run, get_product_and_list_ids, notfound_table, lists_table, notfound_id, state, repeatable=True)
+        if notfound_product is None:
+            # Only a resumed invocation gets here, when the attempt that ran out of time deleted the notfound item.
+            log.info("Notfound product {} was already deleted by the previous invocation.".format(notfound_id))
+            add_to_response_data(data, 'notfound-product-deleted', {'productId': {'S': notfound_id}}, [])
+            return common.create_response(200, json.dumps(data))
+
+        if 'productsId' in state:
+            products_product = None
+        else:
+            products_product = build_products_item(notfound_product, new_product_details)
+            # The id is chosen before the product is put, so a resumed invocation puts the same product again.
+            state.setdefault('newProductsId', str(uuid.uuid4()))
+        state['listIds'] = list_ids
+        pending_list_ids = [list_id for list_id in list_ids if list_id not in state.get('listsUpdated', [])]
+
+        # The list items are fetched while the new product is created.
+        products_id, list_query_results = budget.call('create product', aio.run, create_product_and_get_list_items, products_table, lists_table, products_product, state, pending_list_ids, repeatable=True)
+        if products_product is not None:
             products_product['productId'] = {'S': products_id}
             add_to_response_data(data, 'products-product-created', products_product, [])
+            state['productsId'] = state.pop('newProductsId')
+
+        # A resumed invocation finds no items in a list that the attempt which ran out of time already updated.
+        for list_id, list_items in zip(pending_list_ids, list_query_results):
+            if not list_items:
+                log.info("List {} was already updated by the previous invocation.".format(list_id))
+                state.setdefault('listsUpdated', []).append(list_id)
+        list_query_results = [list_items for list_items in list_query_results if list_items]
+        pending_list_ids = [list_id for list_id in pending_list_ids if list_id not in state.get('listsUpdated', [])]
+
+        # Step 3: Update lists with new product and reservation items; delete old notfound and reservation items.
+        # Step 4: Delete notfound item.
+        # The items of each list are replaced in transactions, so a list is never left half updated.  With one list to
+        # update the notfound item is deleted in its last transaction, otherwise once every list has been updated.
+        if pending_list_ids:
+            delete_notfound = len(pending_list_ids) == 1
+
+            # The transactions should not be split across invocations, so only start them with time to spare.
+            budget.require('update list items')
+            results = budget.call('update list items', aio.run, replace_lists_items, lists_table, notfound_table, notfound_id, list_query_results, products_id, delete_notfound, repeatable=True)
+
+            deleted, added = {"deleted": [], "failed": []}, {"added": [], "failed": []}
+            data['list-results'] = {}
+            for list_id, (deletes, adds, replaced) in zip(pending_list_ids, results):
+                for key in deleted:
+                    deleted[key].extend(deletes[key])
+                for key in added:
+                    added[key].extend(adds[key])
+                data['list-results'][list_id] = {'updated': replaced, 'deleted': len(deletes['deleted']), 'added': len(adds['added'])}
+                if replaced:
+                    state.setdefault('listsUpdated', []).append(list_id)
+
+            add_to_response_data(data, 'lists-notfound-deleted', deleted['deleted'], deleted['failed'])
+            add_to_response_data(data, 'lists-products-added', added['added'], added['failed'])
+
+            lists_updated = all(replaced for deletes, adds, replaced in results)
+            if delete_notfound or not lists_updated:
+                result = lists_updated
+            else:
+                result = budget.call('delete notfound product', notfound_table_delete_product, notfound_table, notfound_id, repeatable=True)
         else:
-            add_to_response_data(data, 'products-product-created', [], products_product)
+            # Every list was updated by a previous invocation, which ran out of time before the notfound item was deleted.
+            result = budget.call('delete notfound product', notfound_table_delete_product, notfound_table, notfound_id, repeatable=True)
 
-        # Step 3: Update list with new product and reservation items; delete old notfound and reservation items.
-        # Get the product and reservation list items. Prepare items to create and delete.
-        list_id = get_list_id(lists_table, notfound_id)
-        list_query_results = get_all_list_items(lists_table, list_id)
-        list_existing_items = find_product_and_reserved_items(list_query_results, notfound_id)
-        list_add_items = build_list_product_items(list_existing_items, products_id)
-
-        deletes = delete_notfound_items(lists_table, list_existing_items)
-        add_to_response_data(data, 'lists-notfound-deleted', deletes['deleted'], deletes['failed'])
-
-        adds = add_product_items(lists_table, list_add_items)
-        add_to_response_data(data, 'lists-products-added', adds['added'], adds['failed'])
-
-        # step 4: Delete notfound item.
-        result = notfound_table_delete_product(notfound_table, notfound_id)
         if result:
             add_to_response_data(data, 'notfound-product-deleted', notfound_product, [])
         else:
             add_to_response_data(data, 'notfound-product-deleted', [], notfound_product)
 
+            # The new product has been created, so another attempt resumes from the token rather than creating another.
+            pending = [list_id for list_id in state['listIds'] if list_id not in state.get('listsUpdated', [])]
+            return deadline.partial_response(data, 'update list items' if pending else 'delete notfound product', state)
+
         response = common.create_response(200, json.dumps(data))
+    except deadline.BudgetExceeded as e:
+        return deadline.partial_response(data, e.step, state)
     except Exception as e:
         log.error("Exception: {}".format(e))
         response = common.create_response(500, json.dumps({'error': str(e)}))
@@ -61,6 +120,69 @@ def handler(event, context):
     return response
 
 
+def upgrade_state(state):
+    # Tokens from before products in several lists could be resolved hold a single list.
+    if 'listId' in state:
+        list_id = state.pop('listId')
+        state['listIds'] = [list_id] if list_id else []
+    if state.pop('listUpdated', False):
+        state['listsUpdated'] = list(state['listIds'])
+
+
+async def get_product_and_list_ids(notfound_table, lists_table, notfound_id, state):
+    if 'listIds' in state:
+        list_ids = aio.value(state['listIds'])
+    else:
+        list_ids = aio.call(get_list_ids, lists_table, notfound_id)
+
+    # Once the lists are being updated, a resumed invocation may find that the notfound item has been deleted.
+    required = 'productsId' not in state
+
+    return await aio.gather(aio.call(notfound_table_get_product, notfound_table, notfound_id, required), list_ids)
+
+
+async def create_product_and_get_list_items(products_table, lists_table, products_product, state, list_ids):
+    if products_product is None:
+        products_id = aio.value(state['productsId'])
+    else:
+        products_id = aio.call(products_table_create_product, products_table, products_product, state['newProductsId'])
+
+    # The lists of a product that has been created may already have been updated by the previous invocation.
+    required = 'productsId' not in state
+
+    async def get_items(list_id):
+        return await get_product_list_items(lists_table, list_id, state['id'], required)
+
+    list_items = aio.gather_bounded(config.get().resolve_max_lists, get_items, list_ids)
+
+    return await aio.gather(products_id, list_items)
+
+
+async def get_product_list_items(lists_table, list_id, notfound_id, required=True):
+    # Only the product's own items are read from the list, the product item and its reservations, rather than the
+    # whole list.
+    product_item, reserved_items = await aio.gather(
+        aio.call(get_list_product_item, lists_table, list_id, notfound_id),
+        aio.call(get_list_reserved_items, lists_table, list_id, notfound_id)
+    )
+
+    items = ([product_item] if product_item else []) + reserved_items
+    if len(items) == 0 and required:
+        raise Exception("No query results for List ID {}.".format(list_id))
+
+    return items
+
+
+async def replace_lists_items(lists_table, notfound_table, notfound_id, lists_items, products_id, delete_notfound):
+    # The lists are updated concurrently, a few at a time, and the results returned in the same order as the lists.
+    async def replace(list_items):
+        existing_items = find_product_and_reserved_items(list_items, notfound_id)
+        add_items = build_list_product_items(existing_items, products_id)
+        return await aio.call(replace_list_items, lists_table, notfound_table, notfound_id, existing_items, add_items, delete_notfound)
+
+    return await aio.gather_bounded(config.get().resolve_max_lists, replace, lists_items)
+
+
 def add_to_response_data(data, key, succeeded_items, failed_items):
     if len(succeeded_items) > 0:
         data[key + '_succeeded'] = succeeded_items
@@ -69,6 +191,89 @@ def add_to_response_data(data, key, succeeded_items, failed_items):
         data[key + '_failed'] = failed_items
 
 
+def build_transactions(lists_table, notfound_table, notfound_id, existing_items, add_items, delete_notfound=True):
+    # Each old list item is deleted in the same transaction as its replacement is added, and the notfound item is
+    # deleted in the last transaction.  Most resolutions fit in one transaction.
+    transactions = []
+    actions, pairs = [], []
+
+    for existing_item, add_item in zip(existing_items, add_items):
+        if len(actions) + 2 > TRANSACTION_MAX_ACTIONS:
+            transactions.append((actions, pairs))
+            actions, pairs = [], []
+
+        actions += [delete_list_item_action(lists_table, existing_item), put_list_item_action(lists_table, add_item)]
+        pairs.append((existing_item, add_item))
+
+    if delete_notfound and len(actions) + 1 > TRANSACTION_MAX_ACTIONS:
+        transactions.append((actions, pairs))
+        actions, pairs = [], []
+
+    if delete_notfound:
+        actions.append(delete_notfound_action(notfound_table, notfound_id))
+    if actions:
+        transactions.append((actions, pairs))
+
+    return transactions
+
+
+def delete_list_item_action(lists_table, item):
+    return {'Delete': {
+        'TableName': lists_table,
+        'Key': {'PK': {'S': item['PK']['S']}, 'SK': {'S': item['SK']['S']}},
+        'ConditionExpression': "PK = :PK AND SK = :SK",
+        'ExpressionAttributeValues': {':PK': {'S': item['PK']['S']}, ':SK': {'S': item['SK']['S']}}
+    }}
+
+
+def put_list_item_action(lists_table, item):
+    return {'Put': {
+        'TableName': lists_table,
+        'Item': item,
+        'ConditionExpression': 'attribute_not_exists(PK)'
+    }}
+
+
+def delete_notfound_action(notfound_table, id):
+    return {'Delete': {
+        'TableName': notfound_table,
+        'Key': {'productId': {'S': id}},
+        'ConditionExpression': "productId = :productId",
+        'ExpressionAttributeValues': {':productId': {'S': id}}
+    }}
+
+
+def replace_list_items(lists_table, notfound_table, notfound_id, existing_items, add_items, delete_notfound=True):
+    deletes = {"deleted": [], "failed": []}
+    adds = {"added": [], "failed": []}
+    failed = False
+
+    transactions = build_transactions(lists_table, notfound_table, notfound_id, existing_items, add_items, delete_notfound)
+    log.info("Replacing {} list items in {} transactions.".format(len(existing_items), len(transactions)))
+
+    for actions, pairs in transactions:
+        # Once a transaction fails, the later ones are not attempted, so the notfound item is kept for another try.
+        committed = not failed and transact_write(actions)
+        failed = not committed
+        deleted, added = zip(*pairs) if pairs else ([], [])
+
+        deletes['deleted' if committed else 'failed'].extend(deleted)
+        adds['added' if committed else 'failed'].extend(added)
+
+    return deletes, adds, not failed
+
+
+def transact_write(actions):
+    try:
+        log.info("Writing transaction of {} actions.".format(len(actions)))
+        dynamodb.transact_write_items(TransactItems=actions)
+    except ClientError as e:
+        log.error("Transaction was not committed. Exception: {}. Reasons: {}".format(e, e.response.get('CancellationReasons')))
+        return False
+
+    return True
+
+
 def notfound_table_delete_product(notfound_table, id):
     key = {'productId': {'S': id}}
     condition = {':productId': {'S': id}}
@@ -89,7 +294,7 @@ def notfound_table_delete_product(notfound_table, id):
     return True
 
 
-def notfound_table_get_product(notfound_table, id):
+def notfound_table_get_product(notfound_table, id, required=True):
     key = {'productId': {'S': id}}
 
     try:
@@ -104,13 +309,16 @@ def notfound_table_get_product(notfound_table, id):
     log.info("Get product item response: {}".format(response))
 
     if 'Item' not in response:
+        if not required:
+            return None
         raise Exception("No product returned for the id {}.".format(id))
 
     return response['Item']
 
 
-def products_table_create_product(products_table, new_product):
-    id = str(uuid.uuid4())
+def products_table_create_product(products_table, new_product, id=None):
+    # Putting the product again with the same id leaves a single product.
+    id = id or str(uuid.uuid4())
     new_product['productId'] = {'S': id}
 
     try:
@@ -123,55 +331,6 @@ def products_table_create_product(products_table, new_product):
     return id
 
 
-def add_product_items(lists_table, items):
-    adds = {"added": [], "failed": []}
-
-    for item in items:
-        try:
-            log.info("Put product item: {}".format(item))
-            response = dynamodb.put_item(
-                TableName=lists_table,
-                Item=item,
-                ConditionExpression='attribute_not_exists(PK)'
-            )
-            log.info("Add response: {}".format(response))
-            adds['added'].append(item)
-        except ClientError as e:
-            if e.response['Error']['Code'] == "ConditionalCheckFailedException":
-                log.error("Product {} already exists in list {}.".format(item['SK']['S'], item['PK']['S']))
-            else:
-                log.error("Product could not be created: {}".format(e))
-
-            adds['failed'].append(item)
-
-    return adds
-
-
-def delete_notfound_items(lists_table, items):
-    deletes = {"deleted": [], "failed": []}
-
-    for item in items:
-        key = {'PK': {'S': item['PK']['S']}, 'SK': {'S': item['SK']['S']}}
-
-        condition = {':PK': {'S': item['PK']['S']}, ':SK': {'S': item['SK']['S']}}
-
-        try:
-            log.info("Deleting product item: {}".format(key))
-            response = dynamodb.delete_item(
-                TableName=lists_table,
-                Key=key,
-                ConditionExpression="PK = :PK AND SK = :SK",
-                ExpressionAttributeValues=condition
-            )
-            log.info("Delete response: {}".format(response))
-            deletes['deleted'].append(item)
-        except Exception as e:
-            log.error("Product could not be deleted. Exception: {}".format(e))
-            deletes['failed'].append(item)
-
-    return deletes
-
-
 def build_list_product_items(items, products_id):
     product_items = copy.deepcopy(items)
 
@@ -203,43 +362,64 @@ def find_product_and_reserved_items(items, notfound_id):
     return related_items
 
 
-def get_all_list_items(lists_table, list_id):
+def get_list_product_item(lists_table, list_id, notfound_id):
+    key = {'PK': {'S': "LIST#{}".format(list_id)}, 'SK': {'S': "PRODUCT#{}".format(notfound_id)}}
+
     try:
-        response = dynamodb.query(
-            TableName=lists_table,
-            KeyConditionExpression="PK = :PK",
-            ExpressionAttributeValues={":PK":  {'S': "LIST#{}".format(list_id)}}
-        )
-        log.info("Response: " + json.dumps(response))
+        response = dynamodb.get_item(TableName=lists_table, Key=key)
     except ClientError as e:
         raise Exception("Unexpected error when getting list item from table: " + json.dumps(e.response))
 
-    if len(response['Items']) == 0:
-        raise Exception("No query results for List ID {}.".format(list_id))
+    log.info("Product item: {}".format(response.get('Item')))
 
-    return response['Items']
+    return response.get('Item')
 
 
-def get_list_id(lists_table, notfound_id):
+def get_list_reserved_items(lists_table, list_id, notfound_id):
     try:
-        response = dynamodb.query(
+        items = list(common.paginate(
+            dynamodb,
+            'query',
+            TableName=lists_table,
+            KeyConditionExpression="PK = :PK AND begins_with(SK, :SK)",
+            ExpressionAttributeValues={
+                ":PK": {'S': "LIST#{}".format(list_id)},
+                ":SK": {'S': "RESERVATION#{}#".format(notfound_id)}
+            }
+        ))
+        log.info("Reserved items: " + json.dumps(items))
+    except ClientError as e:
+        raise Exception("Unexpected error when getting list item from table: " + json.dumps(e.response))
+
+    return items
+
+
+def get_list_ids(lists_table, notfound_id, required=True):
+    try:
+        items = list(common.paginate(
+            dynamodb,
+            'query',
+            projection=['PK'],
             TableName=lists_table,
             IndexName='SK-index',
             KeyConditionExpression="SK = :SK",
             ExpressionAttributeValues={":SK":  {'S': "PRODUCT#" + notfound_id}}
-        )
-        log.info("All items in query response. ({})".format(response['Items']))
+        ))
+        log.info("All items in query response. ({})".format(items))
     except Exception as e:
         log.info("Exception: " + str(e))
         raise Exception("Unexpected error when getting pending lists from table.")
 
-    if len(response['Items']) == 0:
+    if len(items) == 0 and required:
         raise Exception("No lists for product {} were returned.".format(notfound_id))
 
-    if len(response['Items']) > 1:
-        raise Exception("Too many list items for product {} returned [{}].".format(notfound_id, response['Items']))
+    list_ids = []
+    for item in items:
+        list_id = item['PK']['S'].split("#")[1]
+        if list_id not in list_ids:
+            list_ids.append(list_id)
 
-    return response['Items'][0]['PK']['S'].split("#")[1]
+    return list_ids
 
 
 def build_products_item(notfound_product, new_product_details):
@@ -0,0 +1,260 @@
+# Resolves many notfound items in one call, e.g. to clear a backlog.  Each item is resolved as update_users_gifts
+# would, but the reads and writes are shared across the set: the notfound items, list product items and new products
+# are read and written in batches, and identical new products are only created once.
+import json
+import uuid
+from tools import aio, common, config, deadline, lazy, logger, update_users_gifts
+from botocore.exceptions import ClientError
+
+log = logger.setup_logger()
+
+dynamodb = common.lazy_client('dynamodb')
+
+
+@lazy.report_imports
+def handler(event, context):
+    budget = deadline.Budget(context)
+
+    try:
+        settings = config.get(*config.TABLE_VARIABLES)
+        products_table, notfound_table, lists_table = settings.products_table, settings.notfound_table, settings.lists_table
+
+        # Step 1: Get the product Ids and details from event.
+        products_details = get_products_details(event)
+
+        results, stopped_at = resolve(products_table, notfound_table, lists_table, products_details, budget)
+
+        # The items not resolved in time are given again, with the productId in their result if they have one.
+        if stopped_at:
+            log.info("Returning partial result, stopped at step: {}.".format(stopped_at))
+            response = common.create_response(202, json.dumps({'results': results, 'partial': True, 'stoppedAt': stopped_at}))
+        else:
+            response = common.create_response(200, json.dumps({'results': results}))
+    except Exception as e:
+        log.error("Exception: {}".format(e))
+        response = common.create_response(500, json.dumps({'error': str(e)}))
+
+    return response
+
+
+def get_products_details(event):
+    try:
+        body = json.loads(event['body'])
+    except Exception:
+        raise Exception('API Event body did not exist.')
+
+    if not isinstance(body.get('products'), list) or len(body['products']) == 0:
+        raise Exception('API Event body did not contain the products.')
+
+    max_products = config.get().bulk_max_products
+    if len(body['products']) > max_products:
+        raise Exception("Too many products, at most {} can be resolved at once.".format(max_products))
+
+    products_details = {}
+    for product in body['products']:
+        if 'id' not in product:
+            raise Exception('API Event body did not contain the id of every product.')
+        if product['id'] in products_details:
+            raise Exception("Product {} was given more than once.".format(product['id']))
+        if 'productId' in product and not isinstance(product['productId'], str):
+            raise Exception("Product {} did not have a valid productId.".format(product['id']))
+
+        products_details[product['id']] = product
+
+    return products_details
+
+
+def resolve(products_table, notfound_table, lists_table, products_details, budget):
+    ids = list(products_details)
+    results = {id: {'resolved': False} for id in ids}
+
+    # An item given with the productId from the result of an earlier call is resumed with that product rather than
+    # creating another.  With its details the product is put again, as the earlier call may have stopped before it.
+    resumed = {id: product['productId'] for id, product in products_details.items() if 'productId' in product}
+
+    def fail(id, error):
+        log.info("Product {} was not resolved: {}".format(id, error))
+        results[id]['error'] = error
+
+    # Every step is safe to run again, so when one runs out of time the items still pending fail with the step, and
+    # keep their productId to be given again.
+    try:
+        # Step 2: Get the notfound items, and the lists each was added to, then check the new details of each.
+        notfound_products, list_ids, errors = budget.call('get notfound products', aio.run, get_products_and_list_ids, notfound_table, lists_table, ids, resumed, repeatable=True)
+        new_products = {}
+        for id in ids:
+            if id not in notfound_products and id in resumed:
+                # The earlier call stopped after the notfound item was deleted.
+                results[id].update({'resolved': True, 'productId': resumed[id]})
+            elif id not in notfound_products:
+                fail(id, "No product returned for the id {}.".format(id))
+            elif id in errors:
+                fail(id, errors[id])
+            elif id not in resumed or set(products_details[id]) - {'id', 'productId'}:
+                try:
+                    details = common.product_details(products_details[id])
+                    new_products[id] = update_users_gifts.build_products_item(notfound_products[id], details)
+                except Exception as e:
+                    fail(id, str(e))
+
+        # Step 3: Create the new products while the product's items are read from each list.  The ids are chosen first,
+        # so that they are in the results if the step runs out of time.
+        pending = [id for id in ids if 'error' not in results[id] and not results[id]['resolved']]
+        products_ids = assign_products_ids(new_products, resumed)
+        for id in pending:
+            results[id]['productId'] = products_ids[id]
+
+        pairs = [(list_id, id) for id in pending for list_id in list_ids[id]]
+        created, list_items = budget.call('create products', aio.run, create_products_and_get_list_items, products_table, lists_table, new_products, products_ids, pairs, repeatable=True)
+        for id in new_products:
+            if not created[id]:
+                if id not in resumed:
+                    del results[id]['productId']
+                fail(id, 'Product could not be created.')
+
+        # Step 4: Replace the items of each list, a few lists at a time.  A resumed item has no items left in the lists
+        # that were updated by the earlier call.
+        for list_id, id in pairs:
+            if not list_items[(list_id, id)] and id not in resumed:
+                fail(id, "No query results for List ID {}.".format(list_id))
+
+        pairs = [(list_id, id) for list_id, id in pairs if 'error' not in results[id] and list_items[(list_id, id)]]
+        if pairs:
+            budget.require('update lists')
+        replaced = budget.call('update lists', aio.run, replace_lists_items, lists_table, notfound_table, pairs, list_items, products_ids, repeatable=True)
+        for (list_id, id), (deletes, adds, updated) in zip(pairs, replaced):
+            results[id].setdefault('lists', {})[list_id] = {'updated': updated, 'deleted': len(deletes['deleted']), 'added': len(adds['added'])}
+            if not updated:
+                fail(id, "List {} could not be updated.".format(list_id))
+
+        # Step 5: Delete the notfound items whose lists were all updated.
+        resolved = [id for id in pending if 'error' not in results[id]]
+        deleted = budget.call('delete notfound products', notfound_table_delete_products, notfound_table, resolved, repeatable=True)
+        for id in resolved:
+            if id in deleted:
+                results[id]['resolved'] = True
+            else:
+                fail(id, 'Product could not be deleted.')
+    except deadline.BudgetExceeded as e:
+        for id in ids:
+            if not results[id]['resolved'] and 'error' not in results[id]:
+                fail(id, str(e))
+
+        return results, e.step
+
+    log.info("Resolved {} of {} products.".format(len([id for id in ids if results[id]['resolved']]), len(ids)))
+
+    return results, None
+
+
+async def get_products_and_list_ids(notfound_table, lists_table, ids, resumed):
+    async def get_list_ids(id):
+        # A product without lists only fails its own resolution, so the error is returned rather than raised.  The lists
+        # of a resumed product may all have been updated.
+        try:
+            return await aio.call(update_users_gifts.get_list_ids, lists_table, id, id not in resumed), None
+        except Exception as e:
+            return None, str(e)
+
+    notfound_products, results = await aio.gather(
+        aio.call(notfound_table_get_products, notfound_table, ids),
+        aio.gather(*[get_list_ids(id) for id in ids])
+    )
+
+    list_ids = {id: list_ids for id, (list_ids, error) in zip(ids, results) if error is None}
+    errors = {id: error for id, (list_ids, error) in zip(ids, results) if error is not None}
+
+    return notfound_products, list_ids, errors
+
+
+async def create_products_and_get_list_items(products_table, lists_table, new_products, products_ids, pairs):
+    return await aio.gather(
+        aio.call(products_table_create_products, products_table, new_products, products_ids),
+        get_list_items(lists_table, pairs)
+    )
+
+
+async def get_list_items(lists_table, pairs):
+    # The product items of every list are read in one batch, and the reservations with a query for each list.
+    async def get_reserved_items(list_id, id):
+        return await aio.call(update_users_gifts.get_list_reserved_items, lists_table, list_id, id)
+
+    keys = [{'PK': {'S': "LIST#" + list_id}, 'SK': {'S': "PRODUCT#" + id}} for list_id, id in pairs]
+    product_items, reserved_items = await aio.gather(
+        aio.call(common.batch_get_items, dynamodb, lists_table, keys),
+        aio.gather(*[get_reserved_items(list_id, id) for list_id, id in pairs])
+    )
+
+    items = {pair: list(reserved) for pair, reserved in zip(pairs, reserved_items)}
+    for item in product_items:
+        pair = (item['PK']['S'].split('#')[1], item['SK']['S'].split('#')[1])
+        items[pair].insert(0, item)
+
+    return items
+
+
+async def replace_lists_items(lists_table, notfound_table, pairs, list_items, products_ids):
+    # The notfound items are deleted together afterwards, so the transactions only replace the list items.
+    async def replace(pair):
+        list_id, id = pair
+        existing_items = update_users_gifts.find_product_and_reserved_items(list_items[pair], id)
+        add_items = update_users_gifts.build_list_product_items(existing_items, products_ids[id])
+        return await aio.call(update_users_gifts.replace_list_items, lists_table, notfound_table, id, existing_items, add_items, False)
+
+    return await aio.gather_bounded(config.get().resolve_max_lists, replace, pairs)
+
+
+def notfound_table_get_products(notfound_table, ids):
+    keys = [{'productId': {'S': id}} for id in ids]
+
+    try:
+        items = common.batch_get_items(dynamodb, notfound_table, keys)
+    except ClientError as e:
+        log.error("Exception: {}.".format(e))
+        raise Exception("Unexpected problem getting products from table.")
+
+    log.info("Got {} of {} products from notfound table.".format(len(items), len(ids)))
+
+    return {item['productId']['S']: item for item in items}
+
+
+def assign_products_ids(new_products, resumed):
+    # Items resolved with the same details share one new product, unless they are resumed with their own.
+    products_ids, assigned = dict(resumed), {}
+    for id, product in new_products.items():
+        if id not in resumed:
+            details = json.dumps(product, sort_keys=True)
+            products_ids[id] = assigned.setdefault(details, str(uuid.uuid4()))
+
+    return products_ids
+
+
+def products_table_create_products(products_table, new_products, products_ids):
+    # Putting a product again with the same id leaves a single product.
+    puts = {}
+    for id, product in new_products.items():
+        puts[products_ids[id]] = dict(product, productId={'S': products_ids[id]})
+
+    log.info("Creating {} products for {} notfound products.".format(len(puts), len(new_products)))
+
+    try:
+        unprocessed = common.batch_write_items(dynamodb, products_table, puts=list(puts.values()))
+    except ClientError as e:
+        log.error("Products could not be created: {}".format(e))
+        return {id: False for id in new_products}
+
+    failed = set(request['PutRequest']['Item']['productId']['S'] for request in unprocessed)
+
+    return {id: products_ids[id] not in failed for id in new_products}
+
+
+def notfound_table_delete_products(notfound_table, ids):
+    keys = [{'productId': {'S': id}} for id in ids]
+
+    try:
+        unprocessed = common.batch_write_items(dynamodb, notfound_table, deletes=keys)
+    except ClientError as e:
+        log.error("Products could not be deleted. Exception: {}".format(e))
+        return set()
+
+    return set(ids) - set(request['DeleteRequest']['Key']['productId']['S'] for request in unprocessed)
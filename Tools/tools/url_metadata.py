@@ -1,11 +1,13 @@
 import json
-import metadata_parser
 import re
 from urllib.parse import unquote
-from tools import common, logger
+from tools import common, lazy, logger
 
 log = logger.setup_logger()
 
+# metadata_parser brings in the html parsing libraries, so it is only loaded when a url is first queried.
+metadata_parser = lazy.Module('metadata_parser')
+
 
 attr_map = {
     'site_name': [
@@ -41,6 +43,7 @@ title_regex_rules = [
 ]
 
 
+@lazy.report_imports
 def handler(event, context):
     try:
         url = get_url(event)
@@ -0,0 +1,26 @@
+# Canonical form of product urls, so the same product added from different links can be grouped.  The scheme, host
+# prefixes such as www. and m., tracking parameters, fragments and trailing slashes are removed, and the remaining
+# query parameters are sorted.
+import re
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+HOST_PREFIXES = re.compile(r'^(www\d*|m|mobile|amp)\.')
+
+TRACKING_PARAMETERS = re.compile(r'^(utm_.*|gclid|gclsrc|dclid|fbclid|msclkid|mc_cid|mc_eid|_ga|_gl|ref|ref_|referrer|source|cmp|cm_mmc|affid|awc|sv1|sv_campaign_id|tag)$', re.IGNORECASE)
+
+
+def canonical_url(url):
+    parts = urlsplit(url.strip())
+
+    host = (parts.hostname or '').lower()
+    host = HOST_PREFIXES.sub('', host)
+
+    path = re.sub(r'/+', '/', parts.path).rstrip('/')
+
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAMETERS.match(name))
+
+    canonical = host + path
+    if query:
+        canonical += '?' + urlencode(query)
+
+    return canonical